@@ -42,6 +42,7 @@ def create_app():
     from .routes.config_optimize import config_opt_bp
     from .routes.arch_optimize import arch_opt_bp
     from .routes.slowlog import slowlog_bp
+    from .routes.jobs import jobs_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(health_bp, url_prefix='/api')
     app.register_blueprint(instances_bp, url_prefix='/api')
@@ -50,6 +51,7 @@ def create_app():
     app.register_blueprint(config_opt_bp, url_prefix='/api')
     app.register_blueprint(arch_opt_bp, url_prefix='/api')
     app.register_blueprint(slowlog_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
     
     # 注册WebSocket事件处理器
     from .routes import websocket
@@ -80,4 +82,12 @@ def create_app():
         from .services.monitor_service import monitor_service
         monitor_service.start_monitoring(app)
 
+        # 慢日志增量采集（mysql.slow_log -> 本地表）
+        from .services.slowlog_ingest_service import slowlog_ingester
+        slowlog_ingester.start(app)
+
+        # performance_schema 语句摘要周期快照（用于按时间窗口的 Top SQL 与退化检测）
+        from .services.digest_history_service import digest_history
+        digest_history.start(app)
+
     return app
\ No newline at end of file
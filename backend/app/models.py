@@ -37,7 +37,7 @@ class Instance(db.Model):
     username = db.Column(db.String(128), nullable=True)
     password = db.Column(db.String(255), nullable=True)  # 注意：仅用于演示，生产请勿明文存储
     db_type = db.Column(db.String(64), nullable=False, default='MySQL')
-    status = db.Column(db.String(32), nullable=False, default='running')  # running|error
+    status = db.Column(db.String(32), nullable=False, default='running')  # running|degraded|error
     cpu_usage = db.Column(db.Integer, nullable=False, default=0)
     memory_usage = db.Column(db.Integer, nullable=False, default=0)
     storage = db.Column(db.String(128), nullable=True)
@@ -47,7 +47,9 @@ class Instance(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
-        # 返回前端预期的驼峰命名字段
+        # 返回前端预期的驼峰命名字段；status/last_check_time 叠加监控写缓冲中尚未落库的最新值
+        from .services.status_buffer import status_buffer
+        status, last_check_time = status_buffer.overlay(self.id, self.status, self.last_check_time)
         return {
             'id': self.id,
             'instanceName': self.instance_name,
@@ -56,11 +58,11 @@ class Instance(db.Model):
             'username': self.username,
             'password': self.password,
             'dbType': self.db_type,
-            'status': self.status,
+            'status': status,
             'cpuUsage': self.cpu_usage,
             'memoryUsage': self.memory_usage,
             'storage': self.storage,
-            'lastCheckTime': self.last_check_time.strftime('%Y-%m-%d %H:%M:%S') if self.last_check_time else None,
+            'lastCheckTime': last_check_time.strftime('%Y-%m-%d %H:%M:%S') if last_check_time else None,
             'isMonitoring': self.is_monitoring,
             'connectionTimeout': self.connection_timeout,
             'createTime': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
@@ -81,9 +83,150 @@ class Instance(db.Model):
                 host=self.host,
                 port=self.port,
                 username=self.username or '',
-                password=self.password or ''
+                password=self.password or '',
+                instance_id=self.id,
+                timeout=self.connection_timeout
             )
             return is_ok
         except Exception as e:
             print(f"检查实例 {self.instance_name} 连接时出错: {e}")
-            return False
\ No newline at end of file
+            return False
+
+class RegistryVersion(db.Model):
+    """进程内缓存的共享版本号：写操作递增，各工作进程低频比对后决定是否重载"""
+    __tablename__ = 'registry_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SlowLogEntry(db.Model):
+    """从被监控实例 mysql.slow_log 增量采集到本地的慢查询记录（列表/筛选/分页均在本地完成）"""
+    __tablename__ = 'slow_log_entries'
+    __table_args__ = (
+        db.Index('ix_slow_log_entries_inst_time', 'instance_id', 'start_time', 'id'),
+        db.UniqueConstraint('instance_id', 'row_hash', name='uq_slow_log_entries_inst_hash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    user_host = db.Column(db.String(255), nullable=True)
+    db_name = db.Column('db', db.String(128), nullable=True)
+    query_time = db.Column(db.Float, nullable=False, default=0.0)  # 秒
+    lock_time = db.Column(db.Float, nullable=False, default=0.0)  # 秒
+    rows_sent = db.Column(db.Integer, nullable=False, default=0)
+    rows_examined = db.Column(db.Integer, nullable=False, default=0)
+    sql_text = db.Column(db.Text, nullable=True)
+    row_hash = db.Column(db.String(40), nullable=False)  # 去重用：同一时间戳上的记录可能被重复读取
+
+    def to_dict(self):
+        return {
+            'start_time': self.start_time.strftime('%Y-%m-%d %H:%M:%S') if self.start_time else '',
+            'user_host': self.user_host or '',
+            'db': self.db_name or '',
+            'query_time': self.query_time,
+            'lock_time': self.lock_time,
+            'rows_sent': self.rows_sent,
+            'rows_examined': self.rows_examined,
+            'sql_text': self.sql_text or '',
+        }
+
+
+class SlowLogWatermark(db.Model):
+    """每个实例的慢日志采集高水位（已采集到的最大 start_time）及最近一次采集状态"""
+    __tablename__ = 'slow_log_watermarks'
+
+    instance_id = db.Column(db.Integer, primary_key=True)
+    last_start_time = db.Column(db.DateTime, nullable=True)
+    slow_query_log = db.Column(db.String(16), nullable=True)
+    log_output = db.Column(db.String(64), nullable=True)
+    rows_ingested = db.Column(db.Integer, nullable=False, default=0)
+    last_ingest_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(500), nullable=True)
+
+    def to_dict(self):
+        return {
+            'last_start_time': self.last_start_time.strftime('%Y-%m-%d %H:%M:%S') if self.last_start_time else None,
+            'rows_ingested': self.rows_ingested,
+            'last_ingest_at': self.last_ingest_at.strftime('%Y-%m-%d %H:%M:%S') if self.last_ingest_at else None,
+            'last_error': self.last_error,
+        }
+
+
+class DigestSnapshot(db.Model):
+    """performance_schema 语句摘要计数器的一次快照（只记录时间与区间长度，增量见 DigestDelta）"""
+    __tablename__ = 'digest_snapshots'
+    __table_args__ = (
+        db.Index('ix_digest_snapshots_inst_time', 'instance_id', 'taken_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    server_time = db.Column(db.DateTime, nullable=False)  # 被监控实例的 NOW()，与 LAST_SEEN 同一时钟
+    interval_seconds = db.Column(db.Float, nullable=True)  # 距上一次快照的秒数，首次快照为空
+    digests = db.Column(db.Integer, nullable=False, default=0)  # 本区间有执行的摘要数
+
+
+class DigestDelta(db.Model):
+    """单个摘要在两次快照之间的计数增量（只保存有执行的摘要）"""
+    __tablename__ = 'digest_deltas'
+    __table_args__ = (
+        db.Index('ix_digest_deltas_inst_time', 'instance_id', 'taken_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_id = db.Column(db.Integer, nullable=False)
+    instance_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    schema_name = db.Column(db.String(64), nullable=False, default='')
+    digest = db.Column(db.String(64), nullable=False)
+    calls = db.Column(db.BigInteger, nullable=False, default=0)
+    timer_us = db.Column(db.BigInteger, nullable=False, default=0)  # 微秒
+    lock_us = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_examined = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_sent = db.Column(db.BigInteger, nullable=False, default=0)
+    no_index_used = db.Column(db.BigInteger, nullable=False, default=0)
+    errors = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class DigestBaseline(db.Model):
+    """每个摘要最近一次快照时的累计计数与摘要文本，作为下一次求增量的基线"""
+    __tablename__ = 'digest_baselines'
+
+    instance_id = db.Column(db.Integer, primary_key=True)
+    schema_name = db.Column(db.String(64), primary_key=True, default='')
+    digest = db.Column(db.String(64), primary_key=True)
+    digest_text = db.Column(db.Text, nullable=True)
+    calls = db.Column(db.BigInteger, nullable=False, default=0)
+    timer_us = db.Column(db.BigInteger, nullable=False, default=0)
+    lock_us = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_examined = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_sent = db.Column(db.BigInteger, nullable=False, default=0)
+    no_index_used = db.Column(db.BigInteger, nullable=False, default=0)
+    errors = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class SqlAnalysisCacheEntry(db.Model):
+    """SQL 分析结果缓存：按（实例、库、语句指纹）保存 LLM 的分析与重写，
+    schema_hash 为生成时涉及表的结构签名，结构变化后该条目失效"""
+    __tablename__ = 'sql_analysis_cache'
+    __table_args__ = (
+        db.UniqueConstraint('instance_id', 'db', 'fingerprint_id', name='uq_sql_analysis_cache_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    instance_id = db.Column(db.Integer, nullable=False)
+    db_name = db.Column('db', db.String(128), nullable=False, default='')
+    fingerprint_id = db.Column(db.String(16), nullable=False)
+    fingerprint = db.Column(db.Text, nullable=False)
+    schema_hash = db.Column(db.String(64), nullable=False)
+    sample_sql = db.Column(db.Text, nullable=False)  # 生成结果时的原始语句，用于换绑重写 SQL 中的字面量
+    analysis = db.Column(db.Text, nullable=True)
+    rewritten_sql = db.Column(db.Text, nullable=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_hit_at = db.Column(db.DateTime, nullable=True)
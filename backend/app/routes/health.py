@@ -1,8 +1,57 @@
 from flask import Blueprint, jsonify
+from ..services.connection_pool import mysql_pool
 
 health_bp = Blueprint('health', __name__)
 
 
 @health_bp.get('/health')
 def health():
-    return jsonify({'status': 'ok'}), 200
\ No newline at end of file
+    return jsonify({'status': 'ok'}), 200
+
+
+@health_bp.get('/health/pool')
+def pool_stats():
+    """MySQL 连接池统计（命中/未命中/等待/打开连接数）"""
+    return jsonify(mysql_pool.stats()), 200
+
+
+@health_bp.get('/health/monitor')
+def monitor_schedule():
+    """各实例当前探测间隔与下次到期时间"""
+    from ..services.monitor_service import monitor_service
+    return jsonify({'schedule': monitor_service.scheduler.snapshot()}), 200
+
+
+@health_bp.get('/health/llm')
+def llm_stats():
+    """共享 LLM 客户端统计（请求/重试/失败次数）"""
+    from ..services.llm_client import llm_client
+    return jsonify(llm_client.stats()), 200
+
+
+@health_bp.get('/health/schema-cache')
+def schema_cache_stats():
+    """表结构缓存统计（缓存的库/表数、命中率）"""
+    from ..services.schema_cache import schema_cache
+    return jsonify(schema_cache.stats()), 200
+
+
+@health_bp.get('/health/analysis-cache')
+def analysis_cache_stats():
+    """配置/架构分析结果缓存统计（条目数、命中率）"""
+    from ..services.analysis_cache import analysis_cache
+    return jsonify(analysis_cache.stats()), 200
+
+
+@health_bp.get('/health/column-profiles')
+def column_profile_stats():
+    """列统计画像缓存统计（缓存列数、命中率）"""
+    from ..services.column_profiler import column_profiler
+    return jsonify(column_profiler.stats()), 200
+
+
+@health_bp.get('/health/instance-snapshots')
+def instance_snapshot_stats():
+    """实例全局变量/状态快照缓存统计（TTL、缓存实例数）"""
+    from ..services.instance_snapshot import instance_snapshots
+    return jsonify(instance_snapshots.stats()), 200
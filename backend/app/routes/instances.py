@@ -3,6 +3,17 @@ from ..models import db, Instance
 from ..services.db_validator import db_validator
 from ..services.database_service import database_service
 from ..services.table_analyzer_service import table_analyzer_service
+from ..services.connection_pool import mysql_pool
+from ..services.status_buffer import status_buffer
+from ..services.instance_registry import instance_registry
+from ..services.timeseries_store import timeseries_store
+from ..services.probe_latency import probe_latency
+from ..services.slowlog_ingest_service import slowlog_ingester
+from ..services.digest_history_service import digest_history
+from ..services.instance_snapshot import instance_snapshots
+from ..services.sql_analysis_cache import sql_analysis_cache
+from ..services.schema_cache import schema_cache
+from ..services.column_profiler import column_profiler
 from .. import socketio
 import pymysql
 
@@ -10,7 +21,7 @@ instances_bp = Blueprint('instances', __name__)
 
 @instances_bp.get('/instances')
 def list_instances():
-    instances = Instance.query.all()
+    instances = instance_registry.all()
     return jsonify([i.to_dict() for i in instances]), 200
 
 @instances_bp.post('/instances')
@@ -55,7 +66,9 @@ def create_instance():
         )
         
         db.session.add(instance)
+        instance_registry.bump_version()
         db.session.commit()
+        instance_registry.mark_stale()
         
         # 推送实例创建事件
         socketio.emit('instance_created', {
@@ -114,6 +127,8 @@ def update_instance(instance_id):
             instance.db_type = data['type']
         if 'status' in data:
             instance.status = data['status']
+            # 手动设置的状态优先于监控缓冲中尚未落库的结果
+            status_buffer.discard(instance_id)
         if 'cpuUsage' in data:
             instance.cpu_usage = data['cpuUsage']
         if 'memoryUsage' in data:
@@ -121,7 +136,17 @@ def update_instance(instance_id):
         if 'storage' in data:
             instance.storage = data['storage']
         
+        instance_registry.bump_version()
         db.session.commit()
+        instance_registry.mark_stale()
+        
+        # 连接信息变更后丢弃旧连接，后续借用按新凭据建连
+        if will_check:
+            mysql_pool.invalidate(instance_id)
+            instance_snapshots.invalidate(instance_id)
+            schema_cache.invalidate(instance_id)
+            column_profiler.invalidate(instance_id)
+            db_validator.forget(instance_id)
         
         # 推送实例更新事件
         socketio.emit('instance_updated', {
@@ -148,7 +173,20 @@ def delete_instance(instance_id):
         instance_data = instance.to_dict()  # 在删除前保存数据
         
         db.session.delete(instance)
+        slowlog_ingester.drop_instance(instance_id)
+        digest_history.drop_instance(instance_id)
+        sql_analysis_cache.drop_instance(instance_id)
+        instance_registry.bump_version()
         db.session.commit()
+        instance_registry.mark_stale()
+        mysql_pool.invalidate(instance_id)
+        instance_snapshots.invalidate(instance_id)
+        schema_cache.invalidate(instance_id)
+        column_profiler.invalidate(instance_id)
+        status_buffer.discard(instance_id)
+        timeseries_store.drop_scope(f'instance:{instance_id}')
+        probe_latency.drop(instance_id)
+        db_validator.forget(instance_id)
         
         # 推送实例删除事件
         socketio.emit('instance_deleted', {
@@ -169,15 +207,48 @@ def delete_instance(instance_id):
 @instances_bp.get('/instances/<int:instance_id>')
 def get_instance(instance_id):
     try:
-        instance = Instance.query.get_or_404(instance_id)
+        instance = instance_registry.get(instance_id)
+        if not instance:
+            return jsonify({'error': '实例不存在'}), 404
         return jsonify(instance.to_dict()), 200
     except Exception as e:
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
+@instances_bp.get('/instances/<int:instance_id>/health/history')
+def instance_health_history(instance_id):
+    """实例可用率、探测耗时分位数与近期可用性历史（来自进程内时间序列）"""
+    try:
+        instance = instance_registry.get(instance_id)
+        if not instance:
+            return jsonify({'error': '实例不存在'}), 404
+        try:
+            window = int(request.args.get('window', 86400))
+            resolution = int(request.args.get('resolution', 0))
+        except ValueError:
+            return jsonify({'error': 'window/resolution 必须为整数'}), 400
+        scope = f'instance:{instance_id}'
+        return jsonify({
+            'instanceId': instance_id,
+            'window': window,
+            'availability': timeseries_store.availability(scope, window),
+            'probeLatencyMs': timeseries_store.percentiles(scope, 'probe_ms', window),
+            'up': timeseries_store.history(scope, 'up', window, resolution or None),
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+@instances_bp.get('/instances/<int:instance_id>/latency')
+def instance_probe_latency(instance_id):
+    """探测分阶段延迟直方图摘要（connect/auth/ping/total 的分位数）及 degraded 判定"""
+    instance = instance_registry.get(instance_id)
+    if not instance:
+        return jsonify({'error': '实例不存在'}), 404
+    return jsonify({'instanceId': instance_id, **probe_latency.summary(instance_id)}), 200
+
 @instances_bp.get('/instances/<int:instance_id>/databases')
 def list_instance_databases(instance_id):
     try:
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({'error': '实例不存在'}), 404
         
@@ -198,7 +269,7 @@ def list_instance_databases(instance_id):
 @instances_bp.get('/instances/<int:instance_id>/databases/<string:database>/tables')
 def list_tables(instance_id, database):
     try:
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({'error': '实例不存在'}), 404
         if (inst.db_type or '').strip() != 'MySQL':
@@ -206,30 +277,9 @@ def list_tables(instance_id, database):
         if not pymysql:
             return jsonify({'error': 'MySQL驱动不可用'}), 500
 
-        conn = pymysql.connect(
-            host=inst.host,
-            port=inst.port,
-            user=inst.username or '',
-            password=inst.password or '',
-            database=database,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SHOW TABLES")
-                rows = cursor.fetchall()
-                # 兼容不同返回键名（如 'Tables_in_dbname'）
-                tables = []
-                for row in rows:
-                    if isinstance(row, dict) and row:
-                        tables.append(list(row.values())[0])
-                    elif isinstance(row, (list, tuple)) and row:
-                        tables.append(row[0])
-                tables.sort()
-            return jsonify({'tables': tables}), 200
-        finally:
-            conn.close()
+        refresh = (request.args.get('refresh') or '').lower() in ('1', 'true', 'yes')
+        tables = schema_cache.list_tables(inst, database, refresh=refresh)
+        return jsonify({'tables': tables}), 200
     except Exception as e:
         return jsonify({'error': f'获取数据表失败: {e}'}), 500
 
@@ -237,13 +287,14 @@ def list_tables(instance_id, database):
 @instances_bp.get('/instances/<int:instance_id>/databases/<string:database>/tables/<string:table_name>/schema')
 def get_table_schema(instance_id, database, table_name):
     try:
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({'error': '实例不存在'}), 404
         if (inst.db_type or '').strip() != 'MySQL':
             return jsonify({'error': '仅支持MySQL实例'}), 400
 
-        ok, meta, msg = table_analyzer_service._get_table_metadata_only(inst, database, table_name)
+        refresh = (request.args.get('refresh') or '').lower() in ('1', 'true', 'yes')
+        ok, meta, msg = table_analyzer_service._get_table_metadata_only(inst, database, table_name, refresh=refresh)
         if not ok:
             # 返回详细错误信息
             return jsonify({'error': msg}), 400
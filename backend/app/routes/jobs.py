@@ -0,0 +1,44 @@
+from flask import Blueprint, current_app, jsonify, request
+from ..services.job_manager import job_manager, JobQueueFull
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def _async_requested() -> bool:
+    """?async=1（或 JSON 体中 async=true）时改为后台任务执行"""
+    if (request.args.get('async') or '').lower() in ('1', 'true', 'yes'):
+        return True
+    data = request.get_json(silent=True) or {}
+    return data.get('async') is True
+
+
+def run_or_submit(kind: str, instance_id, fn):
+    """fn(progress) 返回 (响应体, HTTP 状态码)。同步模式直接执行并返回结果；
+    异步模式提交到 job_manager，立即返回 202 与 jobId，进度经 Socket.IO 'job_progress' 推送"""
+    if not _async_requested():
+        body, code = fn(lambda stage, message=None: None)
+        return jsonify(body), code
+    try:
+        job = job_manager.submit(current_app._get_current_object(), kind, instance_id, fn)
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    return jsonify({'jobId': job.id, 'stage': 'queued'}), 202
+
+
+@jobs_bp.get('/jobs/<job_id>')
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@jobs_bp.get('/jobs')
+def list_jobs():
+    """最近的任务（不含结果体），可按 instanceId 过滤"""
+    instance_id = request.args.get('instanceId', type=int)
+    limit = max(1, min(request.args.get('limit', default=50, type=int), 200))
+    return jsonify({
+        'items': [j.to_dict(with_result=False) for j in job_manager.list(instance_id, limit)],
+        'stats': job_manager.stats(),
+    }), 200
@@ -2,12 +2,18 @@ from flask import Blueprint, Response, current_app, request, stream_with_context
 import json
 import time
 import logging
-from ..services.prometheus_service import prometheus_service
+from ..services.prometheus_service import prometheus_service, HISTORY_QUERIES
+from ..services.downsampling import DOWNSAMPLERS
+from ..services.timeseries_store import timeseries_store
+from ..services.metrics_broadcaster import metrics_broadcaster
 
 logger = logging.getLogger(__name__)
 
 metrics_bp = Blueprint('metrics', __name__)
 
+SSE_KEEPALIVE_SECONDS = 15
+HISTORY_MAX_POINTS = 5000
+
 
 def sse_format(event: str = None, data: dict = None, id: str = None) -> str:
     """Format message for SSE"""
@@ -36,46 +42,97 @@ def stream_metrics():
         'X-Accel-Buffering': 'no'
     }
 
+    app = current_app._get_current_object()
+
     def generate():
+        sub = None
         try:
             yield sse_format(event='open', data={'message': 'stream opened', 'service': service})
-            consecutive_errors = 0
-            max_consecutive_errors = 3
-            
+            # 同一 (service, interval) 的所有连接共享一个后台轮询器
+            sub = metrics_broadcaster.subscribe(service, interval, app=app)
+
             while True:
-                try:
-                    metrics = prometheus_service.get_all_metrics(service)
-                    yield sse_format(event='metrics', data=metrics, id=str(int(time.time())))
-                    consecutive_errors = 0  # 重置错误计数
-                except GeneratorExit:
-                    logger.info(f"SSE stream closed for service: {service}")
+                item = sub.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if item is None:
+                    if sub.dropped:
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                event, data, event_id = item
+                yield sse_format(event=event, data=data, id=event_id)
+                if sub.dropped and sub.queue.empty():
+                    yield sse_format(event='error', data={'message': '客户端消费过慢，连接已断开'})
                     break
-                except Exception as e:
-                    consecutive_errors += 1
-                    logger.error(f"Error getting metrics for {service}: {str(e)}")
-                    
-                    # 如果连续错误次数过多，发送错误事件并可能断开连接
-                    if consecutive_errors >= max_consecutive_errors:
-                        yield sse_format(event='error', data={
-                            'message': f'连续获取指标失败，服务可能不可用: {str(e)}',
-                            'consecutive_errors': consecutive_errors
-                        })
-                        logger.warning(f"Too many consecutive errors ({consecutive_errors}) for service {service}, continuing...")
-                    else:
-                        yield sse_format(event='error', data={
-                            'message': str(e),
-                            'consecutive_errors': consecutive_errors
-                        })
-                
-                time.sleep(interval)
+        except GeneratorExit:
+            logger.info(f"SSE stream closed for service: {service}")
         except Exception as e:
             logger.error(f"SSE stream initialization error: {str(e)}")
             yield sse_format(event='error', data={'message': f'流初始化失败: {str(e)}'})
+        finally:
+            if sub is not None:
+                metrics_broadcaster.unsubscribe(sub)
 
     return Response(stream_with_context(generate()), headers=headers)
 
 
+@metrics_bp.get('/metrics/history')
+def metrics_history():
+    """Historical metric chart data (range query + server-side downsampling)"""
+    service = request.args.get('service') or 'mysqld'
+    metric = request.args.get('metric') or 'cpu'
+    method = (request.args.get('method') or 'lttb').lower()
+    if metric not in HISTORY_QUERIES:
+        return jsonify({'error': f'不支持的指标: {metric}，可选: {", ".join(HISTORY_QUERIES)}'}), 400
+    if method != 'none' and method not in DOWNSAMPLERS:
+        return jsonify({'error': f'不支持的降采样方法: {method}，可选: none, {", ".join(DOWNSAMPLERS)}'}), 400
+
+    try:
+        now = int(time.time())
+        end = int(request.args.get('end') or now)
+        if request.args.get('start'):
+            start = int(request.args['start'])
+        else:
+            start = end - int(request.args.get('range', 3600))
+        points = min(max(int(request.args.get('points', 500)), 10), HISTORY_MAX_POINTS)
+        step = int(request.args['step']) if request.args.get('step') else None
+    except ValueError:
+        return jsonify({'error': 'start/end/range/points/step 必须为整数'}), 400
+    if end <= start:
+        return jsonify({'error': 'end 必须大于 start'}), 400
+
+    data = prometheus_service.get_metric_history(service, metric, start, end, points=points, method=method, step=step)
+    if data is None:
+        return jsonify({'error': '查询Prometheus历史数据失败'}), 502
+    return jsonify(data), 200
+
+
+@metrics_bp.get('/metrics/recent')
+def metrics_recent():
+    """Recent metric history kept in-process (survives page reloads, not restarts)"""
+    service = request.args.get('service') or 'mysqld'
+    metric = request.args.get('metric') or 'cpu'
+    if metric not in HISTORY_QUERIES:
+        return jsonify({'error': f'不支持的指标: {metric}，可选: {", ".join(HISTORY_QUERIES)}'}), 400
+    try:
+        window = int(request.args.get('window', 3600))
+        resolution = int(request.args.get('resolution', 0))
+    except ValueError:
+        return jsonify({'error': 'window/resolution 必须为整数'}), 400
+    scope = f'service:{service}'
+    return jsonify({
+        'service': service,
+        'metric': metric,
+        'window': window,
+        'summary': timeseries_store.summary(scope, metric, window),
+        'history': timeseries_store.history(scope, metric, window, resolution or None),
+    }), 200
+
+
 @metrics_bp.get('/metrics/health')
 def metrics_health():
     ok = prometheus_service.health_check()
-    return jsonify({'prometheus_ok': ok}), (200 if ok else 500)
\ No newline at end of file
+    return jsonify({
+        'prometheus_ok': ok,
+        'cache': prometheus_service.cache_stats(),
+        'stream': metrics_broadcaster.stats(),
+    }), (200 if ok else 500)
\ No newline at end of file
@@ -1,13 +1,15 @@
 from flask import Blueprint, jsonify, request
-from ..models import Instance
+from ..services.instance_registry import instance_registry
 from ..services.slowlog_service import slowlog_service
+from ..services.slowlog_ingest_service import slowlog_ingester
+from ..services.digest_history_service import digest_history
 
 slowlog_bp = Blueprint('slowlog', __name__)
 
 @slowlog_bp.post('/instances/<int:instance_id>/slowlog/analyze')
 def analyze_slowlog(instance_id: int):
     try:
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({'error': '实例不存在'}), 404
         body = {}
@@ -31,7 +33,7 @@ def analyze_slowlog(instance_id: int):
 @slowlog_bp.get('/instances/<int:instance_id>/slowlog')
 def list_slowlog(instance_id: int):
     try:
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({'error': '实例不存在'}), 404
         # 解析查询参数
@@ -44,7 +46,12 @@ def list_slowlog(instance_id: int):
             'start_time': request.args.get('start_time', default='') or '',
             'end_time': request.args.get('end_time', default='') or '',
         }
-        ok, data, msg = slowlog_service.list_from_table(inst, page=page, page_size=page_size, filters=filters)
+        cursor = request.args.get('cursor') or None
+        include_total = (request.args.get('include_total', default='1') or '1').lower() not in ('0', 'false', 'no')
+        ok, data, msg = slowlog_service.list_from_table(
+            inst, page=page, page_size=page_size, filters=filters,
+            cursor=cursor, include_total=include_total
+        )
         if not ok:
             # 若为 log_output 不支持，附带 overview 以便前端提示
             if data:
@@ -52,4 +59,140 @@ def list_slowlog(instance_id: int):
             return jsonify({'error': msg}), 400
         return jsonify(data), 200
     except Exception as e:
-        return jsonify({'error': f'慢日志列表失败: {e}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'慢日志列表失败: {e}'}), 500
+
+
+@slowlog_bp.get('/instances/<int:instance_id>/slowlog/digests')
+def slowlog_digests(instance_id: int):
+    """按 SQL 指纹聚合的慢查询统计（次数、总/平均/p95/最大耗时、扫描行比）"""
+    try:
+        inst = instance_registry.get(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        filters = {
+            'keyword': request.args.get('keyword', default='') or '',
+            'user_host': request.args.get('user_host', default='') or '',
+            'db': request.args.get('db', default='') or '',
+            'start_time': request.args.get('start_time', default='') or '',
+            'end_time': request.args.get('end_time', default='') or '',
+        }
+        top = max(1, min(200, int(request.args.get('top', 20))))
+        order_by = request.args.get('order_by', default='sum') or 'sum'
+        min_avg_ms = float(request.args.get('min_avg_ms', 0))
+        ok, data, msg = slowlog_service.digests(inst, filters=filters, top=top, order_by=order_by, min_avg_ms=min_avg_ms)
+        if not ok:
+            return jsonify({'error': msg}), 400
+        return jsonify(data), 200
+    except ValueError:
+        return jsonify({'error': 'top/min_avg_ms 参数格式错误'}), 400
+    except Exception as e:
+        return jsonify({'error': f'慢日志指纹统计失败: {e}'}), 500
+
+
+@slowlog_bp.post('/instances/<int:instance_id>/slowlog/file')
+def analyze_slowlog_file(instance_id: int):
+    """解析 FILE 格式慢日志：multipart 上传 file，或指定本机路径 path（需在 SLOWLOG_FILE_DIRS 内）。
+    传入上次返回的 next_offset/file_id 可增量续读"""
+    try:
+        inst = instance_registry.get(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        upload = request.files.get('file')
+        params = request.form if upload else (request.get_json(force=False, silent=True) or {})
+        offset = int(params.get('offset') or 0)
+        top = max(1, min(200, int(params.get('top') or 20)))
+        order_by = params.get('order_by') or 'sum'
+        min_avg_ms = float(params.get('min_avg_ms') or 0)
+        follow = str(params.get('follow', '')).lower() in ('1', 'true', 'yes')
+        if upload:
+            source = upload.stream
+        else:
+            try:
+                source = slowlog_service.resolve_local_file(params.get('path') or '')
+            except ValueError as e:
+                return jsonify({'error': f'无法读取慢日志文件: {e}'}), 400
+        ok, data, msg = slowlog_service.analyze_file(
+            source, offset=offset, file_id=params.get('file_id') or None, follow=follow,
+            top=top, order_by=order_by, min_avg_ms=min_avg_ms
+        )
+        if not ok:
+            return jsonify({'error': msg}), 400
+        return jsonify(data), 200
+    except ValueError:
+        return jsonify({'error': 'offset/top/min_avg_ms 参数格式错误'}), 400
+    except Exception as e:
+        return jsonify({'error': f'慢日志文件分析失败: {e}'}), 500
+
+
+@slowlog_bp.post('/instances/<int:instance_id>/slowlog/ingest')
+def ingest_slowlog(instance_id: int):
+    """立即从 mysql.slow_log 增量采集一次（后台采集器也会按周期执行）"""
+    try:
+        inst = instance_registry.get(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        if (inst.db_type or '').strip() != 'MySQL':
+            return jsonify({'error': '仅支持MySQL实例'}), 400
+        ok, added, msg = slowlog_ingester.ingest(inst)
+        if not ok:
+            return jsonify({'error': msg}), 400
+        return jsonify({'added': added, 'message': msg}), 200
+    except Exception as e:
+        return jsonify({'error': f'慢日志采集失败: {e}'}), 500
+
+
+@slowlog_bp.get('/instances/<int:instance_id>/digests/top')
+def digest_top(instance_id: int):
+    """最近 N 分钟的 Top SQL（基于 performance_schema 摘要快照的区间增量）"""
+    try:
+        inst = instance_registry.get(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        minutes = max(1.0, min(7 * 24 * 60.0, float(request.args.get('minutes', 60))))
+        top = max(1, min(200, int(request.args.get('top', 20))))
+        order_by = request.args.get('order_by', default='total') or 'total'
+        return jsonify(digest_history.top(instance_id, minutes=minutes, top=top, order_by=order_by)), 200
+    except ValueError:
+        return jsonify({'error': 'minutes/top 参数格式错误'}), 400
+    except Exception as e:
+        return jsonify({'error': f'获取Top SQL失败: {e}'}), 500
+
+
+@slowlog_bp.get('/instances/<int:instance_id>/digests/regressions')
+def digest_regressions(instance_id: int):
+    """最近 N 分钟相对之前基线窗口单次耗时变慢的 SQL 摘要"""
+    try:
+        inst = instance_registry.get(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        minutes = max(1.0, min(7 * 24 * 60.0, float(request.args.get('minutes', 60))))
+        baseline_minutes = max(1.0, min(30 * 24 * 60.0, float(request.args.get('baseline_minutes', 1440))))
+        ratio = max(1.0, float(request.args.get('ratio', 1.5)))
+        min_calls = max(1, int(request.args.get('min_calls', 10)))
+        top = max(1, min(200, int(request.args.get('top', 20))))
+        data = digest_history.regressions(
+            instance_id, minutes=minutes, baseline_minutes=baseline_minutes,
+            ratio=ratio, min_calls=min_calls, top=top
+        )
+        return jsonify(data), 200
+    except ValueError:
+        return jsonify({'error': 'minutes/baseline_minutes/ratio/min_calls/top 参数格式错误'}), 400
+    except Exception as e:
+        return jsonify({'error': f'获取SQL退化列表失败: {e}'}), 500
+
+
+@slowlog_bp.post('/instances/<int:instance_id>/digests/snapshot')
+def digest_snapshot(instance_id: int):
+    """立即做一次摘要快照（后台服务也会按周期执行）"""
+    try:
+        inst = instance_registry.get(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        if (inst.db_type or '').strip() != 'MySQL':
+            return jsonify({'error': '仅支持MySQL实例'}), 400
+        ok, changed, msg = digest_history.snapshot(inst)
+        if not ok:
+            return jsonify({'error': msg}), 400
+        return jsonify({'digests': changed, 'message': msg}), 200
+    except Exception as e:
+        return jsonify({'error': f'SQL摘要快照失败: {e}'}), 500
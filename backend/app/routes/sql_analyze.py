@@ -1,69 +1,123 @@
+import requests
 from flask import Blueprint, request, jsonify
-from ..models import Instance
+from ..services.instance_registry import instance_registry
 from ..services.deepseek_service import get_deepseek_client
+from ..services.llm_client import llm_client
 from ..services.table_analyzer_service import table_analyzer_service
-import pymysql
+from ..services.connection_pool import mysql_pool
+from ..services.sql_analysis_cache import sql_analysis_cache
+from .jobs import run_or_submit
 
 sql_analyze_bp = Blueprint('sql_analyze', __name__)
 
 @sql_analyze_bp.post('/sql/analyze')
 def analyze_sql():
-    """仅支持MySQL；执行轻量的表采样与EXPLAIN，连同SQL提交给LLM，返回分析与可选重写SQL。"""
+    """仅支持MySQL；执行轻量的表采样与EXPLAIN，连同SQL提交给LLM，返回分析与可选重写SQL。
+    ?async=1 时提交为后台任务，返回 jobId（结果见 GET /api/jobs/<id>）；
+    同结构语句在表结构未变时复用上次的分析结果，?refresh=1 跳过缓存。"""
     try:
         data = request.get_json() or {}
         instance_id = int(data.get('instanceId') or 0)
         sql = (data.get('sql') or '').strip()
         database = (data.get('database') or '').strip()
-        # 后端默认策略：不进行数据采样，启用执行计划分析
-        enable_sampling = False
-        enable_explain = True
-        sample_rows = None
 
         if not instance_id or not sql:
             return jsonify({"error": "缺少必要参数: instanceId, sql"}), 400
         if not database:
             return jsonify({"error": "缺少必要参数: database"}), 400
 
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({"error": "实例不存在"}), 404
         if (inst.db_type or '').strip() != 'MySQL':
             return jsonify({"error": "仅支持MySQL实例"}), 400
 
-        # 构造上下文：基础元信息 + （可选）表采样 + （可选）执行计划
-        context_summary = f"instance={inst.instance_name} ({inst.host}:{inst.port}), db_type={inst.db_type}, database={database}"
-        try:
-            extra_summary = table_analyzer_service.generate_context_summary(
-                sql=sql,
-                instance=inst,
-                database=database,
-                sample_rows=sample_rows,
-                enable_sampling=enable_sampling,
-                enable_explain=enable_explain,
-            )
-            if extra_summary:
-                context_summary = context_summary + "\n" + extra_summary
-        except Exception as e:
-            # 采样或EXPLAIN失败不致命，降级为基础元信息
-            context_summary = context_summary + f"\n上下文生成失败: {e}"
-
-        client = get_deepseek_client()
-        # 使用增强的分析接口，拿到分析文本与可能的重写SQL
-        llm_result = client.analyze_sql(sql, context_summary)
-
-        if not llm_result:
-            # 降级：维持与旧版兼容，仅尝试重写SQL
+        refresh = (request.args.get('refresh') or '').lower() in ('1', 'true', 'yes')
+        return run_or_submit('sql_analyze', inst.id, lambda progress: _analyze(inst, sql, database, refresh, progress))
+
+    except Exception as e:
+        return jsonify({"error": f"服务器错误: {e}"}), 500
+
+
+def _analyze(inst, sql: str, database: str, refresh: bool, progress):
+    # 结构签名获取失败时不使用缓存
+    schema_hash = table_analyzer_service.schema_signature(inst, database, table_analyzer_service.extract_table_names(sql))
+    if schema_hash and not refresh:
+        cached = sql_analysis_cache.lookup(inst.id, database, sql, schema_hash)
+        if cached:
+            return {
+                "analysis": cached["analysis"],
+                "rewrittenSql": cached["rewritten_sql"],
+                "cached": True,
+                "cachedAt": cached["cached_at"].isoformat(),
+            }, 200
+
+    # 后端默认策略：不进行数据采样，启用执行计划分析
+    enable_sampling = False
+    enable_explain = True
+    sample_rows = None
+
+    # 构造上下文：基础元信息 + （可选）表采样 + （可选）执行计划
+    context_summary = f"instance={inst.instance_name} ({inst.host}:{inst.port}), db_type={inst.db_type}, database={database}"
+    try:
+        extra_summary = table_analyzer_service.generate_context_summary(
+            sql=sql,
+            instance=inst,
+            database=database,
+            sample_rows=sample_rows,
+            enable_sampling=enable_sampling,
+            enable_explain=enable_explain,
+            progress=progress,
+        )
+        if extra_summary:
+            context_summary = context_summary + "\n" + extra_summary
+    except Exception as e:
+        # 采样或EXPLAIN失败不致命，降级为基础元信息
+        context_summary = context_summary + f"\n上下文生成失败: {e}"
+
+    # 结果缓存在上方已查过；未配置 LLM 时不会进入该阶段
+    if llm_client.configured():
+        progress('llm')
+    client = get_deepseek_client()
+    # 使用增强的分析接口，拿到分析文本与可能的重写SQL
+    llm_result = client.analyze_sql(sql, context_summary)
+
+    if not llm_result:
+        # 降级：维持与旧版兼容，仅尝试重写SQL。
+        # 网络/超时类失败时再请求一次只会再等一个超时，直接返回空结果
+        rewritten = None
+        if not isinstance(client.last_error, requests.RequestException):
             rewritten = client.rewrite_sql(sql, context_summary)
-            return jsonify({
-                "analysis": None,
-                "rewrittenSql": rewritten if rewritten else None
-            }), 200
+        return {
+            "analysis": None,
+            "rewrittenSql": rewritten if rewritten else None,
+            "cached": False,
+        }, 200
+
+    if schema_hash:
+        sql_analysis_cache.store(inst.id, database, sql, schema_hash, llm_result)
+    return {
+        "analysis": llm_result.get("analysis"),
+        "rewrittenSql": llm_result.get("rewritten_sql"),
+        "cached": False,
+    }, 200
+
+
+@sql_analyze_bp.get('/sql/analyze/cache')
+def analysis_cache_stats():
+    """SQL 分析结果缓存的条目数与命中率"""
+    try:
+        return jsonify(sql_analysis_cache.stats()), 200
+    except Exception as e:
+        return jsonify({"error": f"服务器错误: {e}"}), 500
 
-        return jsonify({
-            "analysis": llm_result.get("analysis"),
-            "rewrittenSql": llm_result.get("rewritten_sql")
-        }), 200
 
+@sql_analyze_bp.delete('/sql/analyze/cache')
+def clear_analysis_cache():
+    """清空 SQL 分析结果缓存，可用 ?instanceId= 只清理单个实例"""
+    try:
+        instance_id = request.args.get('instanceId', type=int)
+        return jsonify({"deleted": sql_analysis_cache.clear(instance_id)}), 200
     except Exception as e:
         return jsonify({"error": f"服务器错误: {e}"}), 500
 
@@ -89,24 +143,15 @@ def execute_sql():
             return jsonify({"error": "仅支持单条 SQL 语句执行，请去除多余的分号或多语句"}), 400
         sql = statements[0]
 
-        inst = Instance.query.get(instance_id)
+        inst = instance_registry.get(instance_id)
         if not inst:
             return jsonify({"error": "实例不存在"}), 404
         if (inst.db_type or '').strip() != 'MySQL':
             return jsonify({"error": "仅支持MySQL实例"}), 400
 
-        # 连接并执行
-        conn = pymysql.connect(
-            host=inst.host,
-            port=inst.port,
-            user=inst.username or '',
-            password=inst.password or '',
-            database=database,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            autocommit=False
-        )
-        try:
+        # 用户 SQL 可能改变会话状态（USE、SET SESSION、LOCK TABLES、临时表等），
+        # 使用不入池的独立连接执行，结束即关闭，不影响池中其他借用方
+        with mysql_pool.dedicated(inst, database=database, read_timeout=0) as conn:
             with conn.cursor() as cursor:
                 sql_lower = sql.lower().lstrip()
                 is_query = sql_lower.startswith('select') or sql_lower.startswith('show') \
@@ -136,7 +181,5 @@ def execute_sql():
                         'affectedRows': affected
                     }
                     return jsonify(result), 200
-        finally:
-            conn.close()
     except Exception as e:
         return jsonify({"error": f"执行SQL失败: {e}"}), 500
\ No newline at end of file
@@ -2,6 +2,7 @@ from flask_socketio import emit, disconnect
 from .. import socketio
 from ..services.monitor_service import monitor_service
 from ..models import Instance
+from ..services.instance_registry import instance_registry
 
 
 @socketio.on('connect')
@@ -39,7 +40,7 @@ def handle_request_update(data):
                 })
         else:
             # 获取所有实例的当前状态
-            instances = Instance.query.all()
+            instances = instance_registry.all()
             instances_data = [instance.to_dict() for instance in instances]
             emit('instances_status', {
                 'instances': instances_data,
@@ -65,7 +66,9 @@ def handle_toggle_monitoring(data):
         if instance:
             instance.is_monitoring = is_monitoring
             from .. import db
+            instance_registry.bump_version()
             db.session.commit()
+            instance_registry.mark_stale()
             
             emit('monitoring_toggled', {
                 'success': True,
@@ -91,7 +94,7 @@ def handle_toggle_monitoring(data):
 def handle_get_instances_status():
     """获取所有实例状态"""
     try:
-        instances = Instance.query.all()
+        instances = instance_registry.all()
         instances_data = [instance.to_dict() for instance in instances]
         
         emit('instances_status', {
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+
+def content_hash(*parts: Any) -> str:
+    """输入内容的稳定哈希：字典按键排序序列化，与键的插入顺序无关"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """分析结果缓存（TTL + LRU），键为 (命名空间, 输入内容哈希)。
+
+    配置/架构分析的输出（规则结果与 LLM 建议）只取决于采集到的输入，
+    输入不变时直接返回上次结果，不再调用 LLM。同一键的并发未命中只计算一次，
+    其余请求等待同一结果。
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv('ANALYSIS_CACHE_TTL', '3600'))
+        self.max_entries = int(os.getenv('ANALYSIS_CACHE_SIZE', '256'))
+        # LLM 已配置但调用失败（结果降级为规则）时的较短有效期，稍后可重试
+        self.failure_ttl = float(os.getenv('ANALYSIS_CACHE_FAILURE_TTL', '60'))
+        self._cache: 'OrderedDict[Tuple[str, str], Tuple[float, float, Any]]' = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Union[None, float, Callable[[Any], float]] = None,
+        refresh: bool = False
+    ) -> Tuple[Any, Optional[float]]:
+        """返回 (结果, 缓存年龄秒数)；重新计算时年龄为 None。
+        ttl 可为按结果决定有效期的函数（返回 0 表示不缓存）；refresh=True 时跳过缓存读取。"""
+        full_key = (namespace, key)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(full_key)
+            if cached and not refresh:
+                expires_at, created_at, value = cached
+                if expires_at > now:
+                    self._cache.move_to_end(full_key)
+                    self._hits += 1
+                    return value, round(now - created_at, 1)
+            future = self._inflight.get(full_key)
+            owner = future is None
+            if owner:
+                self._misses += 1
+                future = Future()
+                self._inflight[full_key] = future
+
+        if not owner:
+            return future.result(), None
+
+        value = None
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            future.set_exception(e)
+            raise
+        seconds = ttl(value) if callable(ttl) else (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._inflight.pop(full_key, None)
+            if seconds and seconds > 0:
+                done = time.monotonic()
+                self._cache[full_key] = (done + seconds, done, value)
+                self._cache.move_to_end(full_key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        future.set_result(value)
+        return value, None
+
+    def invalidate(self, namespace: Optional[str] = None):
+        with self._lock:
+            if namespace is None:
+                self._cache.clear()
+                return
+            for k in [k for k in self._cache if k[0] == namespace]:
+                del self._cache[k]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entries': len(self._cache),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else None,
+            }
+
+
+# 全局实例
+analysis_cache = AnalysisCache()
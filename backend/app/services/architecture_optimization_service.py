@@ -1,14 +1,9 @@
 import logging
 from typing import Any, Dict, List, Optional, Tuple
-import requests
 
-try:
-    import pymysql
-except ImportError:
-    pymysql = None
-
-from flask import current_app
 from ..models import Instance
+from .instance_snapshot import instance_snapshots
+from .llm_client import llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -21,135 +16,87 @@ def _on_off(v: Any) -> str:
 
 
 class ArchCollector:
-    """采集与复制/可靠性相关的全局配置与复制状态（只读查询）"""
-
-    def __init__(self, timeout: int = 10):
-        self.timeout = timeout
-
-    def _connect(self, inst: Instance):
-        if not pymysql:
-            raise RuntimeError("MySQL驱动不可用")
-        return pymysql.connect(
-            host=inst.host,
-            port=inst.port,
-            user=inst.username or '',
-            password=inst.password or '',
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            connect_timeout=self.timeout,
-            read_timeout=self.timeout,
-            write_timeout=self.timeout
-        )
-
-    def collect(self, inst: Instance) -> Tuple[bool, Dict[str, Any], str]:
-        """返回 (ok, data, msg)，其中 data 包含 overview 与 replication 两段。"""
+    """采集与复制/可靠性相关的全局配置与复制状态（只读，数据来自实例快照）"""
+
+    def collect(self, inst: Instance, max_age: Optional[float] = None) -> Tuple[bool, Dict[str, Any], str]:
+        """返回 (ok, data, msg)，其中 data 包含 overview 与 replication 两段。
+        变量与复制状态取自实例快照（max_age 秒内复用，默认见 INSTANCE_SNAPSHOT_TTL）。"""
         if not inst:
             return False, {}, "实例不存在"
         if (inst.db_type or '').strip() != 'MySQL':
             return False, {}, "仅支持MySQL实例"
         try:
-            conn = self._connect(inst)
-            try:
-                overview: Dict[str, Any] = {}
-                replication: Dict[str, Any] = {}
-                with conn.cursor() as cur:
-                    # 采集关键变量（全局）
-                    cur.execute("""
-                        SHOW GLOBAL VARIABLES WHERE Variable_name IN (
-                            'log_bin','binlog_format','gtid_mode','enforce_gtid_consistency',
-                            'read_only','super_read_only',
-                            'rpl_semi_sync_master_enabled','rpl_semi_sync_slave_enabled',
-                            'sync_binlog','innodb_flush_log_at_trx_commit',
-                            'binlog_row_image','binlog_expire_logs_seconds',
-                            'master_info_repository','relay_log_info_repository',
-                            'expire_logs_days'
-                        )
-                    """)
-                    rows = cur.fetchall()
-                    vars_map = {r['Variable_name']: r['Value'] for r in rows}
-
-                    overview = {
-                        'log_bin': _on_off(vars_map.get('log_bin')) if vars_map.get('log_bin') is not None else 'N/A',
-                        'binlog_format': (vars_map.get('binlog_format') or 'N/A'),
-                        'gtid_mode': (vars_map.get('gtid_mode') or 'N/A'),
-                        'enforce_gtid_consistency': (vars_map.get('enforce_gtid_consistency') or 'N/A'),
-                        'read_only': _on_off(vars_map.get('read_only')) if vars_map.get('read_only') is not None else 'N/A',
-                        'super_read_only': _on_off(vars_map.get('super_read_only')) if vars_map.get('super_read_only') is not None else 'N/A',
-                        'rpl_semi_sync_master_enabled': _on_off(vars_map.get('rpl_semi_sync_master_enabled')) if vars_map.get('rpl_semi_sync_master_enabled') is not None else 'N/A',
-                        'rpl_semi_sync_slave_enabled': _on_off(vars_map.get('rpl_semi_sync_slave_enabled')) if vars_map.get('rpl_semi_sync_slave_enabled') is not None else 'N/A',
-                        'sync_binlog': str(vars_map.get('sync_binlog') or 'N/A'),
-                        'innodb_flush_log_at_trx_commit': str(vars_map.get('innodb_flush_log_at_trx_commit') or 'N/A'),
-                        # 新增概览项
-                        'binlog_row_image': str(vars_map.get('binlog_row_image') or 'N/A'),
-                        'binlog_expire_logs_seconds': str(vars_map.get('binlog_expire_logs_seconds') or (vars_map.get('expire_logs_days') or 'N/A')),
-                        'master_info_repository': str(vars_map.get('master_info_repository') or 'N/A'),
-                        'relay_log_info_repository': str(vars_map.get('relay_log_info_repository') or 'N/A'),
-                    }
-
-                    # 复制状态：优先尝试 SHOW REPLICA STATUS（兼容新版本），失败或为空再尝试 SHOW SLAVE STATUS
-                    repl_row = None
-                    try:
-                        cur.execute("SHOW REPLICA STATUS")
-                        repl_row = cur.fetchone()
-                    except Exception:
-                        repl_row = None
-
-                    if not repl_row:
-                        try:
-                            cur.execute("SHOW SLAVE STATUS")
-                            repl_row = cur.fetchone()
-                        except Exception:
-                            repl_row = None
-
-                    if repl_row:
-                        # 兼容不同字段名
-                        seconds = repl_row.get('Seconds_Behind_Master')
-                        if seconds is None:
-                            seconds = repl_row.get('Seconds_Behind_Source')
-                        io_run = repl_row.get('Slave_IO_Running')
-                        if io_run is None:
-                            io_run = repl_row.get('Replica_IO_Running')
-                        sql_run = repl_row.get('Slave_SQL_Running')
-                        if sql_run is None:
-                            sql_run = repl_row.get('Replica_SQL_Running')
-                        sql_state = repl_row.get('Slave_SQL_Running_State')
-                        if sql_state is None:
-                            sql_state = repl_row.get('Replica_SQL_Running_State')
-                        executed_gtid = repl_row.get('Executed_Gtid_Set')
-                        retrieved_gtid = repl_row.get('Retrieved_Gtid_Set')
-                        # 错误字段兼容
-                        last_error = repl_row.get('Last_Error')
-                        if not last_error:
-                            # 组合 SQL/IO 错误
-                            se = repl_row.get('Last_SQL_Error')
-                            ie = repl_row.get('Last_IO_Error')
-                            last_error = se or ie
-
-                        def _yes_no(v: Any) -> str:
-                            s = str(v).strip().lower()
-                            if s in ('yes', 'on', 'running', 'connected', '1', 'true'):
-                                return 'Yes'
-                            return 'No'
-
-                        replication = {
-                            'is_replica': True,
-                            'seconds_behind': None if seconds is None else (int(seconds) if str(seconds).isdigit() else seconds),
-                            'io_thread': _yes_no(io_run) if io_run is not None else 'Unknown',
-                            'sql_thread': _yes_no(sql_run) if sql_run is not None else 'Unknown',
-                            # 新增复制细节
-                            'Replica_SQL_Running_State': sql_state or 'Unknown',
-                            'Executed_Gtid_Set': executed_gtid or '',
-                            'Retrieved_Gtid_Set': retrieved_gtid or '',
-                            'Last_Error': last_error or '',
-                        }
-                    else:
-                        replication = {
-                            'is_replica': False
-                        }
-
-                return True, {'overview': overview, 'replication': replication}, 'OK'
-            finally:
-                conn.close()
+            snap = instance_snapshots.get(inst, max_age=max_age)
+            vars_map = snap.variables
+
+            overview: Dict[str, Any] = {
+                'log_bin': _on_off(vars_map.get('log_bin')) if vars_map.get('log_bin') is not None else 'N/A',
+                'binlog_format': (vars_map.get('binlog_format') or 'N/A'),
+                'gtid_mode': (vars_map.get('gtid_mode') or 'N/A'),
+                'enforce_gtid_consistency': (vars_map.get('enforce_gtid_consistency') or 'N/A'),
+                'read_only': _on_off(vars_map.get('read_only')) if vars_map.get('read_only') is not None else 'N/A',
+                'super_read_only': _on_off(vars_map.get('super_read_only')) if vars_map.get('super_read_only') is not None else 'N/A',
+                'rpl_semi_sync_master_enabled': _on_off(vars_map.get('rpl_semi_sync_master_enabled')) if vars_map.get('rpl_semi_sync_master_enabled') is not None else 'N/A',
+                'rpl_semi_sync_slave_enabled': _on_off(vars_map.get('rpl_semi_sync_slave_enabled')) if vars_map.get('rpl_semi_sync_slave_enabled') is not None else 'N/A',
+                'sync_binlog': str(vars_map.get('sync_binlog') or 'N/A'),
+                'innodb_flush_log_at_trx_commit': str(vars_map.get('innodb_flush_log_at_trx_commit') or 'N/A'),
+                # 新增概览项
+                'binlog_row_image': str(vars_map.get('binlog_row_image') or 'N/A'),
+                'binlog_expire_logs_seconds': str(vars_map.get('binlog_expire_logs_seconds') or (vars_map.get('expire_logs_days') or 'N/A')),
+                'master_info_repository': str(vars_map.get('master_info_repository') or 'N/A'),
+                'relay_log_info_repository': str(vars_map.get('relay_log_info_repository') or 'N/A'),
+            }
+
+            # 复制状态：快照按版本执行 SHOW REPLICA STATUS 或 SHOW SLAVE STATUS，非从库为 None
+            repl_row = snap.replica
+
+            if repl_row:
+                # 兼容不同字段名
+                seconds = repl_row.get('Seconds_Behind_Master')
+                if seconds is None:
+                    seconds = repl_row.get('Seconds_Behind_Source')
+                io_run = repl_row.get('Slave_IO_Running')
+                if io_run is None:
+                    io_run = repl_row.get('Replica_IO_Running')
+                sql_run = repl_row.get('Slave_SQL_Running')
+                if sql_run is None:
+                    sql_run = repl_row.get('Replica_SQL_Running')
+                sql_state = repl_row.get('Slave_SQL_Running_State')
+                if sql_state is None:
+                    sql_state = repl_row.get('Replica_SQL_Running_State')
+                executed_gtid = repl_row.get('Executed_Gtid_Set')
+                retrieved_gtid = repl_row.get('Retrieved_Gtid_Set')
+                # 错误字段兼容
+                last_error = repl_row.get('Last_Error')
+                if not last_error:
+                    # 组合 SQL/IO 错误
+                    se = repl_row.get('Last_SQL_Error')
+                    ie = repl_row.get('Last_IO_Error')
+                    last_error = se or ie
+
+                def _yes_no(v: Any) -> str:
+                    s = str(v).strip().lower()
+                    if s in ('yes', 'on', 'running', 'connected', '1', 'true'):
+                        return 'Yes'
+                    return 'No'
+
+                replication: Dict[str, Any] = {
+                    'is_replica': True,
+                    'seconds_behind': None if seconds is None else (int(seconds) if str(seconds).isdigit() else seconds),
+                    'io_thread': _yes_no(io_run) if io_run is not None else 'Unknown',
+                    'sql_thread': _yes_no(sql_run) if sql_run is not None else 'Unknown',
+                    # 新增复制细节
+                    'Replica_SQL_Running_State': sql_state or 'Unknown',
+                    'Executed_Gtid_Set': executed_gtid or '',
+                    'Retrieved_Gtid_Set': retrieved_gtid or '',
+                    'Last_Error': last_error or '',
+                }
+            else:
+                replication = {
+                    'is_replica': False
+                }
+
+            return True, {'overview': overview, 'replication': replication}, 'OK'
         except Exception as e:
             logger.error(f"采集架构配置失败(实例ID={getattr(inst, 'id', None)}): {e}")
             return False, {}, f"连接或查询失败: {e}"
@@ -263,15 +210,32 @@ class ArchAdvisor:
         return risks
 
 
+def _seconds_behind_bucket(sec: Any) -> Any:
+    """复制延迟按规则阈值分档（<60s / <300s / >=300s）"""
+    if not isinstance(sec, int):
+        return sec
+    return 0 if sec < 60 else (1 if sec < 300 else 2)
+
+
+def arch_cache_inputs(overview: Dict[str, Any], replication: Dict[str, Any]) -> Dict[str, Any]:
+    """分析结果缓存键的输入：配置项原样保留；复制延迟分档，GTID 集合只保留规则用到的空/一致性判断"""
+    repl = dict(replication or {})
+    repl['seconds_behind'] = _seconds_behind_bucket(repl.get('seconds_behind'))
+    executed = repl.pop('Executed_Gtid_Set', '') or ''
+    retrieved = repl.pop('Retrieved_Gtid_Set', '') or ''
+    repl['gtid_executed_empty'] = not executed
+    repl['gtid_applied'] = executed == retrieved
+    return {'overview': overview, 'replication': repl}
+
+
+def llm_architecture_configured() -> bool:
+    return llm_client.configured()
+
+
 # 新增：基于 DeepSeek 的架构建议
 def llm_advise_architecture(overview: Dict[str, Any], replication: Dict[str, Any], risks: List[Dict[str, Any]], slowlog_summary: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     """调用 DeepSeek 生成更智能的架构建议。返回结构化JSON，失败返回 None。"""
-    cfg = current_app.config
-    api_key = cfg.get('DEEPSEEK_API_KEY')
-    base_url = cfg.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
-    model = cfg.get('DEEPSEEK_MODEL', 'deepseek-chat')
-    timeout = cfg.get('DEEPSEEK_TIMEOUT', 30)
-    if not cfg.get('LLM_ENABLED', True) or not api_key:
+    if not llm_client.configured():
         return None
 
     system_prompt = "你是资深MySQL架构与高可用专家。严格按要求只返回JSON。"
@@ -293,41 +257,19 @@ def llm_advise_architecture(overview: Dict[str, Any], replication: Dict[str, Any
     if slowlog_summary:
         user_prompt += f"\n【slowlog_summary】\n{slowlog_summary}\n"
 
-    url = f"{base_url}/v1/chat/completions"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        "temperature": 0.2,
-        "max_tokens": 1200,
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
-        resp.raise_for_status()
-        data = resp.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-        # 尝试严格JSON解析
-        import json as _json
-        try:
-            obj = _json.loads(content)
-        except Exception:
-            start = content.find('{'); end = content.rfind('}')
-            if start != -1 and end != -1 and end > start:
-                try:
-                    obj = _json.loads(content[start:end+1])
-                except Exception:
-                    return None
-            else:
-                return None
-        # 基本校验
-        if not isinstance(obj, dict):
-            return None
-        return obj
-    except Exception:
+        obj = llm_client.chat_json(messages, temperature=0.2, max_tokens=1200)
+    except Exception as e:
+        logger.info(f"LLM 架构建议失败: {e}")
+        return None
+    # 基本校验
+    if not isinstance(obj, dict):
         return None
+    return obj
 
 
 arch_collector = ArchCollector()
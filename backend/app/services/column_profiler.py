@@ -0,0 +1,394 @@
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .table_sampler import DIGEST_SUFFIX, table_sampler
+
+logger = logging.getLogger(__name__)
+
+# 抽样值只是长度占位符的类型，不做统计
+_SKIP_TYPES = {
+    'tinyblob', 'blob', 'mediumblob', 'longblob', 'geometry', 'point', 'linestring', 'polygon',
+    'multipoint', 'multilinestring', 'multipolygon', 'geometrycollection', 'geomcollection',
+}
+
+
+def _base_type(column_type: str) -> str:
+    return (column_type or '').lower().split('(')[0].split(' ')[0]
+
+
+def _quote(name: str) -> str:
+    return '`' + name.replace('`', '``') + '`'
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计：2^p 个寄存器（每个 1 字节），标准误差约 1.04/sqrt(2^p)"""
+
+    def __init__(self, p: int = 10):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        data = value if isinstance(value, bytes) else str(value).encode('utf-8', 'surrogatepass')
+        h = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # 小基数时用线性计数修正
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class MisraGries:
+    """Misra-Gries 频繁项：k 个计数器，每个值的计数至多少计 n/(k+1)；
+    label 为计数键（如摘要）对应的展示值，top 返回展示值"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counters: Dict[Any, int] = {}
+        self.labels: Dict[Any, Any] = {}
+
+    def add(self, value, label=None):
+        if value in self.counters:
+            self.counters[value] += 1
+        elif len(self.counters) < self.k:
+            self.counters[value] = 1
+            if label is not None:
+                self.labels[value] = label
+        else:
+            for key in list(self.counters):
+                self.counters[key] -= 1
+                if self.counters[key] == 0:
+                    del self.counters[key]
+                    self.labels.pop(key, None)
+
+    def top(self, n: int) -> List[Tuple[Any, int]]:
+        ranked = sorted(self.counters.items(), key=lambda kv: -kv[1])[:n]
+        return [(self.labels.get(key, key), count) for key, count in ranked]
+
+
+class _ColumnSketch:
+    __slots__ = ('hll', 'mg', 'rows', 'nulls', 'min', 'max')
+
+    def __init__(self, hll_precision: int, mg_counters: int):
+        self.hll = HyperLogLog(hll_precision)
+        self.mg = MisraGries(mg_counters)
+        self.rows = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, digest=None):
+        # value 可能是截断后的前缀；有整段值的摘要时按摘要去重计数，最值仍按前缀比较（前缀保序）
+        self.rows += 1
+        if value is None:
+            self.nulls += 1
+            return
+        if digest is None:
+            self.hll.add(value)
+            self.mg.add(value)
+        else:
+            self.hll.add(digest)
+            self.mg.add(digest, value)
+        try:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        except TypeError:
+            pass
+
+
+def _decode_histogram_value(value):
+    # 字符串类取值以 "base64:type254:<base64>" 形式存储
+    if isinstance(value, str) and value.startswith('base64:'):
+        try:
+            return base64.b64decode(value.split(':', 2)[2]).decode('utf-8', 'replace')
+        except Exception:
+            return value
+    return value
+
+
+def _extrapolate_ndv(distinct: int, sampled: int, population: int) -> int:
+    """由样本 NDV 外推全表 NDV：二分求解 D·(1 - e^(-n/D)) = d（左侧随 D 单调递增）"""
+    if distinct <= 0 or sampled <= 0 or population <= sampled:
+        return distinct
+
+    def expected(d_total: float) -> float:
+        return d_total * -math.expm1(-sampled / d_total)
+
+    if expected(population) <= distinct:
+        return population
+    low, high = float(distinct), float(population)
+    for _ in range(60):
+        mid = (low + high) / 2
+        if expected(mid) < distinct:
+            low = mid
+        else:
+            high = mid
+    return int(round(high))
+
+
+class ColumnProfiler:
+    """SQL 引用列的统计画像：NDV、NULL 比例、最小/最大值与高频值，供索引建议判断真实选择性。
+
+    一次流式遍历抽样（table_sampler，表大于扫描上限时用主键随机定位，行间相互独立），每列维护
+    HyperLogLog（NDV）、Misra-Gries（高频值）与 NULL/最值计数，内存与抽样行数无关。
+    文本抽样只传输截断前缀（用于展示与最值），NDV 与高频值按服务端计算的整段值 MD5 统计。
+    样本 NDV 按均匀分布的占位模型外推到全表：解 D·(1 - e^(-n/D)) = d（n 为样本非空行数，
+    d 为样本 NDV），上限为估计的全表非空行数；分布倾斜时偏低，属粗略估计。
+    更可靠的来源优先：MySQL 8 information_schema.COLUMN_STATISTICS 直方图（ANALYZE TABLE ...
+    UPDATE HISTOGRAM 生成）提供 NDV、NULL 比例、取值范围，singleton 直方图还提供精确频率；
+    单列索引的 Cardinality 作为 NDV；整列 BTREE 索引前导列的 MIN/MAX 由一次可走索引的聚合查询取得。
+    sample=False 时不读取表数据，只用直方图、索引基数与索引两端（仅元信息的分析路径）。
+    结果按（实例、库、表、列、类型）缓存 ttl 秒；未抽样的画像不满足要求抽样的调用。
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv('COLUMN_PROFILE_TTL', '1800'))
+        self.sample_rows = int(os.getenv('COLUMN_PROFILE_SAMPLE_ROWS', '1000'))
+        self.max_columns = int(os.getenv('COLUMN_PROFILE_MAX_COLUMNS', '8'))
+        self.top_k = int(os.getenv('COLUMN_PROFILE_TOP_K', '5'))
+        self.query_timeout_ms = int(os.getenv('COLUMN_PROFILE_QUERY_TIMEOUT_MS', '2000'))
+        self.hll_precision = 10
+        self._cache: Dict[Tuple[int, str, str, str, str], Tuple[float, bool, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def profile(self, conn, instance_id: int, database: str, meta: Dict[str, Any], columns: List[str],
+                estimated_rows: Optional[int] = None, sample: bool = True) -> Dict[str, Dict[str, Any]]:
+        """在调用方的连接上为 columns（与表实际列不区分大小写匹配）生成画像，返回 {列名: 画像}；
+        sample=False 时不抽样"""
+        wanted = {c.lower() for c in columns}
+        targets = [c for c in meta['columns']
+                   if c['name'].lower() in wanted and _base_type(c.get('type')) not in _SKIP_TYPES][:self.max_columns]
+        if not targets:
+            return {}
+
+        now = time.monotonic()
+        result: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        with self._lock:
+            for column in targets:
+                cached = self._cache.get(self._key(instance_id, database, meta, column))
+                if cached and now - cached[0] <= self.ttl and (cached[1] or not sample):
+                    result[column['name']] = cached[2]
+                else:
+                    missing.append(column)
+            self._hits += len(targets) - len(missing)
+            self._misses += len(missing)
+        if not missing:
+            return result
+
+        names = [c['name'] for c in missing]
+        histograms = self._histograms(conn, database, meta['table_name'], names)
+        index_bounds = self._index_bounds(conn, meta, names)
+        if sample:
+            sketches, sampled = self._scan(conn, meta, names, estimated_rows)
+        else:
+            sketches, sampled = {n: _ColumnSketch(self.hll_precision, self.top_k * 4) for n in names}, 0
+
+        for column in missing:
+            name = column['name']
+            profile = self._build(name, sketches[name], sampled, estimated_rows, histograms.get(name),
+                                  index_bounds.get(name), self._index_cardinality(meta, name))
+            result[name] = profile
+            with self._lock:
+                self._cache[self._key(instance_id, database, meta, column)] = (now, sample, profile)
+        return {c['name']: result[c['name']] for c in targets}
+
+    @staticmethod
+    def _key(instance_id: int, database: str, meta: Dict[str, Any], column: Dict[str, Any]):
+        return (instance_id, database, meta['table_name'], column['name'], column.get('type') or '')
+
+    def _scan(self, conn, meta: Dict[str, Any], names: List[str], estimated_rows: Optional[int]):
+        # 小表整表蓄水池抽样；大表用主键随机定位（块抽样的块内相关性会使 NDV 外推偏高）
+        if estimated_rows is not None and estimated_rows <= table_sampler.scan_limit:
+            strategy = 'reservoir'
+        else:
+            strategy = 'pk_seek'
+        sampled = table_sampler.sample(conn, meta, self.sample_rows, estimated_rows=estimated_rows,
+                                       columns=names, strategy=strategy, render=False, digest_text=True)
+        sketches = {n: _ColumnSketch(self.hll_precision, self.top_k * 4) for n in names}
+        for row in sampled['rows']:
+            for name, sketch in sketches.items():
+                sketch.add(row.get(name), row.get(name + DIGEST_SUFFIX))
+        return sketches, len(sampled['rows'])
+
+    @staticmethod
+    def _histograms(conn, database: str, table_name: str, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT COLUMN_NAME, HISTOGRAM
+                    FROM information_schema.COLUMN_STATISTICS
+                    WHERE SCHEMA_NAME=%s AND TABLE_NAME=%s AND COLUMN_NAME IN ({', '.join(['%s'] * len(names))})
+                    """,
+                    (database, table_name, *names)
+                )
+                rows = cursor.fetchall()
+        except Exception as e:
+            # MySQL 5.7 / MariaDB 没有该视图
+            logger.debug(f"读取列直方图失败: {e}")
+            return {}
+        histograms = {}
+        for row in rows:
+            histogram = row.get('HISTOGRAM')
+            if isinstance(histogram, (str, bytes)):
+                try:
+                    histogram = json.loads(histogram)
+                except ValueError:
+                    continue
+            if isinstance(histogram, dict) and histogram.get('buckets'):
+                histograms[row['COLUMN_NAME']] = histogram
+        return histograms
+
+    def _index_bounds(self, conn, meta: Dict[str, Any], names: List[str]) -> Dict[str, Tuple[Any, Any]]:
+        # 只对整列 BTREE 索引的前导列取 MIN/MAX，优化器直接读索引两端，不扫描；
+        # FULLTEXT/HASH/SPATIAL 与前缀索引无法这样回答，MIN/MAX 会退化为全表扫描
+        leading = set()
+        for idx in meta['indexes']:
+            if not idx.get('columns') or (idx.get('index_type') or '').upper() != 'BTREE':
+                continue
+            sub_parts = idx.get('sub_parts') or [None]
+            if sub_parts[0] is None:
+                leading.add(idx['columns'][0])
+        indexed = [n for n in names if n in leading]
+        if not indexed:
+            return {}
+        parts = []
+        for i, name in enumerate(indexed):
+            parts.append(f"MIN({_quote(name)}) AS min_{i}, MAX({_quote(name)}) AS max_{i}")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT /*+ MAX_EXECUTION_TIME({self.query_timeout_ms}) */ {', '.join(parts)} "
+                               f"FROM {_quote(meta['table_name'])}")
+                row = cursor.fetchone() or {}
+        except Exception as e:
+            logger.debug(f"读取索引列范围失败: {e}")
+            return {}
+        return {name: (row.get(f'min_{i}'), row.get(f'max_{i}')) for i, name in enumerate(indexed)}
+
+    @staticmethod
+    def _index_cardinality(meta: Dict[str, Any], name: str) -> Optional[int]:
+        for idx in meta['indexes']:
+            if idx.get('columns') == [name] and idx.get('cardinality') is not None:
+                return int(idx['cardinality'])
+        return None
+
+    def _build(self, name: str, sketch: _ColumnSketch, sampled: int, estimated_rows: Optional[int],
+               histogram: Optional[Dict[str, Any]], bounds: Optional[Tuple[Any, Any]],
+               cardinality: Optional[int]) -> Dict[str, Any]:
+        profile: Dict[str, Any] = {'column': name, 'sample_rows': sampled}
+
+        non_null = sketch.rows - sketch.nulls
+        distinct = min(sketch.hll.count(), non_null)
+        ndv, ndv_source = None, None
+        if non_null:
+            if estimated_rows and estimated_rows > sketch.rows:
+                # 全表非空行数按样本比例估计
+                ndv = _extrapolate_ndv(distinct, non_null, int(estimated_rows * non_null / sketch.rows))
+            else:
+                ndv = distinct
+            ndv_source = 'sample'
+        profile['null_frac'] = round(sketch.nulls / sketch.rows, 4) if sketch.rows else None
+        profile['null_source'] = 'sample' if sketch.rows else None
+        profile['min'], profile['max'] = sketch.min, sketch.max
+        profile['range_source'] = 'sample' if sketch.min is not None else None
+        # 只保留计数超过 Misra-Gries 误差上界 n/(k+1) 的值，排除近唯一列中的偶然值
+        floor = sketch.rows / (sketch.mg.k + 1)
+        profile['top'] = [{'value': v, 'freq': round(c / sketch.rows, 4)}
+                          for v, c in sketch.mg.top(self.top_k) if c > floor]
+        profile['top_source'] = 'sample' if profile['top'] else None
+
+        if cardinality:
+            ndv, ndv_source = cardinality, 'index'
+        if bounds is not None and bounds[0] is not None:
+            profile['min'], profile['max'] = bounds
+            profile['range_source'] = 'index'
+
+        if histogram:
+            buckets = histogram['buckets']
+            singleton = histogram.get('histogram-type') == 'singleton'
+            if singleton:
+                ndv = len(buckets)
+                previous = 0.0
+                frequencies = []
+                for value, cumulative in buckets:
+                    frequencies.append({'value': _decode_histogram_value(value), 'freq': round(cumulative - previous, 4)})
+                    previous = cumulative
+                profile['top'] = sorted(frequencies, key=lambda f: -f['freq'])[:self.top_k]
+                profile['top_source'] = 'histogram'
+                low, high = buckets[0][0], buckets[-1][0]
+            else:
+                ndv = sum(int(b[3]) for b in buckets if len(b) >= 4)
+                low, high = buckets[0][0], buckets[-1][1]
+            ndv_source = 'histogram'
+            if profile['range_source'] != 'index':
+                profile['min'], profile['max'] = _decode_histogram_value(low), _decode_histogram_value(high)
+                profile['range_source'] = 'histogram'
+            if histogram.get('null-values') is not None:
+                profile['null_frac'] = round(float(histogram['null-values']), 4)
+                profile['null_source'] = 'histogram'
+
+        profile['ndv'] = ndv
+        profile['ndv_source'] = ndv_source
+        # 等值条件平均命中的行比例
+        profile['selectivity'] = round(1 / ndv, 6) if ndv else None
+        for field in ('min', 'max'):
+            if profile[field] is not None:
+                profile[field] = table_sampler.render_value(profile[field])
+        for item in profile['top']:
+            item['value'] = table_sampler.render_value(item['value'])
+        return profile
+
+    def invalidate(self, instance_id: int):
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == instance_id]:
+                del self._cache[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'columns': len(self._cache),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else None,
+            }
+
+
+def describe_profile(profile: Dict[str, Any]) -> str:
+    """供上下文摘要使用的单行描述"""
+    parts = [profile['column'] + ':']
+    if profile.get('ndv') is not None:
+        parts.append(f"NDV≈{profile['ndv']:,}({profile['ndv_source']})")
+    if profile.get('null_frac') is not None:
+        parts.append(f"NULL {profile['null_frac']:.1%}")
+    if profile.get('min') is not None:
+        parts.append(f"范围[{profile['min']}, {profile['max']}]")
+    if profile.get('top'):
+        top = ', '.join(f"{t['value']}({t['freq']:.0%})" for t in profile['top'][:3])
+        parts.append(f"高频({profile['top_source']}): {top}")
+    return ' '.join(parts)
+
+
+# 全局实例
+column_profiler = ColumnProfiler()
@@ -1,16 +1,11 @@
 import json
 import logging
-import os
 from typing import Dict, Any, Optional, Tuple, List
 
-try:
-    import pymysql
-except ImportError:
-    pymysql = None
-
-from flask import current_app, has_app_context
 from ..models import Instance
+from .instance_snapshot import instance_snapshots
 from .prometheus_service import prometheus_service
+from .llm_client import llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -59,147 +54,159 @@ def _parse_bool(v: Any) -> str:
     return "OFF"
 
 
+def _step_bucket(value: Any, step: float) -> Optional[int]:
+    try:
+        return int(float(value) // step)
+    except (TypeError, ValueError):
+        return None
+
+
+def _log2_bucket(value: Any) -> Optional[int]:
+    try:
+        return int(value).bit_length()
+    except (TypeError, ValueError):
+        return None
+
+
+# 随时间变化的计数/瞬时值：参与缓存键时按规则阈值附近的粒度分桶，避免每次采集都生成新键
+_VOLATILE_RAW = {
+    'threads_connected': None,
+    'threads_running': _log2_bucket,
+    'innodb_row_lock_time': _log2_bucket,
+    'innodb_row_lock_waits': _log2_bucket,
+    'innodb_row_lock_time_avg_ms': _log2_bucket,
+    'innodb_buffer_pool_reads': None,
+    'innodb_buffer_pool_read_requests': None,
+    'innodb_buffer_pool_hit_ratio': lambda v: _step_bucket(v, 0.5),
+    'connection_pressure_pct': lambda v: _step_bucket(v, 10),
+    'uptime_seconds': None,
+    'memory_pct': lambda v: _step_bucket(v, 5),
+    'disk_pct': lambda v: _step_bucket(v, 5),
+}
+
+
+def config_cache_inputs(collected: Dict[str, Any]) -> Dict[str, Any]:
+    """分析结果缓存键的输入：raw 中的配置值原样保留，运行时计数分桶（None 表示不参与）"""
+    inputs: Dict[str, Any] = {}
+    for k, v in (collected.get('raw') or {}).items():
+        if k in _VOLATILE_RAW:
+            bucket = _VOLATILE_RAW[k]
+            if bucket is None:
+                continue
+            v = bucket(v)
+        inputs[k] = v
+    return inputs
+
+
 class InstanceConfigCollector:
-    """采集MySQL关键配置与状态"""
-
-    def __init__(self, timeout: int = 10):
-        self.timeout = timeout
-
-    def _connect(self, inst: Instance):
-        if not pymysql:
-            raise RuntimeError("MySQL驱动不可用")
-        return pymysql.connect(
-            host=inst.host,
-            port=inst.port,
-            user=inst.username or '',
-            password=inst.password or '',
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            connect_timeout=self.timeout,
-            read_timeout=self.timeout,
-            write_timeout=self.timeout
-        )
+    """采集MySQL关键配置与状态（数据来自实例快照）"""
 
-    def collect(self, inst: Instance) -> Tuple[bool, Dict[str, Any], str]:
+    def collect(self, inst: Instance, max_age: Optional[float] = None) -> Tuple[bool, Dict[str, Any], str]:
+        """变量、状态与版本取自实例快照（max_age 秒内复用，默认见 INSTANCE_SNAPSHOT_TTL）"""
         if not inst:
             return False, {}, "实例不存在"
         if (inst.db_type or '').strip() != 'MySQL':
             return False, {}, "仅支持MySQL实例"
         try:
-            conn = self._connect(inst)
+            snap = instance_snapshots.get(inst, max_age=max_age)
+            variables = snap.variables
+            status = snap.status
+            version = snap.version
+
+            # 统一整理
+            max_conn = int(variables.get('max_connections') or 0)
+            threads_conn = int(status.get('Threads_connected') or 0)
+            uptime_s = int(status.get('Uptime') or 0)
+            ibp_size = variables.get('innodb_buffer_pool_size')
+            slow_log = _parse_bool(variables.get('slow_query_log'))
+            wait_timeout = variables.get('wait_timeout')
+            long_query_time = variables.get('long_query_time')
+
+            # 新增：更多 InnoDB/并发相关指标
+            ibp_instances = variables.get('innodb_buffer_pool_instances')
+            log_file_size = variables.get('innodb_log_file_size')
+            log_files_group = variables.get('innodb_log_files_in_group')
+            threads_running = int(status.get('Threads_running') or 0)
+            row_lock_time = int(status.get('Innodb_row_lock_time') or 0)
+            row_lock_waits = int(status.get('Innodb_row_lock_waits') or 0)
+            avg_lock_ms = (row_lock_time / row_lock_waits) if row_lock_waits else 0
             try:
-                with conn.cursor() as cur:
-                    # 变量
-                    cur.execute("SHOW GLOBAL VARIABLES WHERE Variable_name IN ('max_connections','innodb_buffer_pool_size','innodb_buffer_pool_instances','innodb_log_file_size','innodb_log_files_in_group','slow_query_log','wait_timeout','long_query_time')")
-                    vars_rows = cur.fetchall()
-                    variables = {r['Variable_name']: r['Value'] for r in vars_rows}
-
-                    # 状态
-                    cur.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ('Threads_connected','Threads_running','Innodb_row_lock_time','Innodb_row_lock_waits','Innodb_buffer_pool_reads','Innodb_buffer_pool_read_requests','Uptime')")
-                    stat_rows = cur.fetchall()
-                    status = {r['Variable_name']: r['Value'] for r in stat_rows}
-
-                    # 版本
-                    cur.execute("SELECT VERSION() AS ver")
-                    ver_row = cur.fetchone() or {}
-                    version = (ver_row.get('ver') or '').strip()
-
-                # 统一整理
-                max_conn = int(variables.get('max_connections') or 0)
-                threads_conn = int(status.get('Threads_connected') or 0)
-                uptime_s = int(status.get('Uptime') or 0)
-                ibp_size = variables.get('innodb_buffer_pool_size')
-                slow_log = _parse_bool(variables.get('slow_query_log'))
-                wait_timeout = variables.get('wait_timeout')
-                long_query_time = variables.get('long_query_time')
-
-                # 新增：更多 InnoDB/并发相关指标
-                ibp_instances = variables.get('innodb_buffer_pool_instances')
-                log_file_size = variables.get('innodb_log_file_size')
-                log_files_group = variables.get('innodb_log_files_in_group')
-                threads_running = int(status.get('Threads_running') or 0)
-                row_lock_time = int(status.get('Innodb_row_lock_time') or 0)
-                row_lock_waits = int(status.get('Innodb_row_lock_waits') or 0)
-                avg_lock_ms = (row_lock_time / row_lock_waits) if row_lock_waits else 0
-                try:
-                    lfs_int = int(log_file_size) if str(log_file_size).isdigit() else 0
-                except Exception:
-                    lfs_int = 0
-                try:
-                    lfg_int = int(log_files_group) if str(log_files_group).isdigit() else 0
-                except Exception:
-                    lfg_int = 0
-                redo_total = lfs_int * lfg_int
+                lfs_int = int(log_file_size) if str(log_file_size).isdigit() else 0
+            except Exception:
+                lfs_int = 0
+            try:
+                lfg_int = int(log_files_group) if str(log_files_group).isdigit() else 0
+            except Exception:
+                lfg_int = 0
+            redo_total = lfs_int * lfg_int
 
-                # 新增：缓冲池命中率与连接池压力计算
+            # 新增：缓冲池命中率与连接池压力计算
+            try:
+                bp_reads = int(status.get('Innodb_buffer_pool_reads') or 0)
+            except Exception:
+                bp_reads = 0
+            try:
+                bp_read_reqs = int(status.get('Innodb_buffer_pool_read_requests') or 0)
+            except Exception:
+                bp_read_reqs = 0
+            bp_hit_ratio = None
+            if bp_read_reqs > 0:
                 try:
-                    bp_reads = int(status.get('Innodb_buffer_pool_reads') or 0)
+                    bp_hit_ratio = max(0.0, 100.0 * (1.0 - (bp_reads / bp_read_reqs)))
                 except Exception:
-                    bp_reads = 0
+                    bp_hit_ratio = None
+
+            conn_pressure = None
+            if max_conn > 0:
                 try:
-                    bp_read_reqs = int(status.get('Innodb_buffer_pool_read_requests') or 0)
+                    conn_pressure = max(0.0, min(100.0, (threads_conn / max_conn) * 100.0))
                 except Exception:
-                    bp_read_reqs = 0
-                bp_hit_ratio = None
-                if bp_read_reqs > 0:
-                    try:
-                        bp_hit_ratio = max(0.0, 100.0 * (1.0 - (bp_reads / bp_read_reqs)))
-                    except Exception:
-                        bp_hit_ratio = None
-
-                conn_pressure = None
-                if max_conn > 0:
-                    try:
-                        conn_pressure = max(0.0, min(100.0, (threads_conn / max_conn) * 100.0))
-                    except Exception:
-                        conn_pressure = None
-
-                # prometheus 指标（可选）
-                prom = prometheus_service.get_all_metrics('mysqld') if prometheus_service else {}
-                mem_pct = prom.get('memory_usage')
-                disk = prom.get('disk_usage') or {}
-                disk_pct = disk.get('usage_percent')
-
-                result = {
-                    'basicInfo': {
-                        'instanceName': inst.instance_name,
-                        'type': f"MySQL {version.split('-')[0]}" if version else 'MySQL',
-                        'uptime': _fmt_seconds(uptime_s),
-                        'connections': f"{threads_conn}/{max_conn if max_conn else '?'}",
-                        'memoryUsage': f"{mem_pct:.0f}%" if isinstance(mem_pct, (int, float)) else (str(mem_pct) if mem_pct is not None else 'N/A'),
-                        'diskUsage': f"{disk_pct:.0f}%" if isinstance(disk_pct, (int, float)) else (str(disk_pct) if disk_pct is not None else 'N/A'),
-                    },
-                    'raw': {
-                        'max_connections': max_conn,
-                        'threads_connected': threads_conn,
-                        'innodb_buffer_pool_size': int(ibp_size) if str(ibp_size).isdigit() else ibp_size,
-                        'innodb_buffer_pool_size_h': _human_bytes(ibp_size),
-                        'innodb_buffer_pool_instances': int(ibp_instances) if str(ibp_instances).isdigit() else ibp_instances,
-                        'innodb_log_file_size': int(log_file_size) if str(log_file_size).isdigit() else log_file_size,
-                        'innodb_log_file_size_h': _human_bytes(log_file_size),
-                        'innodb_log_files_in_group': int(log_files_group) if str(log_files_group).isdigit() else log_files_group,
-                        'threads_running': threads_running,
-                        'innodb_row_lock_time': row_lock_time,
-                        'innodb_row_lock_waits': row_lock_waits,
-                        'innodb_row_lock_time_avg_ms': round(avg_lock_ms, 1) if row_lock_waits else 0,
-                        'innodb_redo_total_bytes': redo_total,
-                        'innodb_redo_total_h': _human_bytes(redo_total),
-                        'slow_query_log': slow_log,
-                        'wait_timeout': int(wait_timeout) if str(wait_timeout).isdigit() else wait_timeout,
-                        'long_query_time': float(long_query_time) if str(long_query_time).replace('.', '', 1).isdigit() else long_query_time,
-                        'innodb_buffer_pool_reads': bp_reads,
-                        'innodb_buffer_pool_read_requests': bp_read_reqs,
-                        'innodb_buffer_pool_hit_ratio': round(bp_hit_ratio, 2) if isinstance(bp_hit_ratio, (int, float)) else None,
-                        'connection_pressure_pct': round(conn_pressure, 2) if isinstance(conn_pressure, (int, float)) else None,
-                        'version': version,
-                        'uptime_seconds': uptime_s,
-                        'memory_pct': mem_pct,
-                        'disk_pct': disk_pct,
-                    }
+                    conn_pressure = None
+
+            # prometheus 指标（可选）
+            prom = prometheus_service.get_all_metrics('mysqld') if prometheus_service else {}
+            mem_pct = prom.get('memory_usage')
+            disk = prom.get('disk_usage') or {}
+            disk_pct = disk.get('usage_percent')
+
+            result = {
+                'basicInfo': {
+                    'instanceName': inst.instance_name,
+                    'type': f"MySQL {version.split('-')[0]}" if version else 'MySQL',
+                    'uptime': _fmt_seconds(uptime_s),
+                    'connections': f"{threads_conn}/{max_conn if max_conn else '?'}",
+                    'memoryUsage': f"{mem_pct:.0f}%" if isinstance(mem_pct, (int, float)) else (str(mem_pct) if mem_pct is not None else 'N/A'),
+                    'diskUsage': f"{disk_pct:.0f}%" if isinstance(disk_pct, (int, float)) else (str(disk_pct) if disk_pct is not None else 'N/A'),
+                },
+                'raw': {
+                    'max_connections': max_conn,
+                    'threads_connected': threads_conn,
+                    'innodb_buffer_pool_size': int(ibp_size) if str(ibp_size).isdigit() else ibp_size,
+                    'innodb_buffer_pool_size_h': _human_bytes(ibp_size),
+                    'innodb_buffer_pool_instances': int(ibp_instances) if str(ibp_instances).isdigit() else ibp_instances,
+                    'innodb_log_file_size': int(log_file_size) if str(log_file_size).isdigit() else log_file_size,
+                    'innodb_log_file_size_h': _human_bytes(log_file_size),
+                    'innodb_log_files_in_group': int(log_files_group) if str(log_files_group).isdigit() else log_files_group,
+                    'threads_running': threads_running,
+                    'innodb_row_lock_time': row_lock_time,
+                    'innodb_row_lock_waits': row_lock_waits,
+                    'innodb_row_lock_time_avg_ms': round(avg_lock_ms, 1) if row_lock_waits else 0,
+                    'innodb_redo_total_bytes': redo_total,
+                    'innodb_redo_total_h': _human_bytes(redo_total),
+                    'slow_query_log': slow_log,
+                    'wait_timeout': int(wait_timeout) if str(wait_timeout).isdigit() else wait_timeout,
+                    'long_query_time': float(long_query_time) if str(long_query_time).replace('.', '', 1).isdigit() else long_query_time,
+                    'innodb_buffer_pool_reads': bp_reads,
+                    'innodb_buffer_pool_read_requests': bp_read_reqs,
+                    'innodb_buffer_pool_hit_ratio': round(bp_hit_ratio, 2) if isinstance(bp_hit_ratio, (int, float)) else None,
+                    'connection_pressure_pct': round(conn_pressure, 2) if isinstance(conn_pressure, (int, float)) else None,
+                    'version': version,
+                    'uptime_seconds': uptime_s,
+                    'memory_pct': mem_pct,
+                    'disk_pct': disk_pct,
                 }
-                return True, result, "OK"
-            finally:
-                conn.close()
+            }
+            return True, result, "OK"
         except Exception as e:
             logger.error(f"采集配置失败(实例ID={getattr(inst, 'id', None)}): {e}")
             return False, {}, f"连接或查询失败: {e}"
@@ -208,63 +215,16 @@ class InstanceConfigCollector:
 class DeepSeekConfigAdvisor:
     """调用 DeepSeek 生成配置优化建议；失败则回退到规则建议"""
 
-    def __init__(self):
-        # 使用默认值，延迟从 Flask 配置加载，避免无应用上下文时报错
-        self.enabled = True
-        self.base_url = "https://api.deepseek.com"
-        self.api_key = None
-        self.model = "deepseek-chat"
-        self.timeout = 30
-        self._config_loaded = False
-        
-    def _ensure_config(self):
-        if self._config_loaded:
-            return
-        try:
-            if has_app_context():
-                cfg = current_app.config
-                self.enabled = cfg.get("LLM_ENABLED", self.enabled)
-                self.base_url = cfg.get("DEEPSEEK_BASE_URL", self.base_url)
-                self.api_key = cfg.get("DEEPSEEK_API_KEY", self.api_key)
-                self.model = cfg.get("DEEPSEEK_MODEL", self.model)
-                self.timeout = cfg.get("DEEPSEEK_TIMEOUT", self.timeout)
-            else:
-                # 环境变量兜底
-                self.enabled = os.getenv("LLM_ENABLED", "1") != "0"
-                self.base_url = os.getenv("DEEPSEEK_BASE_URL", self.base_url)
-                self.api_key = os.getenv("DEEPSEEK_API_KEY", self.api_key)
-                self.model = os.getenv("DEEPSEEK_MODEL", self.model)
-                self.timeout = int(os.getenv("DEEPSEEK_TIMEOUT", str(self.timeout)))
-        except Exception:
-            pass
-        finally:
-            self._config_loaded = True
-
-    def _call_llm(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        import requests
-        self._ensure_config()
-        if not (self.enabled and self.api_key):
-            return None
+    def llm_configured(self) -> bool:
+        return llm_client.configured()
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
         try:
-            url = f"{self.base_url}/v1/chat/completions"
-            headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-            resp = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            content = (data.get('choices', [{}])[0].get('message', {}) or {}).get('content', '').strip()
-            try:
-                return json.loads(content)
-            except Exception:
-                start = content.find('{')
-                end = content.rfind('}')
-                if start != -1 and end != -1 and end > start:
-                    try:
-                        return json.loads(content[start:end+1])
-                    except Exception:
-                        return None
-                return None
-        except Exception:
+            obj = llm_client.chat_json(messages, temperature=0.1, max_tokens=1000)
+        except Exception as e:
+            logger.info(f"LLM 配置建议失败，回退到规则建议: {e}")
             return None
+        return obj if isinstance(obj, dict) else None
 
     def advise(self, collected: Dict[str, Any]) -> Dict[str, Any]:
         raw = collected.get('raw', {})
@@ -284,20 +244,16 @@ class DeepSeekConfigAdvisor:
                 prompt = prompt + f"\n【慢日志摘要】:\n{_json.dumps(slowlog_summary, ensure_ascii=False)}\n"
             except Exception:
                 pass
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "你是一个只返回JSON的MySQL配置优化器。"},
-                {"role": "user", "content": prompt},
-            ],
-            "temperature": 0.1,
-            "max_tokens": 1000,
-        }
-        obj = self._call_llm(payload)
+        obj = self._call_llm([
+            {"role": "system", "content": "你是一个只返回JSON的MySQL配置优化器。"},
+            {"role": "user", "content": prompt},
+        ])
         if obj and isinstance(obj, dict) and isinstance(obj.get('configItems'), list):
             items = obj['configItems']
+            source = 'llm'
         else:
             items = self._fallback_rules(raw)
+            source = 'rules'
 
         # 统一“慢查询日志”项，使用采集到的真实值覆盖，避免LLM误判导致前端显示错误
         slow = raw.get('slow_query_log') or 'OFF'  # 统一为 'ON'/'OFF'
@@ -338,6 +294,7 @@ class DeepSeekConfigAdvisor:
             it['key'] = str(idx)
 
         return {
+            'source': source,
             'configItems': items,
             'optimizationSummary': {
                 'totalItems': total,
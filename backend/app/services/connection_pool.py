@@ -0,0 +1,428 @@
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+try:
+    import pymysql
+    import pymysql.cursors
+except ImportError:
+    pymysql = None
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(RuntimeError):
+    """等待空闲连接超时"""
+
+
+class _IdleConn:
+    __slots__ = ('conn', 'last_used', 'database')
+
+    def __init__(self, conn, last_used: float, database: Optional[str]):
+        self.conn = conn
+        self.last_used = last_used
+        self.database = database
+
+
+class _KeyedPool:
+    """单个 (实例, 凭据) 维度的连接池"""
+
+    def __init__(self, key: Tuple, instance_id: Optional[int]):
+        self.key = key
+        self.instance_id = instance_id
+        self.idle: Deque[_IdleConn] = deque()
+        self.in_use = 0
+        self.generation = 0
+        self.cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.evictions = 0
+        self.broken = 0
+        # 最近一次被借用的时间；retired 后归还的连接直接关闭
+        self.last_active = time.monotonic()
+        self.retired = False
+
+    @property
+    def open_count(self) -> int:
+        return len(self.idle) + self.in_use
+
+
+class MySQLConnectionPool:
+    """按实例ID与连接凭据划分的 MySQL 连接池。
+
+    - 每个键的连接数有上限（max_size），耗尽时最多等待 wait_timeout 秒；
+    - 空闲超过 idle_timeout 的连接被回收；
+    - 借出前若连接空闲超过 validate_after 秒，先 ping 校验；
+    - 实例连接信息变更或删除后调用 invalidate() 丢弃旧连接；
+    - 后台回收线程定期关闭超时的空闲连接，并移除长期未用的空池（如旧凭据、新建实例前的校验）；
+    - 空闲连接记录其当前默认库：指定 database 的借用优先取同库连接，
+      未指定 database 的借用不会拿到带有其他借用方默认库的连接。
+    执行用户 SQL 等可能改变会话状态（USE、SET SESSION、LOCK TABLES、临时表）的场景
+    使用 dedicated() 获取不入池的独立连接。
+    """
+
+    def __init__(self):
+        self.max_size = int(os.getenv('MYSQL_POOL_MAX_SIZE', '5'))
+        self.idle_timeout = float(os.getenv('MYSQL_POOL_IDLE_TIMEOUT', '300'))
+        self.wait_timeout = float(os.getenv('MYSQL_POOL_WAIT_TIMEOUT', '10'))
+        self.validate_after = float(os.getenv('MYSQL_POOL_VALIDATE_AFTER', '2'))
+        self.reap_interval = float(os.getenv('MYSQL_POOL_REAP_INTERVAL', '60'))
+        self._pools: Dict[Tuple, _KeyedPool] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._dedicated_opened = 0
+        self._dedicated_in_use = 0
+        self._retired = 0
+
+    # ---------- 键与创建 ----------
+    @staticmethod
+    def _make_key(instance_id: Optional[int], host: str, port: int, user: str, password: str) -> Tuple:
+        # 密码仅以摘要形式参与键，避免明文常驻在统计/日志里
+        pwd_digest = hashlib.sha1((password or '').encode('utf-8')).hexdigest()
+        return (instance_id, host, int(port or 3306), user or '', pwd_digest)
+
+    def _get_pool(self, key: Tuple, instance_id: Optional[int]) -> _KeyedPool:
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = _KeyedPool(key, instance_id)
+                self._pools[key] = pool
+            pool.last_active = time.monotonic()
+            if self._reaper is None and self.reap_interval > 0:
+                self._reaper = threading.Thread(target=self._reap_loop, name='mysql-pool-reaper', daemon=True)
+                self._reaper.start()
+            return pool
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.warning(f"连接池回收失败: {e}")
+
+    def reap(self):
+        """关闭各池中超时的空闲连接，并移除超过 idle_timeout 未被借用且已无连接的池"""
+        now = time.monotonic()
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            with pool.cond:
+                self._evict_idle(pool, now)
+        with self._lock:
+            for pool in pools:
+                with pool.cond:
+                    if pool.open_count == 0 and now - pool.last_active > self.idle_timeout:
+                        pool.retired = True
+                        if self._pools.get(pool.key) is pool:
+                            del self._pools[pool.key]
+                            self._retired += 1
+
+    def _open(self, host: str, port: int, user: str, password: str, timeout: int):
+        """新建连接：先自行建立 TCP 连接再交给驱动握手，以便分别计时。
+        耗时记在 conn.open_timings（connect_ms/auth_ms），仅首个借用者可见。"""
+        port = int(port or 3306)
+        started = time.perf_counter()
+        try:
+            sock = socket.create_connection((host, port), timeout)
+        except OSError as e:
+            raise pymysql.err.OperationalError(2003, f"Can't connect to MySQL server on {host!r} ({e})")
+        connected = time.perf_counter()
+        try:
+            # 与驱动自行建连时的套接字设置保持一致
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.settimeout(None)
+            conn = pymysql.connect(
+                host=host,
+                port=port,
+                user=user or '',
+                password=password or '',
+                charset='utf8mb4',
+                cursorclass=pymysql.cursors.DictCursor,
+                connect_timeout=timeout,
+                read_timeout=timeout,
+                write_timeout=timeout,
+                defer_connect=True
+            )
+            conn.host_info = f"socket {host}:{port}"
+            conn.connect(sock=sock)
+        except Exception:
+            sock.close()
+            raise
+        conn.open_timings = {
+            'connect_ms': (connected - started) * 1000,
+            'auth_ms': (time.perf_counter() - connected) * 1000,
+        }
+        conn.pool_database = None
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, pool: _KeyedPool, now: float):
+        """调用方需持有 pool.cond"""
+        while pool.idle and now - pool.idle[0].last_used > self.idle_timeout:
+            item = pool.idle.popleft()
+            pool.evictions += 1
+            self._close_quietly(item.conn)
+
+    # ---------- 借还 ----------
+    @staticmethod
+    def _take_idle(pool: _KeyedPool, database: Optional[str]) -> Tuple[Optional[_IdleConn], bool]:
+        """取一个空闲连接，返回 (连接项, 是否可直接使用)。调用方需持有 pool.cond。
+        后进先出：最近使用的连接最“热”，老连接留给空闲回收。
+        优先取默认库与 database 相同的连接；database 为空时带默认库的连接不可用（无法取消默认库），
+        此时取出的连接由调用方关闭并新建。"""
+        for i in range(len(pool.idle) - 1, -1, -1):
+            if pool.idle[i].database == database:
+                item = pool.idle[i]
+                del pool.idle[i]
+                return item, True
+        if not pool.idle:
+            return None, False
+        return pool.idle.pop(), database is not None
+
+    def _acquire(self, pool: _KeyedPool, host: str, port: int, user: str, password: str, timeout: int,
+                 database: Optional[str] = None, wait_timeout: Optional[float] = None):
+        deadline = time.monotonic() + (self.wait_timeout if wait_timeout is None else wait_timeout)
+        waited = False
+        while True:
+            with pool.cond:
+                now = time.monotonic()
+                self._evict_idle(pool, now)
+                item, usable = self._take_idle(pool, database)
+                if item is not None and usable:
+                    pool.in_use += 1
+                    generation = pool.generation
+                    conn, idle_for = item.conn, now - item.last_used
+                    reuse = True
+                elif item is not None:
+                    # 带其他默认库的空闲连接：关闭后占用其名额新建
+                    self._close_quietly(item.conn)
+                    pool.evictions += 1
+                    pool.in_use += 1
+                    generation = pool.generation
+                    conn, idle_for = None, 0.0
+                    reuse = False
+                elif pool.open_count < self.max_size:
+                    pool.in_use += 1
+                    generation = pool.generation
+                    conn, idle_for = None, 0.0
+                    reuse = False
+                else:
+                    if not waited:
+                        pool.waits += 1
+                        waited = True
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        pool.timeouts += 1
+                        raise PoolExhaustedError(f"连接池已耗尽（上限 {self.max_size}）")
+                    pool.cond.wait(remaining)
+                    continue
+
+            if reuse:
+                if idle_for < self.validate_after or self._is_alive(conn):
+                    with pool.cond:
+                        pool.hits += 1
+                    return conn, generation
+                # 校验失败：丢弃后重新走一遍（可能命中其他空闲连接或新建）
+                self._close_quietly(conn)
+                with pool.cond:
+                    pool.in_use -= 1
+                    pool.broken += 1
+                    pool.cond.notify()
+                continue
+
+            try:
+                conn = self._open(host, port, user, password, timeout)
+            except Exception:
+                with pool.cond:
+                    pool.in_use -= 1
+                    pool.cond.notify()
+                raise
+            with pool.cond:
+                pool.misses += 1
+            return conn, generation
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _release(self, pool: _KeyedPool, conn, generation: int, discard: bool):
+        conn.open_timings = None
+        if not discard:
+            try:
+                # 结束可能遗留的事务，避免下一个借用方读到旧快照
+                conn.rollback()
+            except Exception:
+                discard = True
+        with pool.cond:
+            pool.in_use -= 1
+            if discard or pool.retired or generation != pool.generation or not conn.open:
+                self._close_quietly(conn)
+            else:
+                pool.idle.append(_IdleConn(conn, time.monotonic(), getattr(conn, 'pool_database', None)))
+            pool.cond.notify()
+
+    @contextmanager
+    def connection(self, inst: Any = None, database: Optional[str] = None, timeout: int = 10,
+                   host: Optional[str] = None, port: Optional[int] = None,
+                   user: Optional[str] = None, password: Optional[str] = None,
+                   instance_id: Optional[int] = None, read_timeout: Optional[int] = None,
+                   wait_timeout: Optional[float] = None):
+        """借出一个连接（DictCursor），with 块结束后自动归还。
+
+        inst 为 Instance（或具备 id/host/port/username/password 属性的对象）；
+        也可直接传 host/port/user/password（如新建实例前的连通性校验）。
+        read_timeout 默认与 timeout 相同，传 0 表示本次借用不限制读写超时。
+        wait_timeout 为池满时的最长等待秒数，缺省使用 MYSQL_POOL_WAIT_TIMEOUT。
+        """
+        if not pymysql:
+            raise RuntimeError("MySQL驱动不可用")
+        if inst is not None:
+            instance_id = getattr(inst, 'id', None)
+            host = inst.host
+            port = inst.port
+            user = inst.username or ''
+            password = inst.password or ''
+        key = self._make_key(instance_id, host, port, user, password)
+        pool = self._get_pool(key, instance_id)
+        conn, generation = self._acquire(pool, host, port, user, password, timeout,
+                                         database=database or None, wait_timeout=wait_timeout)
+        # 连接被不同调用方复用，读写超时按本次借用重新设置
+        io_timeout = timeout if read_timeout is None else (read_timeout or None)
+        conn._read_timeout = io_timeout
+        conn._write_timeout = io_timeout
+        discard = False
+        try:
+            if database and conn.pool_database != database:
+                conn.select_db(database)
+                conn.pool_database = database
+            yield conn
+        except BaseException:
+            # 出错的连接状态不可信（可能半读结果集/已断开），直接丢弃
+            discard = True
+            raise
+        finally:
+            self._release(pool, conn, generation, discard)
+
+    @contextmanager
+    def dedicated(self, inst: Any = None, database: Optional[str] = None, timeout: int = 10,
+                  host: Optional[str] = None, port: Optional[int] = None,
+                  user: Optional[str] = None, password: Optional[str] = None,
+                  read_timeout: Optional[int] = None):
+        """新建一个不入池的独立连接，with 块结束后关闭。
+        用于执行用户 SQL（会话状态不会泄漏给池中其他借用方）与需要实测建连耗时的探测；
+        conn.open_timings 含本次 connect_ms/auth_ms。参数含义同 connection()。"""
+        if not pymysql:
+            raise RuntimeError("MySQL驱动不可用")
+        if inst is not None:
+            host = inst.host
+            port = inst.port
+            user = inst.username or ''
+            password = inst.password or ''
+        conn = self._open(host, port, user, password, timeout)
+        io_timeout = timeout if read_timeout is None else (read_timeout or None)
+        conn._read_timeout = io_timeout
+        conn._write_timeout = io_timeout
+        with self._lock:
+            self._dedicated_opened += 1
+            self._dedicated_in_use += 1
+        try:
+            if database:
+                conn.select_db(database)
+            yield conn
+        finally:
+            self._close_quietly(conn)
+            with self._lock:
+                self._dedicated_in_use -= 1
+
+    # ---------- 失效与统计 ----------
+    def invalidate(self, instance_id: int):
+        """丢弃某实例的全部连接：空闲的立即关闭，借出中的归还时关闭"""
+        with self._lock:
+            pools = [p for p in self._pools.values() if p.instance_id == instance_id]
+            for p in pools:
+                self._pools.pop(p.key, None)
+        for p in pools:
+            with p.cond:
+                p.generation += 1
+                while p.idle:
+                    self._close_quietly(p.idle.popleft().conn)
+        if pools:
+            logger.info(f"已失效实例 {instance_id} 的连接池（{len(pools)} 组）")
+
+    def close_all(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for p in pools:
+            with p.cond:
+                p.generation += 1
+                while p.idle:
+                    self._close_quietly(p.idle.popleft().conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pools = list(self._pools.values())
+            dedicated = {'opened': self._dedicated_opened, 'in_use': self._dedicated_in_use}
+            retired = self._retired
+        now = time.monotonic()
+        per_pool = []
+        totals = {'hits': 0, 'misses': 0, 'waits': 0, 'timeouts': 0, 'evictions': 0,
+                  'broken': 0, 'open': 0, 'idle': 0, 'in_use': 0}
+        for p in pools:
+            with p.cond:
+                self._evict_idle(p, now)
+                item = {
+                    'instance_id': p.instance_id,
+                    'host': p.key[1],
+                    'port': p.key[2],
+                    'user': p.key[3],
+                    'hits': p.hits,
+                    'misses': p.misses,
+                    'waits': p.waits,
+                    'timeouts': p.timeouts,
+                    'evictions': p.evictions,
+                    'broken': p.broken,
+                    'open': p.open_count,
+                    'idle': len(p.idle),
+                    'in_use': p.in_use,
+                }
+            for k in totals:
+                totals[k] += item[k]
+            per_pool.append(item)
+        return {
+            'config': {
+                'max_size': self.max_size,
+                'idle_timeout': self.idle_timeout,
+                'wait_timeout': self.wait_timeout,
+                'validate_after': self.validate_after,
+                'reap_interval': self.reap_interval,
+            },
+            'totals': totals,
+            'retired_pools': retired,
+            'dedicated': dedicated,
+            'pools': per_pool,
+        }
+
+
+# 全局实例
+mysql_pool = MySQLConnectionPool()
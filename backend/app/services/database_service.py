@@ -3,10 +3,12 @@ from typing import List, Optional, Tuple
 
 try:
     import pymysql
+    import pymysql.cursors
 except ImportError:
     pymysql = None
 
 from ..models import Instance
+from .connection_pool import mysql_pool
 
 logger = logging.getLogger(__name__)
 
@@ -33,28 +35,17 @@ class DatabaseService:
             return False, [], "MySQL驱动不可用"
         
         try:
-            # 建立MySQL连接
-            conn = pymysql.connect(
-                host=instance.host,
-                port=instance.port,
-                user=instance.username or '',
-                password=instance.password or '',
-                charset='utf8mb4',
-                connect_timeout=self.timeout,
-                read_timeout=self.timeout,
-                write_timeout=self.timeout
-            )
-            
-            with conn.cursor() as cursor:
-                # 执行 SHOW DATABASES 查询
-                cursor.execute("SHOW DATABASES")
-                results = cursor.fetchall()
-                
-                # 提取数据库名称，包含系统数据库
-                databases = [db_name for (db_name,) in results]
-                
-                conn.close()
-                return True, sorted(databases), "获取成功"
+            # 从连接池借用连接
+            with mysql_pool.connection(instance, timeout=self.timeout) as conn:
+                with conn.cursor(pymysql.cursors.Cursor) as cursor:
+                    # 执行 SHOW DATABASES 查询
+                    cursor.execute("SHOW DATABASES")
+                    results = cursor.fetchall()
+                    
+                    # 提取数据库名称，包含系统数据库
+                    databases = [db_name for (db_name,) in results]
+                    
+                    return True, sorted(databases), "获取成功"
                 
         except Exception as e:
             logger.error(f"获取数据库列表失败 (实例ID: {instance.id}): {e}")
@@ -1,56 +1,118 @@
+import os
 import socket
 import logging
-from typing import Tuple
+import threading
+import time
+from contextlib import ExitStack
+from typing import Dict, Optional, Tuple
 
 try:
     import pymysql
 except ImportError:  # 兜底，即使意外缺失也不影响其他类型的TCP探活
     pymysql = None
 
+from .connection_pool import PoolExhaustedError, mysql_pool
+
 logger = logging.getLogger(__name__)
 
+# (是否可用, 信息, 分阶段耗时毫秒)
+ProbeResult = Tuple[bool, str, Dict[str, float]]
+
 
 class DatabaseValidator:
     """数据库连通性校验器：优先使用驱动（MySQL），否则进行TCP端口探活"""
 
     def __init__(self):
         self.timeout = 10  # 秒
+        # 已入库实例每隔该秒数用独立新连接探测一次，实测 TCP 建连与握手认证耗时（0 表示每次都新建）
+        self.fresh_connect_interval = float(os.getenv('PROBE_FRESH_CONNECT_INTERVAL', '30'))
+        self._last_fresh: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def _tcp_probe(self, host: str, port: int, timeout: Optional[float] = None) -> Tuple[bool, str]:
+        ok, msg, _ = self._tcp_probe_timed(host, port, timeout)
+        return ok, msg
 
-    def _tcp_probe(self, host: str, port: int) -> Tuple[bool, str]:
+    def _tcp_probe_timed(self, host: str, port: int, timeout: Optional[float] = None) -> ProbeResult:
+        started = time.perf_counter()
         try:
-            with socket.create_connection((host, port), timeout=self.timeout):
-                return True, "TCP端口可达"
+            with socket.create_connection((host, port), timeout=timeout or self.timeout):
+                elapsed = (time.perf_counter() - started) * 1000
+                return True, "TCP端口可达", {'connect_ms': elapsed, 'total_ms': elapsed}
         except Exception as e:
-            return False, f"TCP连接失败: {e}"
+            return False, f"TCP连接失败: {e}", {'total_ms': (time.perf_counter() - started) * 1000}
 
-    def validate_mysql(self, host: str, port: int, username: str = None, password: str = None) -> Tuple[bool, str]:
-        """验证MySQL连接：若驱动不可用则退化为TCP探活"""
+    def probe_mysql(self, host: str, port: int, username: str = None, password: str = None,
+                    instance_id: Optional[int] = None, timeout: Optional[float] = None) -> ProbeResult:
+        """MySQL探测并返回分阶段耗时（毫秒）：
+        connect_ms/auth_ms 仅在新建连接时存在，ping_ms 为 ping 往返，total_ms 为整次探测。
+        已入库实例距上次新建连接探测满 fresh_connect_interval 秒时使用独立新连接（池中连接空闲回收时间
+        远长于探测间隔，复用时没有握手可测）；其余探测借用池中连接且不等待：池被分析/采样等流量占满时
+        改用独立连接，不会因等待池而超时误判为不可用；未入库（instance_id 为空）的校验直接使用独立连接，不建池。"""
         if not pymysql:
-            return self._tcp_probe(host, port)
+            return self._tcp_probe_timed(host, port, timeout)
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        params = dict(host=host, port=port, user=username or '', password=password or '',
+                      timeout=timeout or self.timeout)
         try:
-            conn = pymysql.connect(
-                host=host,
-                port=port,
-                user=username or '',
-                password=password or '',
-                charset='utf8mb4',
-                connect_timeout=self.timeout,
-                read_timeout=self.timeout,
-                write_timeout=self.timeout
-            )
-            conn.ping()
-            conn.close()
-            return True, "MySQL连接成功"
+            with ExitStack() as stack:
+                conn = None
+                if instance_id is not None and not self._fresh_due(instance_id):
+                    try:
+                        conn = stack.enter_context(
+                            mysql_pool.connection(instance_id=instance_id, wait_timeout=0, **params)
+                        )
+                    except PoolExhaustedError:
+                        pass
+                if conn is None:
+                    conn = stack.enter_context(mysql_pool.dedicated(**params))
+                timings.update(getattr(conn, 'open_timings', None) or {})
+                ping_started = time.perf_counter()
+                conn.ping(reconnect=False)
+                timings['ping_ms'] = (time.perf_counter() - ping_started) * 1000
+            timings['total_ms'] = (time.perf_counter() - started) * 1000
+            return True, "MySQL连接成功", timings
         except Exception as e:
-            return False, f"MySQL连接失败: {e}"
+            timings['total_ms'] = (time.perf_counter() - started) * 1000
+            return False, f"MySQL连接失败: {e}", timings
 
-    def validate_connection(self, db_type: str, host: str, port: int, username: str = None, password: str = None) -> Tuple[bool, str]:
-        """根据数据库类型验证连接：MySQL用驱动，其它类型做通用TCP探活"""
+    def _fresh_due(self, instance_id: int) -> bool:
+        """本次是否应使用新建连接探测（到期即记为已新建）"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_fresh.get(instance_id)
+            if last is not None and now - last < self.fresh_connect_interval:
+                return False
+            self._last_fresh[instance_id] = now
+            return True
+
+    def forget(self, instance_id: int):
+        with self._lock:
+            self._last_fresh.pop(instance_id, None)
+
+    def validate_mysql(self, host: str, port: int, username: str = None, password: str = None,
+                       instance_id: Optional[int] = None, timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """验证MySQL连接：若驱动不可用则退化为TCP探活。
+        已入库实例（instance_id）借用池中连接后 ping，池满或未入库时使用独立连接（见 probe_mysql）。
+        timeout 为本次探测的连接/读写超时，缺省使用 self.timeout。"""
+        ok, msg, _ = self.probe_mysql(host, port, username, password, instance_id=instance_id, timeout=timeout)
+        return ok, msg
+
+    def probe(self, db_type: str, host: str, port: int, username: str = None, password: str = None,
+              instance_id: Optional[int] = None, timeout: Optional[float] = None) -> ProbeResult:
+        """按数据库类型探测并返回 (是否可用, 信息, 分阶段耗时)"""
         type_key = (db_type or '').strip()
         if type_key == 'MySQL':
-            return self.validate_mysql(host, port, username, password)
+            return self.probe_mysql(host, port, username, password, instance_id=instance_id, timeout=timeout)
         # 其他类型：Redis/PostgreSQL/MongoDB/Oracle 统一TCP探活
-        return self._tcp_probe(host, port)
+        return self._tcp_probe_timed(host, port, timeout)
+
+    def validate_connection(self, db_type: str, host: str, port: int, username: str = None, password: str = None,
+                            instance_id: Optional[int] = None, timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """根据数据库类型验证连接：MySQL用驱动，其它类型做通用TCP探活"""
+        ok, msg, _ = self.probe(db_type, host, port, username, password, instance_id=instance_id, timeout=timeout)
+        return ok, msg
 
 
 # 全局实例
@@ -1,30 +1,26 @@
-import os
-import json
+import threading
 from typing import Optional
-import requests
-from flask import current_app
+
+from .llm_client import llm_client
 
 
 class DeepSeekClient:
     """DeepSeek API 适配器：只输出重写后的 SQL（若可优化），不返回其他建议文本。
     输出：{"rewritten_sql": str | None}
+    HTTP 连接、并发/限速与重试由共享的 llm_client 负责，本类只负责提示词与结果规范化。
     """
 
     def __init__(self):
-        self.base_url = None
-        self.api_key = None
-        self.model = None
-        self.timeout = 30
-        self.enabled = True
-        self._load_config()
-
-    def _load_config(self):
-        cfg = current_app.config
-        self.base_url = cfg.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
-        self.api_key = cfg.get("DEEPSEEK_API_KEY")
-        self.model = cfg.get("DEEPSEEK_MODEL", "deepseek-chat")
-        self.timeout = cfg.get("DEEPSEEK_TIMEOUT", 30)
-        self.enabled = cfg.get("LLM_ENABLED", True)
+        self._local = threading.local()
+
+    @property
+    def last_error(self) -> Optional[Exception]:
+        """当前线程最近一次调用的异常（None 表示未出错或未调用），供调用方区分网络失败与输出不合规"""
+        return getattr(self._local, 'error', None)
+
+    @last_error.setter
+    def last_error(self, value: Optional[Exception]):
+        self._local.error = value
 
     def _build_prompt(self, sql: str, meta_summary: str) -> str:
         """构造严格输出约束的系统提示。仅支持 MySQL，仅返回可优化时的重写SQL，否则返回 null。
@@ -41,59 +37,34 @@ class DeepSeekClient:
 
     def rewrite_sql(self, sql: str, meta_summary: str = "") -> Optional[str]:
         """返回重写后的 SQL；若不需要优化或出错，返回 None。"""
-        if not self.enabled or not self.api_key:
+        self.last_error = None
+        if not llm_client.configured():
             return None
 
         prompt = self._build_prompt(sql, meta_summary)
-
-        # DeepSeek 兼容 OpenAI Chat Completions 风格（如不同需按官方API调整）
-        url = f"{self.base_url}/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "你是一个只返回JSON的优化器。"},
-                {"role": "user", "content": prompt},
-            ],
-            "temperature": 0.2,
-            "max_tokens": 800,
-        }
-
+        messages = [
+            {"role": "system", "content": "你是一个只返回JSON的优化器。"},
+            {"role": "user", "content": prompt},
+        ]
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-            # 期望严格的JSON；若模型仍包裹代码块或前后噪声，尽量提取花括号内JSON
-            try:
-                obj = json.loads(content)
-            except Exception:
-                # 尝试去掉代码围栏 ```json ... ``` 或提取花括号片段
-                start = content.find('{')
-                end = content.rfind('}')
-                if start != -1 and end != -1 and end > start:
-                    try:
-                        obj = json.loads(content[start:end+1])
-                    except Exception:
-                        return None
-                else:
-                    return None
-            rewritten = obj.get("rewritten_sql")
-            if isinstance(rewritten, str) and rewritten.strip():
-                return rewritten.strip()
-            return None
-        except Exception:
+            obj = llm_client.chat_json(messages, temperature=0.2, max_tokens=800)
+        except Exception as e:
             # 任何异常都降级为 None
+            self.last_error = e
             return None
+        if not isinstance(obj, dict):
+            return None
+        rewritten = obj.get("rewritten_sql")
+        if isinstance(rewritten, str) and rewritten.strip():
+            return rewritten.strip()
+        return None
 
     # 新增：返回结构化的分析结果与（可选）重写SQL
     def analyze_sql(self, sql: str, context_summary: str = "") -> Optional[dict]:
         """要求模型输出 JSON：{"analysis": string, "rewritten_sql": string|null}
         若未启用或出错，返回 None。"""
-        if not self.enabled or not self.api_key:
+        self.last_error = None
+        if not llm_client.configured():
             return None
 
         prompt = (
@@ -107,53 +78,34 @@ class DeepSeekClient:
             f"\n【上下文摘要（表结构与数据样本等）】:\n{context_summary}\n"
         )
 
-        url = f"{self.base_url}/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "你是一个只返回JSON的审核与优化助手。"},
-                {"role": "user", "content": prompt},
-            ],
-            "temperature": 0.2,
-            "max_tokens": 1200,
-        }
-
+        messages = [
+            {"role": "system", "content": "你是一个只返回JSON的审核与优化助手。"},
+            {"role": "user", "content": prompt},
+        ]
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-            try:
-                obj = json.loads(content)
-            except Exception:
-                start = content.find('{')
-                end = content.rfind('}')
-                if start != -1 and end != -1 and end > start:
-                    try:
-                        obj = json.loads(content[start:end+1])
-                    except Exception:
-                        return None
-                else:
-                    return None
-            analysis = obj.get("analysis")
-            rewritten = obj.get("rewritten_sql")
-            # 规范化
-            if not isinstance(analysis, str):
-                analysis = None
-            if not (isinstance(rewritten, str) and rewritten.strip()):
-                rewritten = None
-            else:
-                rewritten = rewritten.strip()
-            return {"analysis": analysis, "rewritten_sql": rewritten}
-        except Exception:
+            obj = llm_client.chat_json(messages, temperature=0.2, max_tokens=1200)
+        except Exception as e:
+            self.last_error = e
+            return None
+        if not isinstance(obj, dict):
             return None
+        analysis = obj.get("analysis")
+        rewritten = obj.get("rewritten_sql")
+        # 规范化
+        if not isinstance(analysis, str):
+            analysis = None
+        if not (isinstance(rewritten, str) and rewritten.strip()):
+            rewritten = None
+        else:
+            rewritten = rewritten.strip()
+        return {"analysis": analysis, "rewritten_sql": rewritten}
+
+
+# 全局实例（只持有线程局部的 last_error，可在线程间共享）
+deepseek_client = DeepSeekClient()
 
 
 # 全局工厂方法
 
 def get_deepseek_client() -> DeepSeekClient:
-    return DeepSeekClient()
\ No newline at end of file
+    return deepseek_client
\ No newline at end of file
@@ -0,0 +1,326 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, update
+
+from .. import db
+from ..models import DigestBaseline, DigestDelta, DigestSnapshot
+from .connection_pool import mysql_pool
+from .instance_registry import instance_registry
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('calls', 'timer_us', 'lock_us', 'rows_examined', 'rows_sent', 'no_index_used', 'errors')
+
+# 计时列单位为皮秒，统一折算为微秒保存
+_DIGEST_SQL = (
+    "SELECT IFNULL(SCHEMA_NAME, '') AS schema_name, DIGEST AS digest, DIGEST_TEXT AS digest_text, "
+    "       COUNT_STAR AS calls, SUM_TIMER_WAIT DIV 1000000 AS timer_us, SUM_LOCK_TIME DIV 1000000 AS lock_us, "
+    "       SUM_ROWS_EXAMINED AS rows_examined, SUM_ROWS_SENT AS rows_sent, "
+    "       SUM_NO_INDEX_USED AS no_index_used, SUM_ERRORS AS errors, FIRST_SEEN AS first_seen "
+    "  FROM performance_schema.events_statements_summary_by_digest "
+    " WHERE DIGEST IS NOT NULL "
+    "   AND (SCHEMA_NAME IS NULL OR SCHEMA_NAME NOT IN ('mysql','sys','performance_schema','information_schema'))"
+)
+
+ORDER_KEYS = {
+    'total': lambda d: d['total_latency_ms'],
+    'calls': lambda d: d['calls'],
+    'avg': lambda d: d['avg_latency_ms'],
+    'rows_examined': lambda d: d['rows_examined_per_call'],
+}
+
+
+class DigestHistoryService:
+    """performance_schema 语句摘要的周期快照与增量计算。
+
+    events_statements_summary_by_digest 是自实例启动（或上次 TRUNCATE）以来的累计值，
+    直接排序反映的是历史总量。这里按周期读取计数器，与本地保存的基线相减，
+    只把有执行的摘要的区间增量写入 digest_deltas；“最近 N 分钟 Top SQL”与
+    “性能退化”都在本地按时间窗口汇总增量得到，不再访问被监控实例。
+    每次只读取 LAST_SEEN 晚于上次快照的摘要；计数器变小视为被重置，以当前值作为增量。
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv('DIGEST_SNAPSHOT_INTERVAL', '300'))
+        self.retention_hours = float(os.getenv('DIGEST_SNAPSHOT_RETENTION_HOURS', '72'))
+        self.timeout = 10
+        self.running = False
+        self.app = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._last_purge: Optional[datetime] = None
+
+    # ---------- 后台线程 ----------
+    def start(self, app=None):
+        if self.running or self.interval <= 0:
+            return
+        self.running = True
+        self.app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='digest-snapshot')
+        self._thread.start()
+        print("SQL摘要快照服务已启动")
+
+    def stop(self):
+        self.running = False
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        print("SQL摘要快照服务已停止")
+
+    def _loop(self):
+        while self.running:
+            try:
+                if self.app:
+                    with self.app.app_context():
+                        self.snapshot_all()
+            except Exception as e:
+                logger.error(f"SQL摘要快照循环出错: {e}")
+            self._stop.wait(self.interval)
+
+    def snapshot_all(self):
+        for inst in instance_registry.all():
+            if (inst.db_type or '').strip() != 'MySQL' or not inst.is_monitoring or inst.status == 'error':
+                continue
+            self.snapshot(inst)
+        self._purge_expired()
+
+    def _lock_for(self, instance_id: int) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(instance_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[instance_id] = lock
+            return lock
+
+    # ---------- 快照 ----------
+    def snapshot(self, inst) -> Tuple[bool, int, str]:
+        """对一个实例做一次快照，返回 (ok, 本区间有执行的摘要数, 信息)。需在应用上下文中调用。"""
+        lock = self._lock_for(inst.id)
+        if not lock.acquire(blocking=False):
+            return True, 0, '快照进行中'
+        try:
+            return self._snapshot_locked(inst)
+        finally:
+            lock.release()
+
+    def _snapshot_locked(self, inst) -> Tuple[bool, int, str]:
+        prev = (
+            DigestSnapshot.query.filter(DigestSnapshot.instance_id == inst.id)
+            .order_by(DigestSnapshot.taken_at.desc(), DigestSnapshot.id.desc()).first()
+        )
+        try:
+            with mysql_pool.connection(inst, timeout=self.timeout) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT @@performance_schema AS ps, NOW() AS now")
+                    row = cur.fetchone() or {}
+                    if str(row.get('ps')) not in ('1', 'ON'):
+                        return False, 0, "performance_schema 未开启"
+                    server_time = row.get('now')
+                    if prev is not None:
+                        # 只读取上次快照之后执行过的摘要
+                        cur.execute(_DIGEST_SQL + " AND LAST_SEEN >= %s", (prev.server_time,))
+                    else:
+                        cur.execute(_DIGEST_SQL)
+                    rows = list(cur.fetchall() or [])
+        except Exception as e:
+            logger.error(f"读取SQL摘要失败(实例ID={inst.id}): {e}")
+            return False, 0, f"连接或查询失败: {e}"
+
+        try:
+            taken_at = datetime.utcnow()
+            baselines = {
+                (b.schema_name, b.digest): b
+                for b in DigestBaseline.query.filter(DigestBaseline.instance_id == inst.id)
+            }
+            snap = DigestSnapshot(
+                instance_id=inst.id, taken_at=taken_at, server_time=server_time,
+                interval_seconds=(server_time - prev.server_time).total_seconds() if prev is not None else None,
+            )
+            db.session.add(snap)
+            db.session.flush()
+
+            deltas: List[Dict[str, Any]] = []
+            new_baselines: List[Dict[str, Any]] = []
+            changed_baselines: List[Dict[str, Any]] = []
+            for r in rows:
+                current = {k: int(r.get(k) or 0) for k in COUNTERS}
+                key = (r.get('schema_name') or '', r.get('digest'))
+                base = baselines.get(key)
+                delta = None
+                if base is not None:
+                    if current['calls'] < base.calls:
+                        delta = current  # 计数器被重置（重启或 TRUNCATE）
+                    elif current['calls'] > base.calls:
+                        delta = {k: max(0, current[k] - getattr(base, k)) for k in COUNTERS}
+                elif prev is not None and r.get('first_seen') and r['first_seen'] >= prev.server_time:
+                    # 上次快照之后才出现的摘要，累计值即区间增量；更早出现但没有基线的只建立基线
+                    delta = current
+                if delta:
+                    deltas.append({
+                        'snapshot_id': snap.id, 'instance_id': inst.id, 'taken_at': taken_at,
+                        'schema_name': key[0], 'digest': key[1], **delta,
+                    })
+                values = {
+                    'instance_id': inst.id, 'schema_name': key[0], 'digest': key[1],
+                    'digest_text': r.get('digest_text') or '', 'updated_at': taken_at, **current,
+                }
+                if base is None:
+                    new_baselines.append(values)
+                elif delta:
+                    changed_baselines.append(values)
+
+            if deltas:
+                db.session.execute(insert(DigestDelta.__table__), deltas)
+            if new_baselines:
+                db.session.execute(insert(DigestBaseline.__table__), new_baselines)
+            if changed_baselines:
+                db.session.execute(update(DigestBaseline), changed_baselines)
+            snap.digests = len(deltas)
+            db.session.commit()
+            return True, len(deltas), 'OK'
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"保存SQL摘要快照失败(实例ID={inst.id}): {e}")
+            return False, 0, f"保存快照失败: {e}"
+
+    def _purge_expired(self):
+        """按保留时长清理快照与增量，每小时最多执行一次"""
+        now = datetime.utcnow()
+        if self.retention_hours <= 0 or (self._last_purge and now - self._last_purge < timedelta(hours=1)):
+            return
+        self._last_purge = now
+        try:
+            cutoff = now - timedelta(hours=self.retention_hours)
+            db.session.execute(delete(DigestDelta.__table__).where(DigestDelta.__table__.c.taken_at < cutoff))
+            db.session.execute(delete(DigestSnapshot.__table__).where(DigestSnapshot.__table__.c.taken_at < cutoff))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"清理过期SQL摘要快照失败: {e}")
+
+    def drop_instance(self, instance_id: int):
+        """实例删除后清理其快照、增量与基线（由调用方提交事务）"""
+        for model in (DigestDelta, DigestSnapshot, DigestBaseline):
+            table = model.__table__
+            db.session.execute(delete(table).where(table.c.instance_id == instance_id))
+
+    # ---------- 窗口查询 ----------
+    def _window(self, instance_id: int, since: datetime, until: datetime) -> Tuple[Dict[Tuple[str, str], Dict[str, int]], float]:
+        """汇总 (since, until] 内的增量，返回 ({(schema, digest): 计数}, 覆盖的秒数)"""
+        sums = [func.sum(getattr(DigestDelta, k)) for k in COUNTERS]
+        rows = (
+            db.session.query(DigestDelta.schema_name, DigestDelta.digest, *sums)
+            .filter(DigestDelta.instance_id == instance_id,
+                    DigestDelta.taken_at > since, DigestDelta.taken_at <= until)
+            .group_by(DigestDelta.schema_name, DigestDelta.digest)
+            .all()
+        )
+        covered = (
+            db.session.query(func.sum(DigestSnapshot.interval_seconds))
+            .filter(DigestSnapshot.instance_id == instance_id,
+                    DigestSnapshot.taken_at > since, DigestSnapshot.taken_at <= until)
+            .scalar()
+        ) or 0.0
+        result = {(r[0], r[1]): {k: int(v or 0) for k, v in zip(COUNTERS, r[2:])} for r in rows}
+        return result, float(covered)
+
+    def _texts(self, instance_id: int, keys) -> Dict[Tuple[str, str], str]:
+        digests = list({k[1] for k in keys})
+        texts: Dict[Tuple[str, str], str] = {}
+        for i in range(0, len(digests), 500):
+            for schema_name, digest, text in db.session.query(
+                DigestBaseline.schema_name, DigestBaseline.digest, DigestBaseline.digest_text
+            ).filter(DigestBaseline.instance_id == instance_id, DigestBaseline.digest.in_(digests[i:i + 500])):
+                texts[(schema_name, digest)] = text or ''
+        return texts
+
+    @staticmethod
+    def _rates(counters: Dict[str, int], seconds: float) -> Dict[str, Any]:
+        calls = counters['calls'] or 0
+        per_call = calls or 1
+        return {
+            'calls': calls,
+            'calls_per_sec': round(calls / seconds, 3) if seconds else None,
+            'total_latency_ms': round(counters['timer_us'] / 1000.0, 2),
+            'avg_latency_ms': round(counters['timer_us'] / 1000.0 / per_call, 3),
+            'lock_avg_ms': round(counters['lock_us'] / 1000.0 / per_call, 3),
+            'rows_examined_per_call': round(counters['rows_examined'] / per_call, 1),
+            'rows_sent_per_call': round(counters['rows_sent'] / per_call, 1),
+            'no_index_used': counters['no_index_used'],
+            'errors': counters['errors'],
+        }
+
+    def top(self, instance_id: int, minutes: float = 60, top: int = 20, order_by: str = 'total') -> Dict[str, Any]:
+        """最近 minutes 分钟内的 Top SQL（按区间增量计算的调用频率与单次耗时）"""
+        now = datetime.utcnow()
+        counters, covered = self._window(instance_id, now - timedelta(minutes=minutes), now)
+        key = ORDER_KEYS.get(order_by, ORDER_KEYS['total'])
+        items = [{'schema': k[0], 'digest': k[1], **self._rates(v, covered)} for k, v in counters.items()]
+        items = sorted(items, key=key, reverse=True)[:max(1, top)]
+        texts = self._texts(instance_id, [(i['schema'], i['digest']) for i in items])
+        for i in items:
+            i['query'] = texts.get((i['schema'], i['digest']), '')[:500]
+        return {
+            'minutes': minutes,
+            'covered_seconds': round(covered, 1),
+            'order_by': order_by if order_by in ORDER_KEYS else 'total',
+            'items': items,
+        }
+
+    def regressions(
+        self,
+        instance_id: int,
+        minutes: float = 60,
+        baseline_minutes: float = 1440,
+        ratio: float = 1.5,
+        min_calls: int = 10,
+        top: int = 20
+    ) -> Dict[str, Any]:
+        """对比最近 minutes 分钟与其之前 baseline_minutes 分钟的单次平均耗时，
+        找出变慢超过 ratio 倍的摘要，按额外消耗的总耗时排序"""
+        now = datetime.utcnow()
+        recent_since = now - timedelta(minutes=minutes)
+        recent, recent_covered = self._window(instance_id, recent_since, now)
+        baseline, baseline_covered = self._window(instance_id, recent_since - timedelta(minutes=baseline_minutes), recent_since)
+        items = []
+        for k, cur in recent.items():
+            base = baseline.get(k)
+            if not base or cur['calls'] < min_calls or base['calls'] < min_calls:
+                continue
+            cur_avg = cur['timer_us'] / cur['calls']
+            base_avg = base['timer_us'] / base['calls']
+            if base_avg <= 0 or cur_avg < base_avg * ratio:
+                continue
+            items.append({
+                'schema': k[0],
+                'digest': k[1],
+                'ratio': round(cur_avg / base_avg, 2),
+                # 若保持基线耗时，本窗口可少花的时间
+                'extra_latency_ms': round((cur_avg - base_avg) * cur['calls'] / 1000.0, 2),
+                'recent': self._rates(cur, recent_covered),
+                'baseline': self._rates(base, baseline_covered),
+            })
+        items = sorted(items, key=lambda i: i['extra_latency_ms'], reverse=True)[:max(1, top)]
+        texts = self._texts(instance_id, [(i['schema'], i['digest']) for i in items])
+        for i in items:
+            i['query'] = texts.get((i['schema'], i['digest']), '')[:500]
+        return {
+            'minutes': minutes,
+            'baseline_minutes': baseline_minutes,
+            'ratio': ratio,
+            'min_calls': min_calls,
+            'recent_covered_seconds': round(recent_covered, 1),
+            'baseline_covered_seconds': round(baseline_covered, 1),
+            'items': items,
+        }
+
+
+# 全局实例
+digest_history = DigestHistoryService()
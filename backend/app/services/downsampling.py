@@ -0,0 +1,94 @@
+import math
+from typing import List, Sequence, Tuple
+
+
+def _finite_points(timestamps: Sequence[float], values: Sequence[float]) -> Tuple[List[float], List[float]]:
+    """去掉缺失/非数值点（Prometheus 会返回 "NaN"）"""
+    xs: List[float] = []
+    ys: List[float] = []
+    for x, y in zip(timestamps, values):
+        if y is None or math.isnan(y) or math.isinf(y):
+            continue
+        xs.append(x)
+        ys.append(y)
+    return xs, ys
+
+
+def lttb(timestamps: Sequence[float], values: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    """Largest-Triangle-Three-Buckets 降采样，保留曲线形状的同时压缩到 threshold 个点"""
+    xs, ys = _finite_points(timestamps, values)
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return xs, ys
+
+    out_x = [xs[0]]
+    out_y = [ys[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点作为三角形第三个顶点
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        out_x.append(xs[best])
+        out_y.append(ys[best])
+        a = best
+
+    out_x.append(xs[-1])
+    out_y.append(ys[-1])
+    return out_x, out_y
+
+
+def min_max(timestamps: Sequence[float], values: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    """按时间等分为 threshold/2 个桶，每桶保留最小值和最大值（按时间先后输出），不丢失尖峰"""
+    xs, ys = _finite_points(timestamps, values)
+    n = len(xs)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return xs, ys
+
+    out_x: List[float] = []
+    out_y: List[float] = []
+    bucket_size = n / buckets
+    for i in range(buckets):
+        start = int(i * bucket_size)
+        end = min(int((i + 1) * bucket_size), n)
+        if start >= end:
+            continue
+        lo = hi = start
+        for j in range(start + 1, end):
+            if ys[j] < ys[lo]:
+                lo = j
+            if ys[j] > ys[hi]:
+                hi = j
+        for j in sorted({lo, hi}):
+            out_x.append(xs[j])
+            out_y.append(ys[j])
+    return out_x, out_y
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb,
+    'minmax': min_max,
+}
+
+
+def downsample(timestamps: Sequence[float], values: Sequence[float], threshold: int, method: str = 'lttb') -> Tuple[List[float], List[float]]:
+    """按方法降采样；method='none' 时只去掉非数值点"""
+    fn = DOWNSAMPLERS.get(method)
+    if fn is None:
+        return _finite_points(timestamps, values)
+    return fn(timestamps, values, threshold)
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+
+from .. import db
+from ..models import Instance, RegistryVersion
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceSnapshot:
+    """Instance 的只读快照：脱离 ORM 会话，可在任意线程读取。
+    属性名与 Instance 一致，服务层按 Instance 使用即可。"""
+
+    __slots__ = (
+        'id', 'instance_name', 'host', 'port', 'username', 'password', 'db_type', 'status',
+        'cpu_usage', 'memory_usage', 'storage', 'last_check_time', 'is_monitoring',
+        'connection_timeout', 'created_at',
+    )
+
+    def __init__(self, inst: Instance):
+        for name in self.__slots__:
+            setattr(self, name, getattr(inst, name))
+
+    # 序列化与连通性检查直接复用模型实现（只依赖上述属性）
+    to_dict = Instance.to_dict
+    is_connection_available = Instance.is_connection_available
+
+
+class InstanceRegistry:
+    """进程内实例注册表：热点路径按ID取实例无需访问元数据库。
+
+    - 增删改在同一事务中调用 bump_version() 递增 registry_versions 中的共享版本号，
+      提交后调用 mark_stale() 让本进程下次访问时重载；
+    - 多进程部署时，每隔 check_interval 秒最多读一次版本号，发现变化即整表重载。
+    """
+
+    NAME = 'instances'
+
+    def __init__(self):
+        self.check_interval = float(os.getenv('REGISTRY_VERSION_CHECK_SECONDS', '2'))
+        self._snapshots: Dict[int, InstanceSnapshot] = {}
+        self._version: Optional[int] = None
+        self._stale = True
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+    # ---------- 版本 ----------
+    def _read_version(self) -> int:
+        row = db.session.get(RegistryVersion, self.NAME)
+        return row.version if row else 0
+
+    def bump_version(self):
+        """在当前会话中递增共享版本号（随调用方的事务一起提交）"""
+        table = RegistryVersion.__table__
+        result = db.session.execute(
+            update(table).where(table.c.name == self.NAME).values(version=table.c.version + 1, updated_at=datetime.utcnow())
+        )
+        if not result.rowcount:
+            db.session.add(RegistryVersion(name=self.NAME, version=1))
+
+    def mark_stale(self):
+        """标记本进程快照失效，下次访问时重载"""
+        with self._lock:
+            self._stale = True
+
+    def invalidate(self):
+        """独立事务中递增版本号并标记本地失效（调用方已有事务时用 bump_version + mark_stale）"""
+        try:
+            self.bump_version()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"递增实例注册表版本失败: {e}")
+        self.mark_stale()
+
+    # ---------- 加载 ----------
+    def _reload(self, version: int):
+        instances = Instance.query.all()
+        snapshots = {inst.id: InstanceSnapshot(inst) for inst in instances}
+        with self._lock:
+            self._snapshots = snapshots
+            self._version = version
+            self._stale = False
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = self._stale
+            due = now - self._last_check >= self.check_interval
+            if not stale and not due:
+                return
+            self._last_check = now
+        try:
+            version = self._read_version()
+            if stale or version != self._version:
+                self._reload(version)
+        except Exception as e:
+            # 元数据库暂不可用时沿用已有快照
+            logger.warning(f"刷新实例注册表失败: {e}")
+
+    # ---------- 查询 ----------
+    def get(self, instance_id) -> Optional[InstanceSnapshot]:
+        try:
+            instance_id = int(instance_id)
+        except (TypeError, ValueError):
+            return None
+        self._ensure_fresh()
+        with self._lock:
+            return self._snapshots.get(instance_id)
+
+    def all(self) -> List[InstanceSnapshot]:
+        self._ensure_fresh()
+        with self._lock:
+            return sorted(self._snapshots.values(), key=lambda s: s.id)
+
+    def monitored(self) -> List[InstanceSnapshot]:
+        return [s for s in self.all() if s.is_monitoring]
+
+    def apply_status(self, instance_id: int, status: Optional[str], check_time: datetime):
+        """监控结果落库后同步到本地快照（不递增版本号）"""
+        with self._lock:
+            snap = self._snapshots.get(instance_id)
+            if snap is None:
+                return
+            if status is not None:
+                snap.status = status
+            snap.last_check_time = check_time
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'version': self._version,
+                'stale': self._stale,
+                'size': len(self._snapshots),
+            }
+
+
+# 全局实例
+instance_registry = InstanceRegistry()
@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .connection_pool import mysql_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _on(value: Any) -> bool:
+    return str(value or '').strip().lower() in ('1', 'on', 'yes', 'true')
+
+
+def _version_tuple(version: str):
+    m = re.match(r'(\d+)\.(\d+)\.(\d+)', version or '')
+    return tuple(int(x) for x in m.groups()) if m else (0, 0, 0)
+
+
+class InstanceStatusSnapshot:
+    """一次采集得到的实例全局变量、全局状态、版本与复制状态（只读，勿修改其中的字典）"""
+
+    __slots__ = ('instance_id', 'variables', 'status', 'version', 'replica', 'taken_at', 'elapsed_ms')
+
+    def __init__(self, instance_id: int, variables: Dict[str, str], status: Dict[str, str],
+                 replica: Optional[Dict[str, Any]], elapsed_ms: float):
+        self.instance_id = instance_id
+        self.variables = variables
+        self.status = status
+        self.version = (variables.get('version') or '').strip()
+        self.replica = replica
+        self.taken_at = time.monotonic()
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.taken_at
+
+    def slowlog_overview(self) -> Dict[str, Any]:
+        """慢日志相关开关，即 SlowLogService.analyze 返回的 overview"""
+        v = self.variables
+        long_query_time = v.get('long_query_time')
+        return {
+            'performance_schema': 'ON' if _on(v.get('performance_schema')) else 'OFF',
+            'slow_query_log': 'ON' if _on(v.get('slow_query_log')) else 'OFF',
+            'long_query_time': float(long_query_time) if str(long_query_time).replace('.', '', 1).isdigit() else long_query_time,
+            'log_output': str(v.get('log_output') or ''),
+            'slow_query_log_file': str(v.get('slow_query_log_file') or '').strip(),
+        }
+
+
+class InstanceSnapshotService:
+    """按实例缓存 InstanceStatusSnapshot。
+
+    配置分析、架构分析与慢日志分析都需要全局变量/状态，以前各自建连、各自执行
+    SHOW GLOBAL VARIABLES；这里在一个会话中用三条语句（变量、状态、复制状态）取全量，
+    在 ttl 秒内复用。同一实例的并发请求只会有一个去采集，其余等待其结果。
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv('INSTANCE_SNAPSHOT_TTL', '30'))
+        self.timeout = 10
+        self._cache: Dict[int, InstanceStatusSnapshot] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, instance_id: int) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(instance_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[instance_id] = lock
+            return lock
+
+    def get(self, inst, max_age: Optional[float] = None) -> InstanceStatusSnapshot:
+        """返回不超过 max_age 秒（默认 ttl）的快照，过期则重新采集；连接或查询失败时抛出异常"""
+        max_age = self.ttl if max_age is None else max_age
+        snap = self._cache.get(inst.id)
+        if snap is not None and snap.age <= max_age:
+            return snap
+        with self._lock_for(inst.id):
+            # 等锁期间可能已被其他线程刷新
+            snap = self._cache.get(inst.id)
+            if snap is not None and snap.age <= max_age:
+                return snap
+            snap = self._collect(inst)
+            self._cache[inst.id] = snap
+            return snap
+
+    def _collect(self, inst) -> InstanceStatusSnapshot:
+        started = time.monotonic()
+        with mysql_pool.connection(inst, timeout=self.timeout) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SHOW GLOBAL VARIABLES")
+                variables = {r['Variable_name']: r['Value'] for r in (cur.fetchall() or [])}
+                cur.execute("SHOW GLOBAL STATUS")
+                status = {r['Variable_name']: r['Value'] for r in (cur.fetchall() or [])}
+                # 8.0.22 起为 SHOW REPLICA STATUS，按版本选择，避免多执行一条失败的语句
+                version = variables.get('version') or ''
+                use_replica = _version_tuple(version) >= (8, 0, 22) and 'mariadb' not in version.lower()
+                replica = None
+                try:
+                    cur.execute("SHOW REPLICA STATUS" if use_replica else "SHOW SLAVE STATUS")
+                    replica = cur.fetchone() or None
+                except Exception as e:
+                    # 缺少 REPLICATION CLIENT 权限时按非从库处理
+                    logger.info(f"读取复制状态失败(实例ID={inst.id}): {e}")
+        return InstanceStatusSnapshot(inst.id, variables, status, replica, round((time.monotonic() - started) * 1000, 1))
+
+    def invalidate(self, instance_id: int):
+        self._cache.pop(instance_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'ttl': self.ttl,
+            'instances': len(self._cache),
+        }
+
+
+# 全局实例
+instance_snapshots = InstanceSnapshotService()
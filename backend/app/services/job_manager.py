@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .. import socketio
+
+logger = logging.getLogger(__name__)
+
+# 任务阶段：queued → collecting → explaining（仅 SQL 分析）→ llm → done / failed
+STAGES = ('queued', 'collecting', 'explaining', 'llm', 'done', 'failed')
+
+
+class JobQueueFull(Exception):
+    """排队与执行中的任务数已达上限"""
+
+
+class Job:
+    """一次后台分析任务。result 为与同步接口相同的响应体，status_code 为对应的 HTTP 状态码"""
+
+    __slots__ = ('id', 'kind', 'instance_id', 'stage', 'message', 'result', 'status_code',
+                 'created_at', 'started_at', 'finished_at', '_finished_mono')
+
+    def __init__(self, kind: str, instance_id: Optional[int]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.instance_id = instance_id
+        self.stage = 'queued'
+        self.message = None
+        self.result: Any = None
+        self.status_code: Optional[int] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._finished_mono: Optional[float] = None
+
+    def to_dict(self, with_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'jobId': self.id,
+            'kind': self.kind,
+            'instanceId': self.instance_id,
+            'stage': self.stage,
+            'message': self.message,
+            'createdAt': self.created_at.isoformat(),
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if with_result:
+            data['statusCode'] = self.status_code
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """LLM 相关分析的后台任务队列。
+
+    SQL/配置/架构分析会在 requests.post 上阻塞最长 DEEPSEEK_TIMEOUT 秒，
+    异步模式下请求线程只负责提交并立即返回 jobId，工作在有界线程池中执行；
+    阶段变化通过 Socket.IO 的 'job_progress' 事件推送（不含结果，结果体可能较大），
+    结果在 GET /api/jobs/<id> 保留 result_ttl 秒。排队+执行中的任务数超过 max_pending 时拒绝提交。
+    """
+
+    def __init__(self):
+        self.max_workers = int(os.getenv('JOB_MAX_WORKERS', '4'))
+        self.max_pending = int(os.getenv('JOB_MAX_PENDING', '32'))
+        self.result_ttl = float(os.getenv('JOB_RESULT_TTL', '600'))
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-job')
+        return self._executor
+
+    def submit(self, app, kind: str, instance_id: Optional[int], fn: Callable[[Callable[..., None]], Any]) -> Job:
+        """提交任务：fn(progress) 在应用上下文中执行，返回 (响应体, HTTP 状态码)；
+        progress(stage, message=None) 用于报告阶段。队列已满时抛出 JobQueueFull"""
+        job = Job(kind, instance_id)
+        with self._lock:
+            self._purge_expired()
+            if self._active >= self.max_pending:
+                raise JobQueueFull(f'分析任务排队已满（上限 {self.max_pending}），请稍后重试')
+            self._active += 1
+            self._jobs[job.id] = job
+        self._emit(job)
+        try:
+            self._get_executor().submit(self._run, app, job, fn)
+        except Exception:
+            with self._lock:
+                self._active -= 1
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def _run(self, app, job: Job, fn):
+        job.started_at = datetime.utcnow()
+
+        def progress(stage: str, message: Optional[str] = None):
+            job.stage = stage
+            job.message = message
+            self._emit(job)
+
+        stage, message = 'failed', None
+        try:
+            with app.app_context():
+                progress('collecting')
+                body, code = fn(progress)
+            job.result, job.status_code = body, code
+            if code < 400:
+                stage = 'done'
+            else:
+                message = (body or {}).get('error')
+        except Exception as e:
+            logger.exception(f"分析任务失败(job={job.id}, kind={job.kind})")
+            job.result, job.status_code = {'error': f'服务器错误: {e}'}, 500
+            message = str(e)
+        finally:
+            # 先写结果再切换阶段，轮询方看到 done/failed 时结果已就绪
+            job.finished_at = datetime.utcnow()
+            job._finished_mono = time.monotonic()
+            job.stage, job.message = stage, message
+            with self._lock:
+                self._active -= 1
+            self._emit(job)
+
+    def _emit(self, job: Job):
+        try:
+            socketio.emit('job_progress', job.to_dict(with_result=False), namespace='/')
+        except Exception as e:
+            logger.debug(f"推送任务进度失败: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def list(self, instance_id: Optional[int] = None, limit: int = 50) -> List[Job]:
+        with self._lock:
+            self._purge_expired()
+            jobs = [j for j in reversed(self._jobs.values()) if instance_id is None or j.instance_id == instance_id]
+        return jobs[:limit]
+
+    def _purge_expired(self):
+        """调用方需持有 _lock；按提交顺序遍历，已完成且超过 result_ttl 的任务移除"""
+        now = time.monotonic()
+        for job_id in [k for k, j in self._jobs.items()
+                       if j._finished_mono is not None and now - j._finished_mono > self.result_ttl]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'active': self._active,
+                'retained': len(self._jobs),
+            }
+
+
+# 全局实例
+job_manager = JobManager()
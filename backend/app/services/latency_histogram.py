@@ -0,0 +1,143 @@
+import operator
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Optional
+
+# 对数-线性分桶（HDR 风格）：每个 2 的幂区间再线性分为 SUB_BUCKETS/2 份，相对误差约 3%
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+
+
+def _bucket_index(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + ((value >> shift) - HALF_SUB_BUCKETS)
+
+
+def _bucket_bounds(index: int):
+    """桶覆盖的整数区间 [low, high]"""
+    if index < SUB_BUCKETS:
+        return index, index
+    shift = (index - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+    mantissa = (index - SUB_BUCKETS) % HALF_SUB_BUCKETS + HALF_SUB_BUCKETS
+    low = mantissa << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """定长对数-线性直方图：以微秒为单位记录，接口以毫秒输入输出。
+
+    内存固定（一个计数数组），记录 O(1)，分位数按桶中值估计；
+    超过 max_ms 的值计入最后一个桶。非线程安全，由调用方加锁。
+    """
+
+    __slots__ = ('max_value', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, max_ms: float = 60000):
+        self.max_value = int(max_ms * 1000)
+        self.counts = array('I', bytes(4 * (_bucket_index(self.max_value) + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, ms: float):
+        if ms is None or ms < 0:
+            return
+        value = min(int(ms * 1000), self.max_value)
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += ms
+        if self.min is None or ms < self.min:
+            self.min = ms
+        if self.max is None or ms > self.max:
+            self.max = ms
+
+    def merge(self, other: 'LatencyHistogram'):
+        if len(self.counts) == len(other.counts):
+            self.counts = array('I', map(operator.add, self.counts, other.counts))
+        else:
+            for i, c in enumerate(other.counts[:len(self.counts)]):
+                if c:
+                    self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            if seen >= rank:
+                low, high = _bucket_bounds(i)
+                value = (low + high) / 2 / 1000.0
+                # 估计值不越过实际观测的最值
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self, pcts: Iterable[float] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+        result: Dict[str, Optional[float]] = {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'min': round(self.min, 3) if self.min is not None else None,
+            'max': round(self.max, 3) if self.max is not None else None,
+        }
+        for p in pcts:
+            value = self.percentile(p)
+            result[f'p{int(p)}'] = round(value, 3) if value is not None else None
+        return result
+
+
+class WindowedHistogram:
+    """按时间窗口轮转的直方图：保留当前窗口与上一窗口，查询时合并两者，
+    因此结果覆盖最近 window ~ 2*window 秒，旧数据自然淘汰。线程安全。"""
+
+    def __init__(self, window_seconds: float = 300, max_ms: float = 60000):
+        self.window = window_seconds
+        self.max_ms = max_ms
+        self._current = LatencyHistogram(max_ms)
+        self._previous = LatencyHistogram(max_ms)
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _maybe_rotate(self, now: float):
+        elapsed = now - self._rotated_at
+        if elapsed < self.window:
+            return
+        if elapsed >= 2 * self.window:
+            # 超过两个窗口没有数据，上一窗口也已过期
+            self._previous = LatencyHistogram(self.max_ms)
+        else:
+            self._previous = self._current
+        self._current = LatencyHistogram(self.max_ms)
+        self._rotated_at = now
+
+    def record(self, ms: float):
+        with self._lock:
+            self._maybe_rotate(time.monotonic())
+            self._current.record(ms)
+
+    def snapshot(self) -> LatencyHistogram:
+        with self._lock:
+            self._maybe_rotate(time.monotonic())
+            merged = LatencyHistogram(self.max_ms)
+            merged.merge(self._previous)
+            merged.merge(self._current)
+        return merged
+
+    def percentile(self, pct: float) -> Optional[float]:
+        return self.snapshot().percentile(pct)
+
+    def summary(self, pcts: Iterable[float] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+        return self.snapshot().summary(pcts)
@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态：限流与服务端临时错误
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class LLMUnavailable(requests.RequestException):
+    """本地并发/限速等待超时，请求未发出（按传输失败处理，不重试）"""
+
+
+class LLMStreamInterrupted(requests.RequestException):
+    """流式输出中途断开：部分内容已回调给调用方，不重试"""
+
+
+class _TokenBucket:
+    """令牌桶限速：每秒补充 rate 个令牌，最多积累 burst 个"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def extract_json(content: str) -> Optional[Any]:
+    """解析模型输出的 JSON；模型仍包裹代码围栏或前后带噪声时，提取最外层花括号片段"""
+    content = (content or '').strip()
+    try:
+        return json.loads(content)
+    except Exception:
+        pass
+    start = content.find('{')
+    end = content.rfind('}')
+    if start != -1 and end != -1 and end > start:
+        try:
+            return json.loads(content[start:end + 1])
+        except Exception:
+            return None
+    return None
+
+
+class LLMClient:
+    """DeepSeek（OpenAI Chat Completions 兼容）共享客户端。
+
+    所有分析路径共用一个 keep-alive Session；同时在途的请求数受信号量限制，
+    发起速率受令牌桶限制（超出时在调用线程中等待，最长 DEEPSEEK_TIMEOUT 秒）。
+    429/5xx 与连接失败按带抖动的指数退避重试（429 优先遵循 Retry-After），
+    读超时不重试，避免调用方阻塞数倍超时。stream=True 时使用 SSE 流式输出，
+    超时按相邻数据块之间的间隔计算。DEEPSEEK_BASE_URL 可指向本地兼容桩服务用于测试。
+    """
+
+    def __init__(self):
+        self.max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', '2'))
+        self.backoff = float(os.getenv('LLM_RETRY_BACKOFF', '1'))
+        self.max_backoff = float(os.getenv('LLM_RETRY_MAX_BACKOFF', '10'))
+        self.stream = os.getenv('LLM_STREAM', 'false').lower() == 'true'
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._bucket = _TokenBucket(float(os.getenv('LLM_RATE_PER_MINUTE', '60')) / 60.0,
+                                    int(os.getenv('LLM_RATE_BURST', str(self.max_concurrency))))
+        # 使用默认值，首次调用时从 Flask 配置（无应用上下文时从环境变量）加载
+        self.enabled = True
+        self.base_url = 'https://api.deepseek.com'
+        self.api_key = None
+        self.model = 'deepseek-chat'
+        self.timeout = 30
+        self._config_loaded = False
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+
+    def _ensure_config(self):
+        if self._config_loaded:
+            return
+        with self._lock:
+            if self._config_loaded:
+                return
+            if has_app_context():
+                cfg = current_app.config
+                self.enabled = cfg.get('LLM_ENABLED', self.enabled)
+                self.base_url = cfg.get('DEEPSEEK_BASE_URL', self.base_url)
+                self.api_key = cfg.get('DEEPSEEK_API_KEY', self.api_key)
+                self.model = cfg.get('DEEPSEEK_MODEL', self.model)
+                self.timeout = cfg.get('DEEPSEEK_TIMEOUT', self.timeout)
+            else:
+                # 环境变量兜底
+                self.enabled = os.getenv('LLM_ENABLED', 'true').lower() == 'true'
+                self.base_url = os.getenv('DEEPSEEK_BASE_URL', self.base_url)
+                self.api_key = os.getenv('DEEPSEEK_API_KEY', self.api_key)
+                self.model = os.getenv('DEEPSEEK_MODEL', self.model)
+                self.timeout = int(os.getenv('DEEPSEEK_TIMEOUT', str(self.timeout)))
+            self.base_url = (self.base_url or '').rstrip('/')
+            self._config_loaded = True
+
+    def reload(self):
+        """下次调用时重新读取配置（配置变更或测试切换桩服务时使用）"""
+        self._config_loaded = False
+
+    def configured(self) -> bool:
+        self._ensure_config()
+        return bool(self.enabled and self.api_key)
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        max_tokens: int = 1000,
+        stream: Optional[bool] = None,
+        on_delta: Optional[Callable[[str], None]] = None
+    ) -> Optional[str]:
+        """返回模型输出文本；未启用/未配置时返回 None，请求失败时抛出异常。
+        on_delta 非空时强制流式，每收到一段文本回调一次"""
+        self._ensure_config()
+        if not (self.enabled and self.api_key):
+            return None
+        stream = bool(on_delta) or (self.stream if stream is None else stream)
+        payload = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+        }
+        if stream:
+            payload['stream'] = True
+
+        attempt = 0
+        while True:
+            try:
+                return self._request(payload, stream, on_delta)
+            except requests.RequestException as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    with self._lock:
+                        self._failures += 1
+                    raise
+                attempt += 1
+                with self._lock:
+                    self._retries += 1
+                logger.info(f"LLM 请求失败，{delay:.1f}s 后第 {attempt} 次重试: {e}")
+                time.sleep(delay)
+
+    def chat_json(self, messages: List[Dict[str, str]], **kwargs) -> Optional[Any]:
+        """chat 并解析 JSON 输出；输出不是合法 JSON 时返回 None，请求失败时抛出异常"""
+        content = self.chat(messages, **kwargs)
+        if content is None:
+            return None
+        return extract_json(content)
+
+    def _request(self, payload: Dict[str, Any], stream: bool, on_delta) -> str:
+        if not self._bucket.acquire(self.timeout):
+            raise LLMUnavailable('LLM 请求速率超过本地限制')
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise LLMUnavailable('LLM 并发请求数已达上限')
+        try:
+            with self._lock:
+                self._requests += 1
+            resp = self.session.post(
+                f"{self.base_url}/v1/chat/completions",
+                headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
+                json=payload, timeout=self.timeout, stream=stream
+            )
+            with resp:
+                resp.raise_for_status()
+                if stream:
+                    return self._read_stream(resp, on_delta)
+                data = resp.json()
+                return (((data.get('choices') or [{}])[0].get('message') or {}).get('content') or '').strip()
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    def _read_stream(resp, on_delta) -> str:
+        parts = []
+        try:
+            for line in resp.iter_lines(decode_unicode=False):
+                if not line or not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                delta = ((chunk.get('choices') or [{}])[0].get('delta') or {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    if on_delta:
+                        on_delta(delta)
+        except requests.RequestException as e:
+            # requests 在读取流时把读超时包装为 ConnectionError，这里统一为不可重试
+            raise LLMStreamInterrupted(f'流式输出中断: {e}') from e
+        return ''.join(parts).strip()
+
+    def _retry_delay(self, error: requests.RequestException, attempt: int) -> Optional[float]:
+        """可重试时返回等待秒数，否则 None"""
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, requests.HTTPError):
+            resp = error.response
+            status = resp.status_code if resp is not None else None
+            if status not in RETRY_STATUS:
+                return None
+            retry_after = resp.headers.get('Retry-After') if resp is not None else None
+            if retry_after and retry_after.strip().isdigit():
+                return min(float(retry_after), self.max_backoff)
+        elif not isinstance(error, requests.ConnectionError):
+            # 读超时（已等满 timeout）、流式中断与本地限流不重试
+            return None
+        # 全抖动退避：[0, min(max_backoff, backoff * 2^attempt)]
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'requests': self._requests,
+                'retries': self._retries,
+                'failures': self._failures,
+            }
+
+
+# 全局实例
+llm_client = LLMClient()
@@ -0,0 +1,136 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .prometheus_service import prometheus_service
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSubscription:
+    """单个 SSE 客户端的订阅：有界队列，写满即视为慢消费者并被摘除"""
+
+    def __init__(self, key: Tuple[str, int], maxsize: int):
+        self.key = key
+        self.queue: 'queue.Queue[Tuple[str, Dict[str, Any], Optional[str]]]' = queue.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def get(self, timeout: float) -> Optional[Tuple[str, Dict[str, Any], Optional[str]]]:
+        """取下一条事件 (event, data, id)；超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Poller:
+    def __init__(self, key: Tuple[str, int]):
+        self.key = key
+        self.subscribers = set()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_event = None
+        self.consecutive_errors = 0
+
+
+class MetricsBroadcaster:
+    """按 (service, interval) 共享的指标轮询器。
+
+    每个键只有一个后台线程调用 prometheus_service.get_all_metrics，
+    结果扇出到所有订阅者的有界队列；最后一个订阅者离开时轮询线程退出。
+    """
+
+    def __init__(self):
+        self.queue_size = int(os.getenv('METRICS_STREAM_QUEUE_SIZE', '10'))
+        self.min_interval = int(os.getenv('METRICS_STREAM_MIN_INTERVAL', '1'))
+        self.max_consecutive_errors = 3
+        self._pollers: Dict[Tuple[str, int], _Poller] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, service: str, interval: int, app=None) -> MetricsSubscription:
+        """订阅指定服务的指标；app 用于在轮询线程中建立应用上下文"""
+        key = (service, max(self.min_interval, int(interval)))
+        sub = MetricsSubscription(key, self.queue_size)
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                poller = _Poller(key)
+                self._pollers[key] = poller
+                poller.thread = threading.Thread(
+                    target=self._poll_loop, args=(poller, app), daemon=True,
+                    name=f'metrics-poller-{key[0]}-{key[1]}'
+                )
+                poller.thread.start()
+            elif poller.last_event is not None:
+                # 新订阅者先拿到最近一次样本，无需等待下个周期
+                sub.queue.put_nowait(poller.last_event)
+            poller.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: MetricsSubscription):
+        with self._lock:
+            poller = self._pollers.get(sub.key)
+            if poller is None:
+                return
+            poller.subscribers.discard(sub)
+            if not poller.subscribers:
+                poller.stop_event.set()
+                del self._pollers[sub.key]
+
+    def _sample(self, poller: _Poller):
+        service = poller.key[0]
+        try:
+            metrics = prometheus_service.get_all_metrics(service)
+            poller.consecutive_errors = 0
+            return ('metrics', metrics, str(int(time.time())))
+        except Exception as e:
+            poller.consecutive_errors += 1
+            logger.error(f"Error getting metrics for {service}: {str(e)}")
+            if poller.consecutive_errors >= self.max_consecutive_errors:
+                logger.warning(f"Too many consecutive errors ({poller.consecutive_errors}) for service {service}, continuing...")
+                message = f'连续获取指标失败，服务可能不可用: {str(e)}'
+            else:
+                message = str(e)
+            return ('error', {'message': message, 'consecutive_errors': poller.consecutive_errors}, None)
+
+    def _publish(self, poller: _Poller, item):
+        with self._lock:
+            poller.last_event = item if item[0] == 'metrics' else poller.last_event
+            subscribers = list(poller.subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(item)
+            except queue.Full:
+                # 慢消费者：摘除订阅，由其 SSE 生成器发现后结束连接
+                sub.dropped = True
+                logger.info(f"Dropping slow metrics subscriber for {poller.key}")
+                self.unsubscribe(sub)
+
+    def _poll_loop(self, poller: _Poller, app):
+        interval = poller.key[1]
+        while not poller.stop_event.is_set():
+            started = time.monotonic()
+            if app is not None:
+                with app.app_context():
+                    item = self._sample(poller)
+            else:
+                item = self._sample(poller)
+            self._publish(poller, item)
+            poller.stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+        logger.info(f"Metrics poller stopped for {poller.key}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pollers': [
+                    {'service': key[0], 'interval': key[1], 'subscribers': len(p.subscribers)}
+                    for key, p in self._pollers.items()
+                ]
+            }
+
+
+# 全局实例
+metrics_broadcaster = MetricsBroadcaster()
@@ -1,9 +1,18 @@
+import os
 import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import Any, Dict, Tuple
 from flask_socketio import emit
 from .. import db, socketio
 from ..models import Instance
+from .db_validator import db_validator
+from .probe_scheduler import ProbeScheduler
+from .status_buffer import status_buffer
+from .instance_registry import instance_registry
+from .timeseries_store import timeseries_store
+from .probe_latency import probe_latency
 
 
 class InstanceMonitorService:
@@ -12,13 +21,22 @@ class InstanceMonitorService:
     def __init__(self):
         self.monitoring = False
         self.monitor_thread = None
-        self.check_interval = 5  # 5秒检查一次
+        self.check_interval = 5  # 最小探测间隔；也是刷新监控实例列表的周期
+        self.max_tick = 1.0  # 主循环最长休眠时间（秒）
+        # 并发探活：有界线程池，单个探测的截止时间取实例的 connection_timeout
+        self.max_workers = int(os.getenv('MONITOR_MAX_WORKERS', '16'))
+        self.scheduler = ProbeScheduler(min_interval=self.check_interval)
+        self._executor = None
+        self._inflight: Dict[int, Any] = {}  # instance_id -> Future
+        self._targets: Dict[int, Dict[str, Any]] = {}  # instance_id -> 探测参数
+        self._last_refresh = 0.0
     
     def start_monitoring(self, app=None):
         """启动监控服务"""
         if not self.monitoring:
             self.monitoring = True
             self.app = app  # 保存应用实例
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='instance-probe')
             self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
             self.monitor_thread.start()
             print("实例监控服务已启动")
@@ -28,60 +46,135 @@ class InstanceMonitorService:
         self.monitoring = False
         if self.monitor_thread:
             self.monitor_thread.join(timeout=1)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._inflight.clear()
         print("实例监控服务已停止")
     
     def _monitor_loop(self):
-        """监控循环"""
+        """监控循环：提交到期探测、收集已完成结果，然后休眠到下一个到期时刻"""
         while self.monitoring:
             try:
                 # 使用保存的应用实例
                 if self.app:
                     with self.app.app_context():
-                        self._check_all_instances()
+                        self._run_due_checks()
                 else:
                     print('无法获取Flask应用实例，跳过本次检查')
                     
-                time.sleep(self.check_interval)
+                self._wait_for_work()
             except Exception as e:
                 print(f"监控循环出错: {e}")
                 time.sleep(self.check_interval)
     
-    def _check_all_instances(self):
-        """检查所有实例状态"""
-        instances = Instance.query.filter_by(is_monitoring=True).all()
+    def _refresh_targets(self):
+        """刷新需监控的实例及其探测参数（取自实例注册表，无需每次访问元数据库）"""
+        instances = instance_registry.monitored()
+        self._targets = {instance.id: self._build_target(instance) for instance in instances}
+        self.scheduler.sync((instance.id, instance.status) for instance in instances)
+        self._last_refresh = time.monotonic()
+    
+    @staticmethod
+    def _build_target(instance) -> Dict[str, Any]:
+        return {
+            'instance_id': instance.id,
+            'db_type': instance.db_type,
+            'host': instance.host,
+            'port': instance.port,
+            'username': instance.username or '',
+            'password': instance.password or '',
+            'timeout': instance.connection_timeout or None,
+            'instance_name': instance.instance_name,
+            'status': status_buffer.overlay(instance.id, instance.status, None)[0],
+        }
+    
+    def _run_due_checks(self):
+        if time.monotonic() - self._last_refresh >= self.check_interval:
+            self._refresh_targets()
         
-        for instance in instances:
-            old_status = instance.status
-            new_status = self._check_instance_status(instance)
-            
-            if old_status != new_status:
-                # 状态发生变化，更新数据库并推送WebSocket事件
-                instance.update_status(new_status)
-                self._emit_status_change(instance)
-                print(f"实例 {instance.instance_name} 状态变化: {old_status} -> {new_status}")
-            else:
-                # 状态未变化，仅更新检查时间
-                instance.last_check_time = datetime.utcnow()
-                db.session.commit()
+        for instance_id in self.scheduler.pop_due():
+            target = self._targets.get(instance_id)
+            if target is None or instance_id in self._inflight:
+                continue
+            self._inflight[instance_id] = self._executor.submit(self._check_instance_status, target)
+        
+        self._collect_results()
+        status_buffer.flush()
+    
+    def _wait_for_work(self):
+        """休眠到下一个到期时刻；期间有探测完成则提前醒来收集结果"""
+        timeout = self.max_tick
+        until_due = self.scheduler.seconds_until_next_due()
+        if until_due is not None:
+            timeout = min(timeout, until_due)
+        if status_buffer.has_pending_transitions():
+            timeout = min(timeout, status_buffer.flush_interval)
+        if self._inflight:
+            wait(list(self._inflight.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+        elif timeout > 0:
+            time.sleep(timeout)
+    
+    def _collect_results(self):
+        """收集已完成的探测：写入状态缓冲、推送变化并重新排期（落库由 status_buffer 批量完成）"""
+        now = datetime.utcnow()
+        for instance_id, future in list(self._inflight.items()):
+            if not future.done():
+                continue
+            del self._inflight[instance_id]
+            new_status, timings = future.result()
+            self.scheduler.record(instance_id, new_status)
+            self._record_probe(instance_id, new_status, timings.get('total_ms'))
+            target = self._targets.get(instance_id)
+            if target is None:
+                continue  # 探测期间实例已被移除或停止监控
+            old_status = target['status']
+            changed = old_status != new_status
+            status_buffer.record(instance_id, new_status, now, changed)
+            if changed:
+                target['status'] = new_status
+                # 状态发生变化，推送WebSocket事件
+                self._emit_status_change(instance_id, target['instance_name'], new_status, now)
+                print(f"实例 {target['instance_name']} 状态变化: {old_status} -> {new_status}")
     
-    def _check_instance_status(self, instance):
-        """检查单个实例状态"""
+    def _record_probe(self, instance_id, status, latency_ms=None):
+        """探测结果写入本地时间序列：up 为 1/0，probe_ms 仅记录成功探测的耗时"""
+        scope = f'instance:{instance_id}'
+        is_up = status in ('running', 'degraded')
+        timeseries_store.record(scope, 'up', 1.0 if is_up else 0.0)
+        if is_up and latency_ms is not None:
+            timeseries_store.record(scope, 'probe_ms', latency_ms)
+    
+    def _check_instance_status(self, target: Dict[str, Any]) -> Tuple[str, Dict[str, float]]:
+        """检查单个实例状态（在探测线程中执行），返回 (状态, 分阶段耗时毫秒)。
+        可连通但延迟分位数超过阈值时判定为 degraded。"""
+        started = time.perf_counter()
         try:
-            if instance.is_connection_available():
-                return 'running'
-            else:
-                return 'error'
+            is_ok, _, timings = db_validator.probe(
+                db_type=target['db_type'],
+                host=target['host'],
+                port=target['port'],
+                username=target['username'],
+                password=target['password'],
+                instance_id=target['instance_id'],
+                timeout=target['timeout']
+            )
+            if not is_ok:
+                return 'error', timings
+            probe_latency.record(target['instance_id'], timings)
+            return ('degraded' if probe_latency.evaluate(target['instance_id']) else 'running'), timings
         except Exception as e:
-            print(f"检查实例 {instance.instance_name} 状态时出错: {e}")
-            return 'error'
+            print(f"检查实例 {target['instance_id']} 状态时出错: {e}")
+            return 'error', {'total_ms': (time.perf_counter() - started) * 1000}
     
-    def _emit_status_change(self, instance):
+    def _emit_status_change(self, instance_id, instance_name, status, check_time):
         """推送状态变化事件"""
         socketio.emit('status_change', {
-            'instanceId': instance.id,
-            'instanceName': instance.instance_name,
-            'status': instance.status,
-            'lastCheckTime': instance.last_check_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'instanceId': instance_id,
+            'instanceName': instance_name,
+            'status': status,
+            'lastCheckTime': check_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'latencyP95Ms': probe_latency.p95(instance_id),
             'timestamp': datetime.utcnow().isoformat()
         }, namespace='/')
     
@@ -95,18 +188,25 @@ class InstanceMonitorService:
             if not instance:
                 return None
             
-            # 检查连接状态
-            is_available = instance.is_connection_available()
-            new_status = 'running' if is_available else 'error'
+            # 检查连接状态（与监控线程相同的探测与 degraded 判定）
+            new_status, timings = self._check_instance_status(self._build_target(instance))
+            self._record_probe(instance.id, new_status, timings.get('total_ms'))
+            
+            # 更新状态：经状态缓冲立即落库，避免与监控线程的待写记录互相覆盖
+            old_status = status_buffer.overlay(instance.id, instance.status, None)[0]
+            check_time = datetime.utcnow()
+            status_buffer.record(instance.id, new_status, check_time, old_status != new_status)
+            status_buffer.flush(force=True)
+            target = self._targets.get(instance.id)
+            if target is not None:
+                target['status'] = new_status
             
-            # 更新状态
-            old_status = instance.status
-            instance.update_status(new_status)
-            db.session.commit()
+            # 手动检查后回到最小探测间隔
+            self.scheduler.reset(instance_id, new_status)
             
             # 如果状态发生变化，推送WebSocket事件
             if old_status != new_status:
-                self._emit_status_change(instance)
+                self._emit_status_change(instance.id, instance.instance_name, new_status, check_time)
             
             return instance.to_dict()
             
@@ -0,0 +1,104 @@
+import os
+import threading
+from typing import Dict, Optional
+
+from .latency_histogram import WindowedHistogram
+
+# 探测各阶段：TCP 建连、MySQL 握手+认证、ping 往返、整次探测
+PROBE_PHASES = ('connect', 'auth', 'ping', 'total')
+
+
+class ProbeLatencyTracker:
+    """按实例保存各探测阶段的滑动窗口延迟直方图，并据阈值判定 degraded。
+
+    - connect/auth 只在新建连接时产生：探测每 PROBE_FRESH_CONNECT_INTERVAL 秒用独立新连接测一次，
+      复用池中连接时没有握手；
+    - ping/total 每次成功探测都会记录；
+    - 任一阶段 p95 超过阈值（且样本数足够）即判定为 degraded，
+      回落到阈值 × recover_ratio 以下才恢复，避免在阈值附近来回抖动。
+    """
+
+    def __init__(self):
+        self.window_seconds = float(os.getenv('PROBE_LATENCY_WINDOW_SECONDS', '300'))
+        self.min_samples = int(os.getenv('PROBE_DEGRADED_MIN_SAMPLES', '5'))
+        self.recover_ratio = float(os.getenv('PROBE_DEGRADED_RECOVER_RATIO', '0.8'))
+        # p95 阈值（毫秒），0 表示不参与判定
+        self.thresholds = {
+            'connect': float(os.getenv('PROBE_DEGRADED_CONNECT_P95_MS', '1000')),
+            'auth': float(os.getenv('PROBE_DEGRADED_AUTH_P95_MS', '1000')),
+            'ping': float(os.getenv('PROBE_DEGRADED_PING_P95_MS', '200')),
+            'total': float(os.getenv('PROBE_DEGRADED_TOTAL_P95_MS', '0')),
+        }
+        self._histograms: Dict[int, Dict[str, WindowedHistogram]] = {}
+        self._degraded: Dict[int, bool] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, instance_id: int) -> Dict[str, WindowedHistogram]:
+        with self._lock:
+            hists = self._histograms.get(instance_id)
+            if hists is None:
+                hists = {phase: WindowedHistogram(self.window_seconds) for phase in PROBE_PHASES}
+                self._histograms[instance_id] = hists
+            return hists
+
+    def record(self, instance_id: int, timings: Dict[str, Optional[float]]):
+        """记录一次成功探测的分阶段耗时（毫秒）"""
+        hists = self._get(instance_id)
+        for phase in PROBE_PHASES:
+            value = timings.get(f'{phase}_ms')
+            if value is not None:
+                hists[phase].record(value)
+
+    def evaluate(self, instance_id: int) -> bool:
+        """按阈值（带回差）判定实例是否处于 degraded，并记住结果"""
+        hists = self._get(instance_id)
+        with self._lock:
+            was_degraded = self._degraded.get(instance_id, False)
+        degraded = False
+        for phase, threshold in self.thresholds.items():
+            if threshold <= 0:
+                continue
+            snap = hists[phase].snapshot()
+            if snap.count < self.min_samples:
+                continue
+            p95 = snap.percentile(95)
+            limit = threshold * self.recover_ratio if was_degraded else threshold
+            if p95 is not None and p95 > limit:
+                degraded = True
+                break
+        with self._lock:
+            self._degraded[instance_id] = degraded
+        return degraded
+
+    def summary(self, instance_id: int) -> Dict[str, object]:
+        with self._lock:
+            hists = self._histograms.get(instance_id)
+            degraded = self._degraded.get(instance_id, False)
+        phases = {phase: (hists[phase].summary() if hists else None) for phase in PROBE_PHASES}
+        return {
+            'windowSeconds': self.window_seconds,
+            'degraded': degraded,
+            'thresholdsP95Ms': self.thresholds,
+            'phases': phases,
+        }
+
+    def p95(self, instance_id: int) -> Dict[str, Optional[float]]:
+        """各阶段 p95（用于 status_change 推送，保持负载精简）"""
+        with self._lock:
+            hists = self._histograms.get(instance_id)
+        if not hists:
+            return {}
+        result = {}
+        for phase in PROBE_PHASES:
+            value = hists[phase].percentile(95)
+            result[phase] = round(value, 3) if value is not None else None
+        return result
+
+    def drop(self, instance_id: int):
+        with self._lock:
+            self._histograms.pop(instance_id, None)
+            self._degraded.pop(instance_id, None)
+
+
+# 全局实例
+probe_latency = ProbeLatencyTracker()
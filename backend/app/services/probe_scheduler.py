@@ -0,0 +1,138 @@
+import heapq
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class _ScheduleEntry:
+    __slots__ = ('instance_id', 'interval', 'next_due', 'last_status', 'streak')
+
+    def __init__(self, instance_id: int, interval: float, next_due: float, last_status: Optional[str]):
+        self.instance_id = instance_id
+        self.interval = interval
+        self.next_due = next_due
+        self.last_status = last_status
+        self.streak = 0  # 连续保持当前状态的探测次数
+
+
+class ProbeScheduler:
+    """按实例独立间隔调度探活（以下次到期时间为键的小顶堆）。
+
+    - 状态翻转后间隔回落到 min_interval，尽快确认新状态；
+    - 持续 running 时按 healthy_growth 缓慢放大，上限 max_healthy_interval；
+    - 持续 error 时指数退避，上限 max_error_interval，避免反复耗尽连接超时；
+    - 每次排期叠加 ±jitter 比例的随机抖动，错开探测时刻。
+    """
+
+    def __init__(self, min_interval: float = 5):
+        self.min_interval = float(min_interval)
+        self.max_healthy_interval = float(os.getenv('MONITOR_MAX_HEALTHY_INTERVAL', '30'))
+        self.max_error_interval = float(os.getenv('MONITOR_MAX_ERROR_INTERVAL', '300'))
+        self.healthy_growth = float(os.getenv('MONITOR_HEALTHY_GROWTH', '1.5'))
+        self.error_backoff = float(os.getenv('MONITOR_ERROR_BACKOFF', '2'))
+        self.jitter = float(os.getenv('MONITOR_JITTER', '0.2'))
+        self._entries: Dict[int, _ScheduleEntry] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._lock = threading.Lock()
+
+    def _jittered(self, interval: float) -> float:
+        if self.jitter <= 0:
+            return interval
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _push(self, entry: _ScheduleEntry, due: float):
+        entry.next_due = due
+        heapq.heappush(self._heap, (due, entry.instance_id))
+
+    def sync(self, instances: Iterable[Tuple[int, Optional[str]]], now: Optional[float] = None):
+        """与当前需监控的实例集合对齐：新实例在一个最小间隔内随机排期，已移除的实例不再调度"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            seen = set()
+            for instance_id, status in instances:
+                seen.add(instance_id)
+                if instance_id not in self._entries:
+                    entry = _ScheduleEntry(instance_id, self.min_interval, now, status)
+                    self._entries[instance_id] = entry
+                    self._push(entry, now + random.uniform(0, self.min_interval))
+            for instance_id in list(self._entries):
+                if instance_id not in seen:
+                    # 堆中的旧条目在弹出时按惰性删除处理
+                    del self._entries[instance_id]
+
+    def pop_due(self, now: Optional[float] = None) -> List[int]:
+        """弹出所有已到期的实例ID；调用方探测完成后需调用 record() 重新排期"""
+        now = time.monotonic() if now is None else now
+        due: List[int] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                ts, instance_id = heapq.heappop(self._heap)
+                entry = self._entries.get(instance_id)
+                if entry is None or entry.next_due != ts:
+                    continue  # 已删除或已被重新排期的过期条目
+                entry.next_due = float('inf')
+                due.append(instance_id)
+        return due
+
+    def record(self, instance_id: int, status: str, now: Optional[float] = None) -> Optional[float]:
+        """记录一次探测结果并按新状态重新排期，返回新的间隔（秒）"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(instance_id)
+            if entry is None:
+                return None
+            if status != entry.last_status:
+                entry.interval = self.min_interval
+                entry.streak = 0
+            elif status == 'error':
+                entry.interval = min(entry.interval * self.error_backoff, self.max_error_interval)
+                entry.streak += 1
+            else:
+                entry.interval = min(entry.interval * self.healthy_growth, self.max_healthy_interval)
+                entry.streak += 1
+            entry.last_status = status
+            self._push(entry, now + self._jittered(entry.interval))
+            return entry.interval
+
+    def reset(self, instance_id: int, status: Optional[str] = None, now: Optional[float] = None):
+        """手动检查等场景：间隔回落到最小值并按最小间隔重新排期"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(instance_id)
+            if entry is None:
+                return
+            entry.interval = self.min_interval
+            entry.streak = 0
+            if status is not None:
+                entry.last_status = status
+            if entry.next_due != float('inf'):
+                # 正在探测中的实例由 record() 负责排期
+                self._push(entry, now + self._jittered(entry.interval))
+
+    def seconds_until_next_due(self, now: Optional[float] = None) -> Optional[float]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._heap:
+                ts, instance_id = self._heap[0]
+                entry = self._entries.get(instance_id)
+                if entry is None or entry.next_due != ts:
+                    heapq.heappop(self._heap)
+                    continue
+                return max(0.0, ts - now)
+        return None
+
+    def snapshot(self, now: Optional[float] = None) -> List[Dict[str, object]]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [
+                {
+                    'instanceId': e.instance_id,
+                    'status': e.last_status,
+                    'interval': round(e.interval, 2),
+                    'streak': e.streak,
+                    'nextDueIn': None if e.next_due == float('inf') else round(max(0.0, e.next_due - now), 2),
+                }
+                for e in self._entries.values()
+            ]
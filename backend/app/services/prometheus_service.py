@@ -1,18 +1,61 @@
+import math
+import os
 import requests
 import logging
-from typing import Dict, Optional, Any
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Any, Tuple
+from requests.adapters import HTTPAdapter
 from flask import current_app
+from .downsampling import downsample
+from .timeseries_store import timeseries_store
 
 logger = logging.getLogger(__name__)
 
+# PromQL templates shared by instant queries and history charts - adjust based on your Prometheus setup
+CPU_QUERY = '100 - (avg(irate(node_cpu_seconds_total{{mode="idle",instance=~".*{service}.*"}}[5m])) * 100)'
+MEMORY_QUERY = '(1 - (node_memory_MemAvailable_bytes{{instance=~".*{service}.*"}} / node_memory_MemTotal_bytes{{instance=~".*{service}.*"}})) * 100'
+DISK_USAGE_QUERY = '(1 - node_filesystem_free_bytes{{instance=~".*{service}.*",fstype!="tmpfs"}} / node_filesystem_size_bytes{{instance=~".*{service}.*",fstype!="tmpfs"}}) * 100'
+
+HISTORY_QUERIES = {
+    'cpu': CPU_QUERY,
+    'memory': MEMORY_QUERY,
+    'disk': DISK_USAGE_QUERY,
+}
+
+# Prometheus rejects range queries resolving to more than 11000 points per series
+MAX_RANGE_POINTS = 11000
+
 
 class PrometheusService:
-    """Prometheus service for querying metrics data"""
-    
+    """Prometheus service for querying metrics data.
+
+    Queries share one keep-alive ``requests.Session`` and run concurrently on a
+    small thread pool. Instant query results are cached per (query, step-aligned
+    timestamp), so any number of dashboards polling the same service within one
+    step cost a single Prometheus request; concurrent misses for the same key
+    wait on the first request instead of issuing their own.
+    """
+
+    RAW_POINTS_FACTOR = 4
+
     def __init__(self):
         self.base_url = None
         self.timeout = 10
-    
+        self.cache_step = int(os.getenv('PROMETHEUS_CACHE_STEP', '5'))  # seconds
+        self.max_workers = int(os.getenv('PROMETHEUS_MAX_WORKERS', '8'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers * 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='prometheus')
+        self._cache: Dict[Tuple, Tuple[float, Optional[Dict[str, Any]]]] = {}
+        self._inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
     def _get_base_url(self) -> str:
         """Get Prometheus base URL from config"""
         if not self.base_url:
@@ -21,115 +64,291 @@ class PrometheusService:
             if self.base_url.endswith('/classic/graph'):
                 self.base_url = self.base_url.replace('/classic/graph', '')
         return self.base_url
-    
-    def _query_prometheus(self, query: str) -> Optional[Dict[str, Any]]:
-        """Execute PromQL query against Prometheus API"""
+
+    def _aligned_now(self) -> int:
+        step = max(1, self.cache_step)
+        return int(time.time()) // step * step
+
+    def _fetch(self, query: str, ts: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Execute PromQL instant query against Prometheus API (uncached)"""
         try:
             url = f"{self._get_base_url()}/api/v1/query"
             params = {'query': query}
-            
-            response = requests.get(url, params=params, timeout=self.timeout)
+            if ts is not None:
+                params['time'] = ts
+
+            response = self.session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
-            
+
             data = response.json()
             if data.get('status') == 'success':
                 return data.get('data', {})
             else:
                 logger.error(f"Prometheus query failed: {data.get('error', 'Unknown error')}")
                 return None
-                
+
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to query Prometheus: {e}")
             return None
         except Exception as e:
             logger.error(f"Unexpected error querying Prometheus: {e}")
             return None
-    
+
+    def _fetch_range(self, query: str, start: int, end: int, step: int) -> Optional[Dict[str, Any]]:
+        """Execute PromQL range query against Prometheus API (uncached)"""
+        try:
+            url = f"{self._get_base_url()}/api/v1/query_range"
+            params = {'query': query, 'start': start, 'end': end, 'step': step}
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+
+            data = response.json()
+            if data.get('status') == 'success':
+                return data.get('data', {})
+            else:
+                logger.error(f"Prometheus range query failed: {data.get('error', 'Unknown error')}")
+                return None
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to query Prometheus range: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error querying Prometheus range: {e}")
+            return None
+
+    def _cached(self, key: Tuple, ttl: float, fetch: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Serve ``fetch()`` through the result cache, sharing concurrent misses for the same key"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                self._hits += 1
+                return cached[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self._misses += 1
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self._hits += 1
+
+        if not owner:
+            return future.result()
+
+        result = None
+        try:
+            result = fetch()
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                # Failed queries are not cached so the next poll retries
+                if result is not None:
+                    self._cache[key] = (now + ttl, result)
+                self._prune(now)
+            future.set_result(result)
+        return result
+
+    def _query_prometheus(self, query: str) -> Optional[Dict[str, Any]]:
+        """Execute PromQL query, served from the step-aligned cache when possible"""
+        if self.cache_step <= 0:
+            return self._fetch(query, None)
+        ts = self._aligned_now()
+        return self._cached((query, ts), self.cache_step, lambda: self._fetch(query, ts))
+
+    def query_range(self, query: str, start: int, end: int, step: int) -> Optional[Dict[str, Any]]:
+        """Execute PromQL range query; start/end are aligned to step so repeated chart loads hit the cache"""
+        step = max(1, int(step))
+        start = int(start) // step * step
+        end = int(end) // step * step
+        if self.cache_step <= 0:
+            return self._fetch_range(query, start, end, step)
+        # The newest bucket changes every step, so cache for at least one instant-cache step
+        ttl = max(self.cache_step, min(step, 60))
+        return self._cached(('range', query, start, end, step), ttl, lambda: self._fetch_range(query, start, end, step))
+
+    def _prune(self, now: float):
+        """Drop expired cache entries (caller holds the lock)"""
+        expired = [k for k, (expires, _) in self._cache.items() if expires <= now]
+        for k in expired:
+            del self._cache[k]
+
+    @staticmethod
+    def _first_value(result: Optional[Dict[str, Any]]) -> Optional[float]:
+        if result and result.get('result'):
+            return float(result['result'][0]['value'][1])
+        return None
+
     def get_cpu_usage(self, service_name: str) -> Optional[float]:
         """Get CPU usage percentage for a service"""
-        # PromQL query for CPU usage - adjust based on your Prometheus setup
-        query = f'100 - (avg(irate(node_cpu_seconds_total{{mode="idle",instance=~".*{service_name}.*"}}[5m])) * 100)'
-        
-        result = self._query_prometheus(query)
-        if result and result.get('result'):
-            try:
-                value = float(result['result'][0]['value'][1])
+        query = CPU_QUERY.format(service=service_name)
+
+        try:
+            value = self._first_value(self._query_prometheus(query))
+            if value is not None:
                 return round(value, 2)
-            except (IndexError, ValueError, KeyError):
-                logger.warning(f"Could not parse CPU usage for service {service_name}")
-        
+        except (IndexError, ValueError, KeyError):
+            logger.warning(f"Could not parse CPU usage for service {service_name}")
+
         return None
-    
+
     def get_memory_usage(self, service_name: str) -> Optional[float]:
         """Get memory usage percentage for a service"""
-        # PromQL query for memory usage - adjust based on your Prometheus setup
-        query = f'(1 - (node_memory_MemAvailable_bytes{{instance=~".*{service_name}.*"}} / node_memory_MemTotal_bytes{{instance=~".*{service_name}.*"}})) * 100'
-        
-        result = self._query_prometheus(query)
-        if result and result.get('result'):
-            try:
-                value = float(result['result'][0]['value'][1])
+        query = MEMORY_QUERY.format(service=service_name)
+
+        try:
+            value = self._first_value(self._query_prometheus(query))
+            if value is not None:
                 return round(value, 2)
-            except (IndexError, ValueError, KeyError):
-                logger.warning(f"Could not parse memory usage for service {service_name}")
-        
+        except (IndexError, ValueError, KeyError):
+            logger.warning(f"Could not parse memory usage for service {service_name}")
+
         return None
-    
+
     def get_disk_usage(self, service_name: str) -> Optional[Dict[str, Any]]:
         """Get disk usage information for a service"""
-        # PromQL queries for disk usage
-        used_query = f'node_filesystem_size_bytes{{instance=~".*{service_name}.*",fstype!="tmpfs"}} - node_filesystem_free_bytes{{instance=~".*{service_name}.*",fstype!="tmpfs"}}'
-        total_query = f'node_filesystem_size_bytes{{instance=~".*{service_name}.*",fstype!="tmpfs"}}'
-        
-        used_result = self._query_prometheus(used_query)
-        total_result = self._query_prometheus(total_query)
-        
-        if used_result and total_result and used_result.get('result') and total_result.get('result'):
-            try:
-                used_bytes = float(used_result['result'][0]['value'][1])
-                total_bytes = float(total_result['result'][0]['value'][1])
-                
-                used_gb = round(used_bytes / (1024**3), 1)
-                total_gb = round(total_bytes / (1024**3), 1)
-                usage_percent = round((used_bytes / total_bytes) * 100, 2)
-                
-                return {
-                    'used_gb': used_gb,
-                    'total_gb': total_gb,
-                    'usage_percent': usage_percent,
-                    'storage_display': f'{used_gb}GB / {total_gb}GB'
-                }
-            except (IndexError, ValueError, KeyError):
-                logger.warning(f"Could not parse disk usage for service {service_name}")
-        
+        # One vector query returns both size and free series; pair them by filesystem labels
+        query = f'{{__name__=~"node_filesystem_(size|free)_bytes",instance=~".*{service_name}.*",fstype!="tmpfs"}}'
+
+        result = self._query_prometheus(query)
+        if not (result and result.get('result')):
+            return None
+
+        try:
+            filesystems: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+            order = []
+            for series in result['result']:
+                labels = series.get('metric', {})
+                fs_key = (labels.get('instance', ''), labels.get('device', ''), labels.get('mountpoint', ''))
+                if fs_key not in filesystems:
+                    filesystems[fs_key] = {}
+                    order.append(fs_key)
+                kind = 'size' if labels.get('__name__') == 'node_filesystem_size_bytes' else 'free'
+                filesystems[fs_key][kind] = float(series['value'][1])
+
+            complete = [k for k in order if 'size' in filesystems[k] and 'free' in filesystems[k]]
+            if not complete:
+                return None
+            # Prefer the root filesystem, otherwise the first complete pair
+            fs_key = next((k for k in complete if k[2] == '/'), complete[0])
+            total_bytes = filesystems[fs_key]['size']
+            used_bytes = total_bytes - filesystems[fs_key]['free']
+
+            used_gb = round(used_bytes / (1024**3), 1)
+            total_gb = round(total_bytes / (1024**3), 1)
+            usage_percent = round((used_bytes / total_bytes) * 100, 2)
+
+            return {
+                'used_gb': used_gb,
+                'total_gb': total_gb,
+                'usage_percent': usage_percent,
+                'storage_display': f'{used_gb}GB / {total_gb}GB'
+            }
+        except (IndexError, ValueError, KeyError, ZeroDivisionError):
+            logger.warning(f"Could not parse disk usage for service {service_name}")
+
         return None
-    
+
     def get_all_metrics(self, service_name: str) -> Dict[str, Any]:
-        """Get all metrics (CPU, memory, disk) for a service"""
+        """Get all metrics (CPU, memory, disk) for a service, queried concurrently"""
+        # Resolve the base URL here: worker threads have no Flask app context
+        self._get_base_url()
+        cpu = self._executor.submit(self.get_cpu_usage, service_name)
+        memory = self._executor.submit(self.get_memory_usage, service_name)
+        disk = self._executor.submit(self.get_disk_usage, service_name)
         metrics = {
             'service': service_name,
-            'cpu_usage': self.get_cpu_usage(service_name),
-            'memory_usage': self.get_memory_usage(service_name),
-            'disk_usage': self.get_disk_usage(service_name),
+            'cpu_usage': cpu.result(),
+            'memory_usage': memory.result(),
+            'disk_usage': disk.result(),
             'timestamp': None
         }
-        
+
         # Add timestamp if we have at least one metric
         if any(v is not None for k, v in metrics.items() if k not in ['service', 'timestamp']):
-            import time
             metrics['timestamp'] = int(time.time())
-        
+            self._record_history(service_name, metrics)
+
         return metrics
-    
+
+    def get_metric_history(self, service_name: str, metric: str, start: int, end: int,
+                           points: int = 500, method: str = 'lttb', step: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get downsampled history of one metric as columnar arrays.
+
+        Prometheus is asked for at most ``RAW_POINTS_FACTOR * points`` samples per series,
+        which are then reduced to ``points`` with LTTB or min/max buckets.
+        """
+        template = HISTORY_QUERIES.get(metric)
+        if template is None:
+            raise ValueError(f"Unsupported metric: {metric}")
+        if end <= start:
+            raise ValueError("end must be greater than start")
+
+        span = end - start
+        raw_points = min(MAX_RANGE_POINTS, max(points, points * self.RAW_POINTS_FACTOR))
+        step = max(int(step or 0), math.ceil(span / raw_points), 1)
+
+        result = self.query_range(template.format(service=service_name), start, end, step)
+        if result is None:
+            return None
+
+        series = []
+        for item in result.get('result', []):
+            raw = item.get('values', [])
+            try:
+                timestamps = [float(ts) for ts, _ in raw]
+                values = [float(v) for _, v in raw]
+            except (TypeError, ValueError):
+                logger.warning(f"Could not parse {metric} history for service {service_name}")
+                continue
+            xs, ys = downsample(timestamps, values, points, method)
+            labels = {k: v for k, v in item.get('metric', {}).items() if k != '__name__'}
+            series.append({
+                'labels': labels,
+                'timestamps': [int(x) for x in xs],
+                'values': [round(y, 2) for y in ys],
+                'raw_points': len(raw),
+            })
+
+        return {
+            'service': service_name,
+            'metric': metric,
+            'start': start,
+            'end': end,
+            'step': step,
+            'method': method,
+            'series': series,
+        }
+
+    def _record_history(self, service_name: str, metrics: Dict[str, Any]):
+        """Keep samples in the local time-series store; cached repeats share one aligned timestamp and are ignored"""
+        ts = self._aligned_now() if self.cache_step > 0 else metrics['timestamp']
+        scope = f'service:{service_name}'
+        disk = metrics.get('disk_usage') or {}
+        timeseries_store.record(scope, 'cpu', metrics.get('cpu_usage'), ts)
+        timeseries_store.record(scope, 'memory', metrics.get('memory_usage'), ts)
+        timeseries_store.record(scope, 'disk', disk.get('usage_percent'), ts)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'step_seconds': self.cache_step,
+                'entries': len(self._cache),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / total, 4) if total else None,
+            }
+
     def health_check(self) -> bool:
         """Check if Prometheus is accessible"""
         try:
             url = f"{self._get_base_url()}/api/v1/status/config"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=5)
             return response.status_code == 200
         except Exception:
             return False
 
 
 # Global instance
-prometheus_service = PrometheusService()
\ No newline at end of file
+prometheus_service = PrometheusService()
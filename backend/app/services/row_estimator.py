@@ -0,0 +1,149 @@
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# TABLE_ROWS 由存储引擎精确维护的引擎（InnoDB 的 TABLE_ROWS 只是采样估计）
+_EXACT_STAT_ENGINES = {'MYISAM', 'ARIA', 'MEMORY'}
+
+CONFIDENCE_LABELS = {'exact': '精确', 'high': '高', 'medium': '中', 'low': '低', 'unknown': '未知'}
+
+
+def _quote(name: str) -> str:
+    return '`' + name.replace('`', '``') + '`'
+
+
+def _like_escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class RowEstimator:
+    """表行数估计：优先使用统计信息，只对小表做有上限的精确计数。
+
+    以前采样前执行 SELECT COUNT(*) ... LIMIT 100000，LIMIT 对 COUNT 不起作用，
+    大表上会触发一次聚簇索引全扫描。这里依次取：
+      - EXPLAIN SELECT * 的 rows（优化器当前使用的内存统计，最新）
+      - mysql.innodb_table_stats.n_rows（持久化统计，分区表按分区求和；无权限时跳过）
+      - information_schema.TABLES.TABLE_ROWS（MySQL 8 下可能被缓存至多一天）
+    估计值不超过 exact_threshold 时再执行 COUNT(*) FROM (SELECT 1 ... LIMIT threshold+1)，
+    最多扫描 threshold+1 行并受 MAX_EXECUTION_TIME 限制，统计信息过时也不会扫全表。
+
+    置信度：exact（有上限计数完成）、high（MyISAM 等引擎精确维护的行数）、
+    medium（其他引擎的多个统计来源相差不超过一倍）、low（InnoDB 统计、单一来源、来源分歧或计数超出上限）、
+    unknown（视图等无统计信息的对象）。
+    InnoDB 的三个来源都出自同一份采样的持久化统计，彼此一致并不说明准确，按一个来源处理，
+    除非有上限计数确认，置信度保持 low。
+    """
+
+    def __init__(self):
+        self.exact_threshold = int(os.getenv('ROW_ESTIMATE_EXACT_THRESHOLD', '100000'))
+        self.count_timeout_ms = int(os.getenv('ROW_ESTIMATE_COUNT_TIMEOUT_MS', '2000'))
+
+    def estimate(self, cursor, database: str, table_name: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """在调用方的连接上估计行数。
+        meta 为 schema_cache 返回的表元信息（用于引擎与 TABLE_ROWS）；
+        返回 {'rows', 'confidence', 'source', 'sources'}，rows 可能为 None"""
+        meta = meta or {}
+        engine = (meta.get('engine') or '').upper()
+        result: Dict[str, Any] = {'rows': None, 'confidence': 'unknown', 'source': None, 'sources': {}}
+        if not engine:
+            # 视图：EXPLAIN 在部分版本中会物化派生表，不做估计
+            return result
+
+        sources = result['sources']
+        explain_rows = self._explain_rows(cursor, table_name)
+        if explain_rows is not None:
+            sources['explain'] = explain_rows
+        if engine == 'INNODB':
+            stats_rows = self._innodb_stats_rows(cursor, database, table_name)
+            if stats_rows is not None:
+                sources['innodb_table_stats'] = stats_rows
+        if meta.get('table_rows_approx') is not None:
+            sources['table_rows'] = int(meta['table_rows_approx'])
+
+        for name in ('explain', 'innodb_table_stats', 'table_rows'):
+            if name in sources:
+                result['rows'], result['source'] = sources[name], name
+                break
+
+        if engine in _EXACT_STAT_ENGINES and result['rows'] is not None:
+            result['confidence'] = 'high'
+        elif engine == 'INNODB':
+            # 同源统计，相互一致不是独立证据
+            result['confidence'] = 'low' if sources else 'unknown'
+        elif len(sources) >= 2:
+            low, high = min(sources.values()), max(sources.values())
+            result['confidence'] = 'medium' if high <= max(1, low) * 2 else 'low'
+        elif sources:
+            result['confidence'] = 'low'
+
+        # 估计为小表（或无任何统计）时做有上限的精确计数
+        if result['rows'] is None or result['rows'] <= self.exact_threshold:
+            counted = self._bounded_count(cursor, table_name)
+            if counted is not None:
+                sources['bounded_count'] = counted
+                if counted <= self.exact_threshold:
+                    result.update(rows=counted, confidence='exact', source='bounded_count')
+                else:
+                    # 统计信息明显过时：实际行数至少超过上限
+                    result.update(rows=max(result['rows'] or 0, counted), confidence='low', source='bounded_count')
+        return result
+
+    @staticmethod
+    def _explain_rows(cursor, table_name: str) -> Optional[int]:
+        try:
+            cursor.execute(f"EXPLAIN SELECT * FROM {_quote(table_name)}")
+            rows = cursor.fetchall()
+        except Exception as e:
+            logger.debug(f"EXPLAIN 估计表 {table_name} 行数失败: {e}")
+            return None
+        for row in rows:
+            if row.get('rows') is not None:
+                return int(row['rows'])
+        return None
+
+    @staticmethod
+    def _innodb_stats_rows(cursor, database: str, table_name: str) -> Optional[int]:
+        try:
+            cursor.execute(
+                """
+                SELECT SUM(n_rows) AS n_rows
+                FROM mysql.innodb_table_stats
+                WHERE database_name = %s AND (table_name = %s OR LOWER(table_name) LIKE %s)
+                """,
+                (database, table_name, _like_escape(table_name.lower()) + '#p#%')
+            )
+            row = cursor.fetchone()
+        except Exception as e:
+            # 普通监控账号通常没有 mysql 库的读权限
+            logger.debug(f"读取 innodb_table_stats 失败: {e}")
+            return None
+        if not row or row.get('n_rows') is None:
+            return None
+        return int(row['n_rows'])
+
+    def _bounded_count(self, cursor, table_name: str) -> Optional[int]:
+        try:
+            cursor.execute(
+                f"SELECT /*+ MAX_EXECUTION_TIME({self.count_timeout_ms}) */ COUNT(*) AS cnt "
+                f"FROM (SELECT 1 FROM {_quote(table_name)} LIMIT {self.exact_threshold + 1}) AS bounded"
+            )
+            row = cursor.fetchone()
+        except Exception as e:
+            logger.debug(f"表 {table_name} 有上限计数失败: {e}")
+            return None
+        return int(row['cnt']) if row else None
+
+
+def describe_estimate(rows: Optional[int], confidence: Optional[str], source: Optional[str]) -> str:
+    """供上下文摘要使用的单行描述"""
+    if rows is None:
+        return '未知'
+    confidence = confidence or 'unknown'
+    prefix = '' if confidence == 'exact' else '约 '
+    return f"{prefix}{rows:,}（来源: {source}，置信度: {CONFIDENCE_LABELS.get(confidence, confidence)}）"
+
+
+# 全局实例
+row_estimator = RowEstimator()
@@ -0,0 +1,247 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .connection_pool import mysql_pool
+
+logger = logging.getLogger(__name__)
+
+# 随数据变化、每次从 information_schema.TABLES 取最新值的表级字段
+_TABLE_FIELDS = {
+    'ENGINE': 'engine',
+    'TABLE_ROWS': 'table_rows_approx',
+    'DATA_LENGTH': 'data_length',
+    'INDEX_LENGTH': 'index_length',
+    'AVG_ROW_LENGTH': 'avg_row_length',
+    'TABLE_COLLATION': 'table_collation',
+    'CREATE_TIME': 'create_time',
+    'UPDATE_TIME': 'update_time',
+}
+
+
+def _in_clause(names: List[str]) -> str:
+    return ', '.join(['%s'] * len(names))
+
+
+class _SchemaEntry:
+    __slots__ = ('structure', 'version', 'fetched_at')
+
+    def __init__(self, structure: Dict[str, Any], version: Tuple, fetched_at: float):
+        self.structure = structure
+        self.version = version
+        self.fetched_at = fetched_at
+
+
+class SchemaCache:
+    """按（实例、库）缓存表结构：列、索引（含统计）、约束。
+
+    以前每张表单独建连并依次执行 information_schema.TABLES、DESCRIBE、SHOW INDEX 与约束查询；
+    这里一次请求只查一次 TABLES（同时取得行数、大小等最新值并校验缓存），
+    CREATE_TIME/UPDATE_TIME 变化或超过 ttl 的表再用 TABLE_NAME IN (...) 的集合查询
+    一并取列、索引与约束，与表的数量无关。表清单（SHOW TABLES 的替代）按 list_ttl 缓存。
+    返回的字典为新建对象，其中的列/索引列表与缓存共享，调用方勿修改。
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv('SCHEMA_CACHE_TTL', '300'))
+        self.list_ttl = float(os.getenv('SCHEMA_CACHE_LIST_TTL', '60'))
+        self.timeout = 15
+        self._tables: Dict[Tuple[int, str], Dict[str, _SchemaEntry]] = {}
+        self._listings: Dict[Tuple[int, str], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_tables(self, inst, database: str, table_names: List[str], refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """返回 {请求的表名: 元信息}，不存在的表不出现在结果中；连接或查询失败时抛出异常。
+        元信息字段与 TableAnalyzerService._get_table_metadata_only 一致"""
+        names = list(dict.fromkeys(n for n in table_names if n))
+        if not names:
+            return {}
+        key = (inst.id, database)
+        now = time.monotonic()
+        with mysql_pool.connection(inst, database=database, timeout=self.timeout) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT TABLE_NAME, ENGINE, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH,
+                           AVG_ROW_LENGTH, TABLE_COLLATION, CREATE_TIME, UPDATE_TIME
+                    FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA=%s AND TABLE_NAME IN ({_in_clause(names)})
+                    """,
+                    (database, *names)
+                )
+                rows = {r['TABLE_NAME']: r for r in cursor.fetchall()}
+
+                with self._lock:
+                    cached = dict(self._tables.get(key) or {})
+                stale = []
+                for name, row in rows.items():
+                    entry = cached.get(name)
+                    version = (row.get('CREATE_TIME'), row.get('UPDATE_TIME'))
+                    if refresh or entry is None or entry.version != version or now - entry.fetched_at > self.ttl:
+                        stale.append(name)
+                if stale:
+                    fresh = self._fetch_structure(cursor, database, stale)
+                    for name in stale:
+                        row = rows[name]
+                        cached[name] = _SchemaEntry(fresh[name], (row.get('CREATE_TIME'), row.get('UPDATE_TIME')), now)
+                    with self._lock:
+                        self._tables.setdefault(key, {}).update({n: cached[n] for n in stale})
+
+        with self._lock:
+            self._hits += len(rows) - len(stale)
+            self._misses += len(stale)
+
+        # 请求的表名与 information_schema 中大小写可能不同（lower_case_table_names）
+        by_lower = {name.lower(): name for name in rows}
+        result: Dict[str, Dict[str, Any]] = {}
+        for requested in names:
+            actual = requested if requested in rows else by_lower.get(requested.lower())
+            if actual is None:
+                continue
+            meta = {'table_name': actual, **cached[actual].structure}
+            for column, field in _TABLE_FIELDS.items():
+                meta[field] = rows[actual].get(column)
+            result[requested] = meta
+        return result
+
+    def get_table(self, inst, database: str, table_name: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        return self.get_tables(inst, database, [table_name], refresh=refresh).get(table_name)
+
+    @staticmethod
+    def _fetch_structure(cursor, database: str, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        params = (database, *names)
+        structure: Dict[str, Dict[str, Any]] = {
+            n: {'columns': [], 'indexes': [], 'constraints': [], 'primary_key': []} for n in names
+        }
+
+        cursor.execute(
+            f"""
+            SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA=%s AND TABLE_NAME IN ({_in_clause(names)})
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+            """,
+            params
+        )
+        for col in cursor.fetchall():
+            table = structure.get(col['TABLE_NAME'])
+            if table is None:
+                continue
+            table['columns'].append({
+                'name': col['COLUMN_NAME'],
+                'type': col['COLUMN_TYPE'],
+                'null': col['IS_NULLABLE'],
+                'key': col['COLUMN_KEY'],
+                'default': col['COLUMN_DEFAULT'],
+                'extra': col.get('EXTRA'),
+            })
+            if (col.get('COLUMN_KEY') or '').upper() == 'PRI':
+                table['primary_key'].append(col['COLUMN_NAME'])
+
+        cursor.execute(
+            f"""
+            SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, SEQ_IN_INDEX, COLUMN_NAME,
+                   CARDINALITY, SUB_PART, INDEX_TYPE, INDEX_COMMENT
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA=%s AND TABLE_NAME IN ({_in_clause(names)})
+            ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+            """,
+            params
+        )
+        indexes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for idx in cursor.fetchall():
+            if idx['TABLE_NAME'] not in structure:
+                continue
+            ikey = (idx['TABLE_NAME'], idx['INDEX_NAME'])
+            entry = indexes.get(ikey)
+            if entry is None:
+                entry = {
+                    'name': idx['INDEX_NAME'],
+                    'unique': not bool(int(idx['NON_UNIQUE'])),
+                    'columns': [],
+                    # 与 columns 对应的前缀长度，整列索引为 None
+                    'sub_parts': [],
+                    'cardinality': None,
+                    'index_type': idx.get('INDEX_TYPE'),
+                    'comment': idx.get('INDEX_COMMENT') or None,
+                }
+                indexes[ikey] = entry
+                structure[idx['TABLE_NAME']]['indexes'].append(entry)
+            # 函数索引的 COLUMN_NAME 为空
+            if idx.get('COLUMN_NAME'):
+                entry['columns'].append(idx['COLUMN_NAME'])
+                entry['sub_parts'].append(int(idx['SUB_PART']) if idx.get('SUB_PART') is not None else None)
+            # 以最大Cardinality为整体索引基数（粗略）
+            card = idx.get('CARDINALITY')
+            if card is not None:
+                entry['cardinality'] = max(entry['cardinality'] or 0, int(card))
+
+        try:
+            cursor.execute(
+                f"""
+                SELECT kcu.TABLE_NAME, kcu.CONSTRAINT_NAME, tc.CONSTRAINT_TYPE, kcu.COLUMN_NAME
+                FROM information_schema.KEY_COLUMN_USAGE kcu
+                JOIN information_schema.TABLE_CONSTRAINTS tc
+                  ON kcu.CONSTRAINT_NAME = tc.CONSTRAINT_NAME
+                 AND kcu.TABLE_SCHEMA = tc.TABLE_SCHEMA
+                 AND kcu.TABLE_NAME = tc.TABLE_NAME
+                WHERE kcu.TABLE_SCHEMA = %s AND kcu.TABLE_NAME IN ({_in_clause(names)})
+                ORDER BY kcu.TABLE_NAME, kcu.CONSTRAINT_NAME, kcu.ORDINAL_POSITION
+                """,
+                params
+            )
+            for c in cursor.fetchall():
+                table = structure.get(c['TABLE_NAME'])
+                if table is not None:
+                    table['constraints'].append({
+                        'constraint_name': c['CONSTRAINT_NAME'],
+                        'constraint_type': c['CONSTRAINT_TYPE'],
+                        'column_name': c['COLUMN_NAME'],
+                    })
+        except Exception as e:
+            logger.warning(f"获取表约束信息失败: {e}")
+        return structure
+
+    def list_tables(self, inst, database: str, refresh: bool = False) -> List[str]:
+        """库中的表与视图名（已排序）"""
+        key = (inst.id, database)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._listings.get(key)
+        if cached and not refresh and now - cached[0] <= self.list_ttl:
+            return cached[1]
+        with mysql_pool.connection(inst, database=database, timeout=self.timeout) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA=%s",
+                    (database,)
+                )
+                tables = sorted(r['TABLE_NAME'] for r in cursor.fetchall())
+        with self._lock:
+            self._listings[key] = (now, tables)
+        return tables
+
+    def invalidate(self, instance_id: int, database: Optional[str] = None):
+        with self._lock:
+            for store in (self._tables, self._listings):
+                for key in [k for k in store if k[0] == instance_id and (database is None or k[1] == database)]:
+                    del store[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'databases': len(self._tables),
+                'tables': sum(len(t) for t in self._tables.values()),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 3) if total else None,
+            }
+
+
+# 全局实例
+schema_cache = SchemaCache()
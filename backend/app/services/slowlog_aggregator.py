@@ -0,0 +1,192 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from .latency_histogram import LatencyHistogram
+from .sql_fingerprint import fingerprint, fingerprint_id
+
+# 慢查询耗时直方图上限（毫秒），超出部分计入最后一个桶
+QUERY_TIME_MAX_MS = 600_000
+# 样本数不超过该值时只保存原始耗时列表，超过后才分配直方图；
+# 长尾的低频指纹因此不占用直方图内存，淘汰合并也几乎无开销
+EXACT_SAMPLES = 32
+
+OTHER_FINGERPRINT = '__other__'
+
+
+class _DigestStats:
+    __slots__ = (
+        'fingerprint', 'db', 'count', 'sum_ms', 'max_ms', 'sum_lock_ms', 'sum_rows_examined', 'sum_rows_sent',
+        'first_seen', 'last_seen', 'sample', 'sample_ms', 'samples', 'hist',
+    )
+
+    def __init__(self, fp: str, db: str):
+        self.fingerprint = fp
+        self.db = db
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.sum_lock_ms = 0.0
+        self.sum_rows_examined = 0
+        self.sum_rows_sent = 0
+        self.first_seen: Optional[datetime] = None
+        self.last_seen: Optional[datetime] = None
+        self.sample = ''
+        self.sample_ms = -1.0
+        self.samples: Optional[List[float]] = []
+        self.hist: Optional[LatencyHistogram] = None
+
+    def _promote(self):
+        self.hist = LatencyHistogram(QUERY_TIME_MAX_MS)
+        for v in self.samples:
+            self.hist.record(v)
+        self.samples = None
+
+    def record(self, ms: float):
+        if self.samples is None:
+            self.hist.record(ms)
+            return
+        self.samples.append(ms)
+        if len(self.samples) > EXACT_SAMPLES:
+            self._promote()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if self.samples is None:
+            return self.hist.percentile(pct)
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(1, int(round(len(ordered) * pct / 100.0)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def merge(self, other: '_DigestStats'):
+        self.count += other.count
+        self.sum_ms += other.sum_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.sum_lock_ms += other.sum_lock_ms
+        self.sum_rows_examined += other.sum_rows_examined
+        self.sum_rows_sent += other.sum_rows_sent
+        if other.first_seen and (self.first_seen is None or other.first_seen < self.first_seen):
+            self.first_seen = other.first_seen
+        if other.last_seen and (self.last_seen is None or other.last_seen > self.last_seen):
+            self.last_seen = other.last_seen
+        if other.samples is not None:
+            for v in other.samples:
+                self.record(v)
+        else:
+            if self.samples is not None:
+                self._promote()
+            self.hist.merge(other.hist)
+
+
+class SlowQueryAggregator:
+    """按 SQL 指纹流式聚合慢查询记录，内存有界。
+
+    每个指纹保存计数/求和/最大值与耗时分布（少量样本存原值，之后转为定长直方图，用于 p95）；
+    指纹数超过 max_fingerprints 时，把总耗时最小的一批合并进 '__other__'，
+    因此输入规模（百万行级别）只影响耗时，不影响内存。
+    """
+
+    def __init__(self, max_fingerprints: int = 2000, sample_chars: int = 2000):
+        self.max_fingerprints = max_fingerprints
+        self.sample_chars = sample_chars
+        self.rows = 0
+        self._stats: Dict[str, _DigestStats] = {}
+        self._other: Optional[_DigestStats] = None
+
+    def add(self, sql_text: str, query_time: float, lock_time: float = 0.0, rows_sent: int = 0,
+            rows_examined: int = 0, start_time: Optional[datetime] = None, db: str = ''):
+        """累加一条记录；query_time/lock_time 单位为秒"""
+        fp = fingerprint(sql_text or '')
+        stats = self._stats.get(fp)
+        if stats is None:
+            if len(self._stats) >= self.max_fingerprints:
+                self._prune()
+            stats = _DigestStats(fp, db or '')
+            self._stats[fp] = stats
+        ms = (query_time or 0.0) * 1000
+        stats.count += 1
+        stats.sum_ms += ms
+        if ms > stats.max_ms:
+            stats.max_ms = ms
+        stats.sum_lock_ms += (lock_time or 0.0) * 1000
+        stats.sum_rows_examined += rows_examined or 0
+        stats.sum_rows_sent += rows_sent or 0
+        if start_time is not None:
+            if stats.first_seen is None or start_time < stats.first_seen:
+                stats.first_seen = start_time
+            if stats.last_seen is None or start_time > stats.last_seen:
+                stats.last_seen = start_time
+        if ms > stats.sample_ms:
+            # 保留最慢的一条原始语句作为样例
+            stats.sample_ms = ms
+            stats.sample = (sql_text or '')[:self.sample_chars]
+        stats.record(ms)
+        self.rows += 1
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]]) -> 'SlowQueryAggregator':
+        """累加字典形式的记录（键与 mysql.slow_log 列名一致）"""
+        for r in rows:
+            self.add(
+                r.get('sql_text') or '',
+                r.get('query_time') or 0.0,
+                r.get('lock_time') or 0.0,
+                r.get('rows_sent') or 0,
+                r.get('rows_examined') or 0,
+                r.get('start_time'),
+                r.get('db') or '',
+            )
+        return self
+
+    def _prune(self):
+        """淘汰总耗时最小的指纹（约 20%），合并进 '__other__'"""
+        keep = int(self.max_fingerprints * 0.8)
+        ranked = sorted(self._stats.values(), key=lambda s: s.sum_ms, reverse=True)
+        if self._other is None:
+            self._other = _DigestStats(OTHER_FINGERPRINT, '')
+        for stats in ranked[keep:]:
+            self._other.merge(stats)
+            del self._stats[stats.fingerprint]
+
+    @staticmethod
+    def _to_dict(stats: _DigestStats) -> Dict[str, Any]:
+        cnt = stats.count or 1
+        p95 = stats.percentile(95)
+        return {
+            'fingerprint_id': fingerprint_id(stats.fingerprint),
+            'fingerprint': stats.fingerprint[:1000],
+            'db': stats.db,
+            'count': stats.count,
+            'sum_ms': round(stats.sum_ms, 2),
+            'avg_ms': round(stats.sum_ms / cnt, 2),
+            'p95_ms': round(p95, 2) if p95 is not None else None,
+            'max_ms': round(stats.max_ms, 2),
+            'lock_avg_ms': round(stats.sum_lock_ms / cnt, 2),
+            'rows_examined_avg': round(stats.sum_rows_examined / cnt, 1),
+            'rows_sent_avg': round(stats.sum_rows_sent / cnt, 1),
+            # 每返回一行需扫描的行数，越大说明越可能缺索引
+            'rows_examined_per_sent': round(stats.sum_rows_examined / stats.sum_rows_sent, 1) if stats.sum_rows_sent else None,
+            'first_seen': stats.first_seen.strftime('%Y-%m-%d %H:%M:%S') if stats.first_seen else None,
+            'last_seen': stats.last_seen.strftime('%Y-%m-%d %H:%M:%S') if stats.last_seen else None,
+            'sample': stats.sample,
+        }
+
+    SORT_KEYS = {
+        'sum': lambda s: s.sum_ms,
+        'avg': lambda s: s.sum_ms / (s.count or 1),
+        'max': lambda s: s.max_ms,
+        'count': lambda s: s.count,
+        'p95': lambda s: s.percentile(95) or 0.0,
+        'rows_examined': lambda s: s.sum_rows_examined,
+    }
+
+    def result(self, top: int = 20, order_by: str = 'sum', min_avg_ms: float = 0.0) -> Dict[str, Any]:
+        key = self.SORT_KEYS.get(order_by, self.SORT_KEYS['sum'])
+        candidates = [s for s in self._stats.values() if s.sum_ms / (s.count or 1) >= min_avg_ms]
+        ranked = sorted(candidates, key=key, reverse=True)[:max(1, top)]
+        return {
+            'rows': self.rows,
+            'fingerprints': len(self._stats),
+            'order_by': order_by if order_by in self.SORT_KEYS else 'sum',
+            'digests': [self._to_dict(s) for s in ranked],
+            'other': self._to_dict(self._other) if self._other else None,
+        }
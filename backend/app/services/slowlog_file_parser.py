@@ -0,0 +1,202 @@
+import mmap
+import os
+import re
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+CHUNK_SIZE = 4 * 1024 * 1024
+# 单条 SQL 参与指纹计算的最大字节数（超长的批量 INSERT 截断，避免放大内存）
+MAX_SQL_BYTES = 64 * 1024
+
+# 每条记录以 '# User@Host:' 行开始，紧邻其前的 '# Time:' 行一并归入该记录
+# （5.6 只在秒数变化时写 '# Time:'，不能单独作为分界）。用 bytes.find 定位比多行正则快一个数量级
+_USER_HOST = b'# User@Host:'
+_TIME = b'# Time:'
+_EVENT = re.compile(
+    rb'(?:# Time: ([^\n]*)\n)?'
+    rb'# User@Host: ([^\n]*)\n'
+    rb'(?:#(?! Query_time:)[^\n]*\n)*'
+    rb'# Query_time: ([\d.]+)\s+Lock_time: ([\d.]+)\s+Rows_sent: (\d+)\s+Rows_examined: (\d+)[^\n]*\n'
+    # Percona 等分支会追加多行 '# Key: value' 头部
+    rb'(?:#(?! administrator command:)[^\n]*\n)*'
+    rb'(?:use ([^;\n]+);\n)?'
+    rb'(?:SET timestamp=(\d+);\n)?'
+)
+# mysqld 重启时在日志中写入的三行文件头以 '/path/mysqld, Version: ... started with:' 开始
+_BANNER = b'\nTcp port:'
+
+
+def _find_event(buf, pos: int, end: int) -> Tuple[int, int]:
+    """[pos, end) 内下一条记录的 (起始位置, 'User@Host' 行位置)，没有则为 (-1, -1)"""
+    if buf[pos:pos + len(_USER_HOST)] == _USER_HOST and (pos == 0 or buf[pos - 1:pos] == b'\n'):
+        user_host = pos
+    else:
+        user_host = buf.find(b'\n' + _USER_HOST, pos, end)
+        if user_host < 0:
+            return -1, -1
+        user_host += 1
+    nl = buf.rfind(b'\n', pos, user_host - 1)
+    line_start = nl + 1 if nl >= 0 else pos
+    if line_start < user_host and buf[line_start:line_start + len(_TIME)] == _TIME:
+        return line_start, user_host
+    return user_host, user_host
+
+
+def _parse_time_line(raw: bytes) -> Optional[datetime]:
+    """'# Time:' 的值：5.7+ 为 ISO 8601（log_timestamps=UTC 时带 Z），5.6 为 'yymmdd hh:mm:ss'"""
+    text = raw.decode('ascii', errors='ignore').strip()
+    try:
+        value = datetime.fromisoformat(text)
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value
+    except ValueError:
+        pass
+    try:
+        day, clock = text.split(None, 1)
+        return datetime.strptime(f'{day} {clock.strip()}', '%y%m%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+class SlowLogFileParser:
+    """MySQL 慢日志文本格式（FILE 输出）的流式解析器。
+
+    本地文件用 mmap 直接在页缓存上做正则扫描，上传的流按 chunk_size 分块读取，
+    内存只与单条记录大小有关。offset 为已完整解析的字节位置，
+    下次从该位置继续即可增量读取；follow=True 表示文件仍在写入，
+    末尾看起来未写完的记录留待下次解析。
+    产出的记录字段与 mysql.slow_log 列名一致，可直接交给 SlowQueryAggregator。
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, max_sql_bytes: int = MAX_SQL_BYTES):
+        self.chunk_size = chunk_size
+        self.max_sql_bytes = max_sql_bytes
+        self.offset = 0
+        self.events = 0
+        self.skipped = 0
+        # 慢日志只在库名变化时写 'use'，'# Time:' 也可能省略，需沿用上一条的值
+        self.db = ''
+        self._time_raw: Optional[bytes] = None
+        # 同一秒内的记录共享 SET timestamp，缓存上一次的转换结果
+        self._ts = -1
+        self._ts_value: Optional[datetime] = None
+
+    def parse_file(self, path: str, offset: int = 0, follow: bool = False) -> Iterator[Dict[str, Any]]:
+        self.offset = offset
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if offset >= size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from self._scan(mm, offset, size, 0, eof=True, follow=follow)
+
+    def parse_stream(self, stream: BinaryIO, offset: int = 0, follow: bool = False) -> Iterator[Dict[str, Any]]:
+        self.offset = offset
+        if offset:
+            if stream.seekable():
+                stream.seek(offset)
+            else:
+                remaining = offset
+                while remaining > 0:
+                    skipped = stream.read(min(remaining, self.chunk_size))
+                    if not skipped:
+                        return
+                    remaining -= len(skipped)
+        carry = b''
+        base = offset
+        while True:
+            chunk = stream.read(self.chunk_size)
+            eof = not chunk
+            buf = carry + chunk if carry else chunk
+            if not buf:
+                return
+            yield from self._scan(buf, 0, len(buf), base, eof=eof, follow=follow)
+            consumed = self.offset - base
+            if not eof and consumed == 0 and _find_event(buf, 0, len(buf))[0] < 0:
+                # 尚未遇到记录开头（文件头或从中间开始读）：只保留最后一个不完整的行
+                consumed = buf.rfind(b'\n') + 1
+                self.offset = base + consumed
+            carry = buf[consumed:]
+            base = self.offset
+            if eof:
+                return
+
+    def _scan(self, buf, pos: int, end: int, base: int, eof: bool, follow: bool) -> Iterator[Dict[str, Any]]:
+        """解析 buf[pos:end]（base 为 buf[0] 在文件中的偏移），更新 self.offset"""
+        cur, user_host = _find_event(buf, pos, end)
+        if cur < 0:
+            if eof:
+                self._note_preamble(buf, pos, end)
+                self.offset = base + end
+            return
+        self._note_preamble(buf, pos, cur)
+        self.offset = base + cur
+        while True:
+            nxt, next_user_host = _find_event(buf, user_host + 1, end)
+            if nxt < 0:
+                break
+            event = self._event(buf, cur, nxt)
+            if event is not None:
+                yield event
+            cur, user_host = nxt, next_user_host
+            self.offset = base + cur
+        if not eof:
+            return
+        # 最后一条：仍在写入的文件只在以 ';\n' 结尾时才视为完整
+        if follow and not buf[max(cur, end - 2):end] == b';\n':
+            self.offset = base + cur
+            return
+        event = self._event(buf, cur, end)
+        if event is not None:
+            yield event
+        self.offset = base + end
+
+    def _note_preamble(self, buf, pos: int, end: int):
+        idx = buf.rfind(b'# Time:', pos, end)
+        if idx >= 0:
+            line_end = buf.find(b'\n', idx, end)
+            self._time_raw = buf[idx + 7:line_end if line_end >= 0 else end]
+
+    def _event(self, buf, start: int, end: int) -> Optional[Dict[str, Any]]:
+        m = _EVENT.match(buf, start, end)
+        if m is None:
+            self.skipped += 1
+            return None
+        time_raw, user_host, query_time, lock_time, rows_sent, rows_examined, use_db, timestamp = m.groups()
+
+        body_start, body_end = m.end(), end
+        banner = buf.find(_BANNER, body_start, end)
+        if banner >= 0:
+            # 重启文件头不属于 SQL
+            body_end = max(buf.rfind(b'\n', body_start, banner) + 1, body_start)
+
+        if use_db:
+            self.db = use_db.decode('utf-8', errors='replace').strip().strip('`')
+        if time_raw:
+            self._time_raw = time_raw
+        if timestamp:
+            ts = int(timestamp)
+            if ts != self._ts:
+                self._ts, self._ts_value = ts, datetime.fromtimestamp(ts)
+            start_time = self._ts_value
+        else:
+            start_time = _parse_time_line(self._time_raw) if self._time_raw else None
+
+        sql_text = buf[body_start:min(body_end, body_start + self.max_sql_bytes)]
+        sql_text = sql_text.decode('utf-8', errors='replace').strip()
+        if not sql_text:
+            self.skipped += 1
+            return None
+        self.events += 1
+        return {
+            'start_time': start_time,
+            'user_host': user_host.rpartition(b' Id:')[0].decode('utf-8', errors='replace').strip()
+            if b' Id:' in user_host else user_host.decode('utf-8', errors='replace').strip(),
+            'query_time': float(query_time),
+            'lock_time': float(lock_time),
+            'rows_sent': int(rows_sent),
+            'rows_examined': int(rows_examined),
+            'db': self.db,
+            'sql_text': sql_text,
+        }
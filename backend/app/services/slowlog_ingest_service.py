@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+
+from .. import db
+from ..models import SlowLogEntry, SlowLogWatermark
+from .connection_pool import mysql_pool
+from .instance_registry import instance_registry
+
+logger = logging.getLogger(__name__)
+
+
+def to_seconds(val) -> float:
+    """安全转换时间为秒（兼容 datetime.timedelta/TIME 类型）"""
+    try:
+        return float(val.total_seconds()) if hasattr(val, 'total_seconds') else float(val or 0)
+    except Exception:
+        return 0.0
+
+
+def to_text(val) -> str:
+    """统一将文本/时间字段转为可 JSON 序列化的字符串"""
+    if val is None:
+        return ''
+    if isinstance(val, datetime):
+        return val.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(val, (bytes, bytearray)):
+        try:
+            return val.decode('utf-8', errors='ignore')
+        except Exception:
+            return ''
+    return str(val)
+
+
+def has_table_output(log_output: Any) -> bool:
+    """log_output 支持 FILE, TABLE 或组合 'FILE,TABLE'"""
+    norm = str(log_output or '').strip().upper()
+    return any(p.strip() == 'TABLE' for p in norm.split(',') if p.strip())
+
+
+class SlowLogIngester:
+    """慢日志增量采集：按实例高水位（start_time）只读取新增的 mysql.slow_log 记录写入本地表。
+
+    mysql.slow_log 为 CSV 引擎、无索引，任何查询都是全表扫描；
+    采集后列表/筛选/分页都在本地完成，被监控实例只承担每个周期一次的增量读取。
+    同一时间戳上的记录可能在相邻两次采集中重复读到，按 row_hash 去重。
+    一整批都落在同一时间戳（该时刻的慢日志不少于 batch_size 条）时，改为在该时间戳内
+    按表的存储顺序（CSV 追加写入）用 OFFSET 分页，读完后从其后继续；分页进度跨周期保留。
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv('SLOWLOG_INGEST_INTERVAL', '60'))
+        self.batch_size = int(os.getenv('SLOWLOG_INGEST_BATCH', '5000'))
+        self.max_batches = int(os.getenv('SLOWLOG_INGEST_MAX_BATCHES', '20'))
+        self.backfill_hours = float(os.getenv('SLOWLOG_INGEST_BACKFILL_HOURS', '24'))
+        self.retention_days = float(os.getenv('SLOWLOG_RETENTION_DAYS', '30'))
+        self.timeout = 10
+        self.running = False
+        self.app = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._thread_id_supported: Dict[int, bool] = {}
+        # 实例 -> (被整批占满的时间戳, 该时间戳内已按存储顺序读取的行数)
+        self._tie_offsets: Dict[int, Tuple[datetime, int]] = {}
+        self._last_purge: Optional[datetime] = None
+
+    # ---------- 后台线程 ----------
+    def start(self, app=None):
+        if self.running or self.interval <= 0:
+            return
+        self.running = True
+        self.app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='slowlog-ingest')
+        self._thread.start()
+        print("慢日志采集服务已启动")
+
+    def stop(self):
+        self.running = False
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        print("慢日志采集服务已停止")
+
+    def _loop(self):
+        while self.running:
+            try:
+                if self.app:
+                    with self.app.app_context():
+                        self.ingest_all()
+            except Exception as e:
+                logger.error(f"慢日志采集循环出错: {e}")
+            self._stop.wait(self.interval)
+
+    def ingest_all(self):
+        for inst in instance_registry.all():
+            if (inst.db_type or '').strip() != 'MySQL' or not inst.is_monitoring or inst.status == 'error':
+                continue
+            self.ingest(inst)
+        self._purge_expired()
+
+    # ---------- 采集 ----------
+    def _lock_for(self, instance_id: int) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(instance_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[instance_id] = lock
+            return lock
+
+    @staticmethod
+    def _row_hash(row: Dict[str, Any]) -> str:
+        parts = [
+            row['start_time'].isoformat() if row.get('start_time') else '',
+            to_text(row.get('user_host')),
+            str(row.get('thread_id') or ''),
+            repr(to_seconds(row.get('query_time'))),
+            str(row.get('rows_examined') or 0),
+            to_text(row.get('sql_text')),
+        ]
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8', errors='ignore')).hexdigest()
+
+    def _fetch_batch(self, cur, instance_id: int, since: datetime, tie_offset: Optional[int] = None) -> List[Dict[str, Any]]:
+        """读取 start_time >= since 的一批记录；tie_offset 不为 None 时只读 start_time = since 的记录，
+        不排序（按存储顺序）并跳过前 tie_offset 行"""
+        columns = "start_time, user_host, db, query_time, lock_time, rows_sent, rows_examined, sql_text"
+        if tie_offset is None:
+            condition = "WHERE start_time >= %s ORDER BY start_time LIMIT %s"
+            params: Tuple = (since, self.batch_size)
+        else:
+            condition = "WHERE start_time = %s LIMIT %s OFFSET %s"
+            params = (since, self.batch_size, tie_offset)
+        if self._thread_id_supported.get(instance_id, True):
+            try:
+                cur.execute(f"SELECT {columns}, thread_id FROM mysql.slow_log {condition}", params)
+                return list(cur.fetchall() or [])
+            except Exception as e:
+                # MySQL 5.7 之前的 slow_log 没有 thread_id 列（1054: Unknown column）
+                if not e.args or e.args[0] != 1054:
+                    raise
+                logger.info(f"mysql.slow_log 不含 thread_id，改用不含该列的查询: {e}")
+                self._thread_id_supported[instance_id] = False
+        cur.execute(f"SELECT {columns} FROM mysql.slow_log {condition}", params)
+        return list(cur.fetchall() or [])
+
+    def _new_rows(self, instance_id: int, since: datetime, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉已采集过的记录：只有与上次高水位同一时间戳的记录可能重复"""
+        existing = {
+            h for (h,) in db.session.query(SlowLogEntry.row_hash)
+            .filter(SlowLogEntry.instance_id == instance_id, SlowLogEntry.start_time == since)
+        }
+        fresh: List[Dict[str, Any]] = []
+        for r in rows:
+            h = self._row_hash(r)
+            if h in existing:
+                continue
+            existing.add(h)
+            fresh.append({
+                'instance_id': instance_id,
+                'start_time': r.get('start_time'),
+                'user_host': to_text(r.get('user_host'))[:255],
+                'db': to_text(r.get('db'))[:128],
+                'query_time': to_seconds(r.get('query_time')),
+                'lock_time': to_seconds(r.get('lock_time')),
+                'rows_sent': int(r.get('rows_sent') or 0),
+                'rows_examined': int(r.get('rows_examined') or 0),
+                'sql_text': to_text(r.get('sql_text')),
+                'row_hash': h,
+            })
+        return fresh
+
+    def ingest(self, inst) -> Tuple[bool, int, str]:
+        """采集一个实例自高水位以来的新记录，返回 (ok, 新增条数, 信息)。需在应用上下文中调用。"""
+        lock = self._lock_for(inst.id)
+        if not lock.acquire(blocking=False):
+            return True, 0, '采集进行中'
+        try:
+            return self._ingest_locked(inst)
+        finally:
+            lock.release()
+
+    def _ingest_locked(self, inst) -> Tuple[bool, int, str]:
+        wm = db.session.get(SlowLogWatermark, inst.id)
+        if wm is None:
+            wm = SlowLogWatermark(instance_id=inst.id, rows_ingested=0)
+            db.session.add(wm)
+        added = 0
+        try:
+            with mysql_pool.connection(inst, timeout=self.timeout) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SHOW GLOBAL VARIABLES WHERE Variable_name IN ('slow_query_log','log_output')")
+                    vmap = {r['Variable_name']: r['Value'] for r in (cur.fetchall() or [])}
+                    wm.slow_query_log = str(vmap.get('slow_query_log') or '')
+                    wm.log_output = str(vmap.get('log_output') or '')
+                    if not has_table_output(wm.log_output):
+                        wm.last_ingest_at = datetime.utcnow()
+                        wm.last_error = None
+                        db.session.commit()
+                        return False, 0, "仅支持 log_output 包含 TABLE 的数据库"
+
+                    since = wm.last_start_time
+                    if since is None:
+                        # 首次采集只回填最近一段时间，按服务器时间计算
+                        cur.execute("SELECT NOW() - INTERVAL %s MINUTE AS since", (int(self.backfill_hours * 60),))
+                        since = (cur.fetchone() or {}).get('since') or datetime(1970, 1, 1)
+
+                    # 上个周期未读完的同一时间戳分页
+                    tie = self._tie_offsets.get(inst.id)
+                    tie_offset = tie[1] if tie and tie[0] == since else None
+                    for _ in range(self.max_batches):
+                        rows = self._fetch_batch(cur, inst.id, since, tie_offset)
+                        if tie_offset is not None:
+                            tie_offset += len(rows)
+                            self._tie_offsets[inst.id] = (since, tie_offset)
+                        if rows:
+                            fresh = self._new_rows(inst.id, since, rows)
+                            if fresh:
+                                db.session.execute(insert(SlowLogEntry.__table__), fresh)
+                            last = rows[-1]['start_time']
+                            wm.last_start_time = last
+                            wm.rows_ingested = (wm.rows_ingested or 0) + len(fresh)
+                            added += len(fresh)
+                            # 每批提交一次，中途失败也不会丢失已采集的进度
+                            db.session.commit()
+                        if tie_offset is not None:
+                            if len(rows) < self.batch_size:
+                                # 该时间戳已读完，从下一微秒继续；保留偏移，下个周期只补读该时刻新追加的行
+                                tie_offset = None
+                                since += timedelta(microseconds=1)
+                            continue
+                        if len(rows) < self.batch_size:
+                            break
+                        if last == since:
+                            # 整批同一时间戳：排序结果在并列行间不稳定，改为按存储顺序从头分页
+                            tie_offset = 0
+                            self._tie_offsets[inst.id] = (since, 0)
+                            continue
+                        since = last
+            wm.last_ingest_at = datetime.utcnow()
+            wm.last_error = None
+            db.session.commit()
+            return True, added, 'OK'
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"采集慢日志失败(实例ID={inst.id}): {e}")
+            try:
+                wm = db.session.get(SlowLogWatermark, inst.id) or SlowLogWatermark(instance_id=inst.id, rows_ingested=0)
+                wm.last_ingest_at = datetime.utcnow()
+                wm.last_error = str(e)[:500]
+                db.session.add(wm)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+            return False, added, f"连接或查询失败: {e}"
+
+    def _purge_expired(self):
+        """按保留天数清理本地慢日志，每小时最多执行一次"""
+        now = datetime.utcnow()
+        if self.retention_days <= 0 or (self._last_purge and now - self._last_purge < timedelta(hours=1)):
+            return
+        self._last_purge = now
+        try:
+            cutoff = now - timedelta(days=self.retention_days)
+            db.session.execute(delete(SlowLogEntry.__table__).where(SlowLogEntry.__table__.c.start_time < cutoff))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"清理过期慢日志失败: {e}")
+
+    def drop_instance(self, instance_id: int):
+        """实例删除后清理其本地慢日志与高水位（由调用方提交事务）"""
+        db.session.execute(delete(SlowLogEntry.__table__).where(SlowLogEntry.__table__.c.instance_id == instance_id))
+        db.session.execute(delete(SlowLogWatermark.__table__).where(SlowLogWatermark.__table__.c.instance_id == instance_id))
+        self._thread_id_supported.pop(instance_id, None)
+        self._tie_offsets.pop(instance_id, None)
+
+
+# 全局实例
+slowlog_ingester = SlowLogIngester()
@@ -1,14 +1,25 @@
+import base64
+import json
 import logging
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from typing import Any, Dict, List, Tuple, Optional
 
-try:
-    import pymysql
-except ImportError:
-    pymysql = None
+from sqlalchemy import and_, or_
 
-
-from ..models import Instance
+from .. import db
+from ..models import Instance, SlowLogEntry, SlowLogWatermark
+from .connection_pool import mysql_pool
+from .slowlog_ingest_service import slowlog_ingester, has_table_output
+from .slowlog_aggregator import SlowQueryAggregator
+from .sql_fingerprint import fingerprint, fingerprint_id
+from .slowlog_file_parser import SlowLogFileParser
+from .digest_history_service import digest_history
+from .instance_snapshot import instance_snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -16,76 +27,51 @@ logger = logging.getLogger(__name__)
 class SlowLogService:
     def __init__(self, timeout: int = 10):
         self.timeout = timeout
+        self.count_cache_ttl = float(os.getenv('SLOWLOG_COUNT_CACHE_SECONDS', '60'))
+        self.count_cache_size = 256
+        self._count_cache: 'OrderedDict[Tuple, Tuple[float, int]]' = OrderedDict()
+        self._count_lock = threading.Lock()
+        self.digest_batch_size = 2000
+        self.digest_max_fingerprints = int(os.getenv('SLOWLOG_DIGEST_MAX_FINGERPRINTS', '2000'))
+        # 允许直接读取的慢日志文件目录（逗号分隔，留空则只能上传文件分析）
+        self.file_dirs = [
+            os.path.realpath(p.strip()) for p in os.getenv('SLOWLOG_FILE_DIRS', '').split(',') if p.strip()
+        ]
 
     def _connect(self, inst: Instance):
-        if not pymysql:
-            raise RuntimeError("MySQL驱动不可用")
-        return pymysql.connect(
-            host=inst.host,
-            port=inst.port,
-            user=inst.username or '',
-            password=inst.password or '',
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            connect_timeout=self.timeout,
-            read_timeout=self.timeout,
-            write_timeout=self.timeout
-        )
+        return mysql_pool.connection(inst, timeout=self.timeout)
 
-    def analyze(self, inst: Instance, top: int = 20, min_avg_ms: int = 10, tail_kb: int = 256) -> Tuple[bool, Dict[str, Any], str]:
-        """综合使用 performance_schema 与 慢日志表 抽样（不再使用 LOAD_FILE）。
-        返回 (ok, data, msg)
+    def analyze(self, inst: Instance, top: int = 20, min_avg_ms: int = 10, tail_kb: int = 256,
+                max_age: Optional[float] = None) -> Tuple[bool, Dict[str, Any], str]:
+        """综合使用 performance_schema、慢日志表抽样与本机可读的慢日志文件末尾 tail_kb KB（不再使用 LOAD_FILE）。
+        开关类变量取自实例快照（max_age 秒内复用）。返回 (ok, data, msg)
         """
         if not inst:
             return False, {}, "实例不存在"
         if (inst.db_type or '').strip() != 'MySQL':
             return False, {}, "仅支持MySQL实例"
         try:
-            conn = self._connect(inst)
-            try:
-                overview: Dict[str, Any] = {}
+            overview: Dict[str, Any] = instance_snapshots.get(inst, max_age=max_age).slowlog_overview()
+            with self._connect(inst) as conn:
                 ps_top: List[Dict[str, Any]] = []
+                ps_recent: Dict[str, Any] = {}
                 file_samples: List[Dict[str, Any]] = []
                 warnings: List[str] = []
 
                 with conn.cursor() as cur:
-                    # 基本变量
-                    cur.execute("""
-                        SHOW GLOBAL VARIABLES WHERE Variable_name IN (
-                          'performance_schema', 'long_query_time', 'slow_query_log', 'log_output', 'slow_query_log_file'
-                        )
-                    """)
-                    rows = cur.fetchall() or []
-                    vars_map = {r['Variable_name']: r['Value'] for r in rows}
-
-                    # 规范化与健壮化处理
-                    ps_raw = str(vars_map.get('performance_schema', '')).strip().lower()
-                    performance_schema_on = ps_raw in ('1', 'on', 'yes', 'true')
-
-                    slow_raw = str(vars_map.get('slow_query_log', '')).strip().lower()
-                    slow_query_log = slow_raw in ('1', 'on', 'yes', 'true')
-
-                    long_query_time = vars_map.get('long_query_time')
-
-                    log_output_raw = str(vars_map.get('log_output') or '')
+                    performance_schema_on = overview['performance_schema'] == 'ON'
+                    slow_query_log = overview['slow_query_log'] == 'ON'
+                    log_output_raw = overview['log_output']
                     log_output_norm = log_output_raw.strip().upper()
                     # 支持 FILE, TABLE 或组合 'FILE,TABLE'
                     has_table_output = any(p.strip() == 'TABLE' for p in log_output_norm.split(',') if p.strip())
+                    slow_file = overview['slow_query_log_file']
 
-                    slow_file = str(vars_map.get('slow_query_log_file') or '').strip()
-
-                    overview = {
-                        'performance_schema': 'ON' if performance_schema_on else 'OFF',
-                        'slow_query_log': 'ON' if slow_query_log else 'OFF',
-                        'long_query_time': float(long_query_time) if str(long_query_time).replace('.', '', 1).isdigit() else long_query_time,
-                        'log_output': log_output_raw,
-                        'slow_query_log_file': slow_file or ''
-                    }
-
-                    # 1) P_S Top Digest
+                    # 1) P_S Top Digest（累计值）；有快照时另给出最近一小时的区间统计
                     if performance_schema_on:
                         ps_top = self._collect_ps_top(cur, top=top, min_avg_ms=min_avg_ms)
-                    else:
+                        ps_recent = digest_history.top(inst.id, minutes=60, top=top)
+                    elif not has_table_output:
                         warnings.append('performance_schema 未开启，无法生成 Top SQL 指纹统计')
 
                     # 2) TABLE 抽样（来自 mysql.slow_log，可选；不再使用 LOAD_FILE）
@@ -137,19 +123,107 @@ class SlowLogService:
                     elif slow_query_log and not has_table_output:
                         warnings.append('慢日志未以 TABLE 输出（当前 log_output=%s），跳过表抽样' % log_output_raw)
 
+                # 4) FILE 输出：慢日志文件在本机可读时，解析末尾 tail_kb KB
+                file_top: List[Dict[str, Any]] = []
+                file_tail: Dict[str, Any] = {}
+                has_file_output = 'FILE' in [p.strip() for p in log_output_norm.split(',')]
+                if slow_query_log and has_file_output and slow_file and tail_kb > 0:
+                    try:
+                        path = self.resolve_local_file(slow_file)
+                        offset = max(0, os.path.getsize(path) - int(tail_kb) * 1024)
+                        ok, file_data, file_msg = self.analyze_file(
+                            path, offset=offset, follow=True, top=top, min_avg_ms=min_avg_ms
+                        )
+                        if ok:
+                            file_top = file_data.pop('digests', [])
+                            file_tail = file_data
+                        else:
+                            warnings.append(f'慢日志文件解析失败: {file_msg}')
+                    except ValueError as e:
+                        warnings.append(f'慢日志文件无法在本机读取（{e}），可上传文件分析')
+
+                # 3) P_S 未开启时，改用本地采集的慢日志做指纹聚合
+                slowlog_top: List[Dict[str, Any]] = []
+                if not performance_schema_on and has_table_output:
+                    ok, digest_data, digest_msg = self.digests(inst, top=top, min_avg_ms=min_avg_ms)
+                    if ok:
+                        slowlog_top = digest_data.get('digests', [])
+                        warnings.append('performance_schema 未开启，Top SQL 改为基于慢日志的指纹统计')
+                    else:
+                        warnings.append(f'performance_schema 未开启，慢日志指纹统计失败: {digest_msg}')
+
                 data = {
                     'overview': overview,
                     'ps_top': ps_top,
+                    'ps_recent': ps_recent,
+                    'slowlog_top': slowlog_top,
+                    'file_top': file_top,
+                    'file_tail': file_tail,
                     'file_samples': file_samples,
                     'warnings': warnings
                 }
                 return True, data, 'OK'
-            finally:
-                conn.close()
         except Exception as e:
             logger.error(f"慢日志分析失败(实例ID={getattr(inst, 'id', None)}): {e}")
             return False, {}, f"连接或查询失败: {e}"
 
+    def summary(self, inst: Instance, min_avg_ms: int = 10) -> Optional[Dict[str, Any]]:
+        """供配置/架构分析使用的简要慢日志摘要：优先使用 mysql.slow_log（TABLE），
+        其次降级到 analyze（P_S + 文件抽样）；均不可用时返回 None。
+        分析结果缓存键（summary_signature）与提示词都取自这里的返回值"""
+        try:
+            ok_tbl, data_tbl, _ = self.list_from_table(inst, page=1, page_size=5, filters={})
+            if ok_tbl:
+                examples = []
+                for it in data_tbl.get('items', [])[:5]:
+                    examples.append({
+                        'start_time': it.get('start_time'),
+                        'db': it.get('db'),
+                        'user_host': it.get('user_host'),
+                        'query_time': it.get('query_time'),
+                        'rows_examined': it.get('rows_examined'),
+                        'sql_text': (it.get('sql_text') or '')[:200]
+                    })
+                return {
+                    'mode': 'TABLE',
+                    'overview': data_tbl.get('overview', {}),
+                    'total': data_tbl.get('total', 0),
+                    'examples': examples
+                }
+            ok_ps, data_ps, _ = self.analyze(inst, top=5, min_avg_ms=min_avg_ms, tail_kb=128)
+            if ok_ps:
+                return {
+                    'mode': 'ANALYZE',
+                    'overview': data_ps.get('overview', {}),
+                    'ps_top': data_ps.get('ps_top', [])[:5],
+                    'file_samples': [
+                        {k: v for k, v in s.items() if k in ('time', 'db', 'user_host', 'query_time_ms', 'rows_examined', 'sql')}
+                        for s in (data_ps.get('file_samples', [])[:3] or [])
+                    ],
+                    'warnings': data_ps.get('warnings', [])
+                }
+        except Exception as e:
+            logger.warning(f"构建慢日志摘要失败(实例ID={getattr(inst, 'id', None)}): {e}")
+        return None
+
+    @staticmethod
+    def summary_signature(summary: Optional[Dict[str, Any]]) -> Any:
+        """慢日志摘要的稳定签名（用于分析结果缓存键）：只取出现的 SQL 指纹与数量级，不含时间与耗时细节"""
+        if not summary:
+            return None
+        if summary.get('mode') == 'TABLE':
+            total = summary.get('total')
+            return {
+                'mode': 'TABLE',
+                'total': int(total).bit_length() if isinstance(total, int) else None,
+                'examples': sorted({fingerprint_id(fingerprint(e.get('sql_text') or '')) for e in summary.get('examples', [])}),
+            }
+        return {
+            'mode': summary.get('mode'),
+            'ps_top': sorted(t.get('digest') or '' for t in summary.get('ps_top', [])),
+            'file_samples': sorted({fingerprint_id(fingerprint(f.get('sql') or '')) for f in summary.get('file_samples', [])}),
+        }
+
     def _collect_ps_top(self, cur, top: int, min_avg_ms: int) -> List[Dict[str, Any]]:
         # 为兼容性，尽量只取通用字段；在SQL侧按“平均耗时”降序排序，并用阈值过滤，避免先按总耗时LIMIT导致全部被后置过滤清空
         sql = (
@@ -200,146 +274,258 @@ class SlowLogService:
         return top_list
 
 
-    # 新增：从 mysql.slow_log 按条件分页查询
+    @staticmethod
+    def _parse_time(value: str) -> Optional[datetime]:
+        """解析前端传入的时间（'YYYY-MM-DD HH:MM:SS' 或 ISO 8601），按字面时间比较，忽略时区"""
+        value = (value or '').strip()
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            raise ValueError(f"时间格式错误: {value}")
+
+    @staticmethod
+    def encode_cursor(start_time: datetime, entry_id: int) -> str:
+        """不透明游标：(start_time, id) 的 base64url 编码"""
+        raw = json.dumps({'t': start_time.isoformat(), 'i': entry_id}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return datetime.fromisoformat(data['t']), int(data['i'])
+        except Exception:
+            raise ValueError("无效的分页游标")
+
+    def _filtered_query(self, instance_id: int, filters: Dict[str, Any]):
+        query = SlowLogEntry.query.filter(SlowLogEntry.instance_id == instance_id)
+
+        keyword = (filters.get('keyword') or '').strip()
+        if keyword:
+            query = query.filter(SlowLogEntry.sql_text.contains(keyword, autoescape=True))
+
+        user_host = (filters.get('user_host') or '').strip()
+        if user_host:
+            query = query.filter(SlowLogEntry.user_host.contains(user_host, autoescape=True))
+
+        dbname = (filters.get('db') or '').strip()
+        if dbname:
+            query = query.filter(SlowLogEntry.db_name == dbname)
+
+        start_time = self._parse_time(filters.get('start_time'))
+        end_time = self._parse_time(filters.get('end_time'))
+        if start_time:
+            query = query.filter(SlowLogEntry.start_time >= start_time)
+        if end_time:
+            query = query.filter(SlowLogEntry.start_time <= end_time)
+        return query
+
+    def _cached_count(self, query, instance_id: int, filters: Dict[str, Any], wm: SlowLogWatermark) -> Tuple[int, bool]:
+        """总数缓存：本地数据只在采集时变化，键中带上采集进度，过期时间兜底清理带来的变化"""
+        key = (
+            instance_id,
+            tuple(sorted((k, (v or '').strip()) for k, v in filters.items())),
+            wm.rows_ingested,
+            wm.last_start_time,
+        )
+        now = time.monotonic()
+        with self._count_lock:
+            hit = self._count_cache.get(key)
+            if hit and hit[0] > now:
+                self._count_cache.move_to_end(key)
+                return hit[1], True
+        total = query.order_by(None).count()
+        with self._count_lock:
+            self._count_cache[key] = (now + self.count_cache_ttl, total)
+            self._count_cache.move_to_end(key)
+            while len(self._count_cache) > self.count_cache_size:
+                self._count_cache.popitem(last=False)
+        return total, False
+
+    def digests(
+        self,
+        inst: Instance,
+        filters: Optional[Dict[str, Any]] = None,
+        top: int = 20,
+        order_by: str = 'sum',
+        min_avg_ms: float = 0.0
+    ) -> Tuple[bool, Dict[str, Any], str]:
+        """基于本地采集的慢日志按 SQL 指纹聚合（不依赖 performance_schema）。
+        逐批流式读取，只取聚合所需的列，内存占用与记录数无关。"""
+        if not inst:
+            return False, {}, "实例不存在"
+        if (inst.db_type or '').strip() != 'MySQL':
+            return False, {}, "仅支持MySQL实例"
+        try:
+            try:
+                query = self._filtered_query(inst.id, filters or {})
+            except ValueError as e:
+                return False, {}, str(e)
+            rows = query.with_entities(
+                SlowLogEntry.sql_text, SlowLogEntry.query_time, SlowLogEntry.lock_time,
+                SlowLogEntry.rows_sent, SlowLogEntry.rows_examined, SlowLogEntry.start_time, SlowLogEntry.db_name
+            ).yield_per(self.digest_batch_size)
+            aggregator = SlowQueryAggregator(max_fingerprints=self.digest_max_fingerprints)
+            for sql_text, query_time, lock_time, rows_sent, rows_examined, start_time, db_name in rows:
+                aggregator.add(sql_text, query_time, lock_time, rows_sent, rows_examined, start_time, db_name)
+            return True, aggregator.result(top=top, order_by=order_by, min_avg_ms=min_avg_ms), 'OK'
+        except Exception as e:
+            logger.error(f"慢日志指纹聚合失败(实例ID={getattr(inst, 'id', None)}): {e}")
+            return False, {}, f"聚合失败: {e}"
+
+    def resolve_local_file(self, path: str) -> str:
+        """校验慢日志文件路径：必须是 SLOWLOG_FILE_DIRS 内的普通文件，返回真实路径"""
+        path = (path or '').strip()
+        if not path or not os.path.isabs(path):
+            raise ValueError("需要绝对路径")
+        if not self.file_dirs:
+            raise ValueError("未配置 SLOWLOG_FILE_DIRS")
+        real = os.path.realpath(path)
+        if not any(real == d or real.startswith(d + os.sep) for d in self.file_dirs):
+            raise ValueError("路径不在 SLOWLOG_FILE_DIRS 允许的目录内")
+        if not os.path.isfile(real):
+            raise ValueError("文件不存在")
+        return real
+
+    def analyze_file(
+        self,
+        source,
+        offset: int = 0,
+        file_id: Optional[str] = None,
+        follow: bool = False,
+        top: int = 20,
+        order_by: str = 'sum',
+        min_avg_ms: float = 0.0
+    ) -> Tuple[bool, Dict[str, Any], str]:
+        """解析 FILE 格式慢日志并按指纹聚合。
+        source 为已校验的本地路径（mmap 读取）或二进制流（上传文件，分块读取）。
+        从 offset 开始读，返回 next_offset 供下次增量续读；本地文件带 file_id（设备号:inode），
+        传入的 file_id 不一致或 offset 超过文件大小时视为日志已轮转，从头读取。"""
+        started = time.monotonic()
+        offset = max(0, int(offset or 0))
+        parser = SlowLogFileParser()
+        aggregator = SlowQueryAggregator(max_fingerprints=self.digest_max_fingerprints)
+        rotated = False
+        current_id = None
+        size = None
+        try:
+            if isinstance(source, str):
+                st = os.stat(source)
+                size = st.st_size
+                current_id = f'{st.st_dev}:{st.st_ino}'
+                if (file_id and file_id != current_id) or offset > size:
+                    offset, rotated = 0, True
+                events = parser.parse_file(source, offset=offset, follow=follow)
+            else:
+                events = parser.parse_stream(source, offset=offset, follow=follow)
+            aggregator.add_rows(events)
+        except Exception as e:
+            logger.error(f"慢日志文件解析失败: {e}")
+            return False, {}, f"解析失败: {e}"
+        data = aggregator.result(top=top, order_by=order_by, min_avg_ms=min_avg_ms)
+        data.update({
+            'offset': offset,
+            'next_offset': parser.offset,
+            'bytes_read': parser.offset - offset,
+            'file_size': size,
+            'file_id': current_id,
+            'rotated': rotated,
+            'events': parser.events,
+            'skipped': parser.skipped,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+        })
+        return True, data, 'OK'
+
+    # 从本地采集的慢日志按条件分页查询（数据由 slowlog_ingester 从 mysql.slow_log 增量同步）
     def list_from_table(
         self,
         inst: Instance,
         page: int = 1,
         page_size: int = 10,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True
     ) -> Tuple[bool, Dict[str, Any], str]:
+        """按 (start_time, id) 倒序分页。
+        传入 cursor（上一页返回的 next_cursor）时走键集分页，任意深度的翻页代价相同；
+        未传 cursor 时第 1 页同样走键集分页，page > 1 兼容旧的 OFFSET 跳页。
+        include_total=False 时不统计总数；统计结果按筛选条件缓存。"""
         if not inst:
             return False, {}, "实例不存在"
         if (inst.db_type or '').strip() != 'MySQL':
             return False, {}, "仅支持MySQL实例"
         try:
-            conn = self._connect(inst)
+            wm = db.session.get(SlowLogWatermark, inst.id)
+            # 首次访问，或后台采集未覆盖（未开启监控、刚从异常恢复、后台采集关闭）导致数据超过
+            # 一个采集周期：同步补采一次；实例当前异常时直接使用已采集的数据，不等待连接超时
+            stale = wm is not None and wm.last_ingest_at is not None and inst.status != 'error' and \
+                datetime.utcnow() - wm.last_ingest_at > timedelta(seconds=max(0.0, slowlog_ingester.interval))
+            if wm is None or wm.last_ingest_at is None or stale:
+                ok, _, msg = slowlog_ingester.ingest(inst)
+                wm = db.session.get(SlowLogWatermark, inst.id)
+                if wm is None or (not ok and wm.last_start_time is None and not wm.log_output):
+                    return False, {}, msg
+            overview = {
+                'slow_query_log': wm.slow_query_log or '',
+                'log_output': wm.log_output or '',
+            }
+            if not has_table_output(wm.log_output):
+                return False, {'overview': overview}, "仅支持 log_output 包含 TABLE 的数据库"
+
+            # 动态构造查询
+            filters = filters or {}
             try:
-                with conn.cursor() as cur:
-                    # 读取变量，判定 log_output 是否包含 TABLE
-                    cur.execute(
-                        """
-                        SHOW GLOBAL VARIABLES WHERE Variable_name IN ('slow_query_log','log_output')
-                        """
-                    )
-                    vr = cur.fetchall() or []
-                    vmap = {r['Variable_name']: r['Value'] for r in vr}
-                    log_output = str(vmap.get('log_output') or '').strip().upper()
-                    has_table = any(p.strip() == 'TABLE' for p in log_output.split(',') if p.strip())
-                    overview = {
-                        'slow_query_log': str(vmap.get('slow_query_log') or ''),
-                        'log_output': str(vmap.get('log_output') or ''),
-                    }
-                    if not has_table:
-                        return False, {'overview': overview}, "仅支持 log_output 包含 TABLE 的数据库"
-
-                    # 动态构造查询
-                    filters = filters or {}
-                    where_clauses: List[str] = []
-                    params: List[Any] = []
-
-                    keyword = (filters.get('keyword') or '').strip()
-                    if keyword:
-                        where_clauses.append("sql_text LIKE %s")
-                        params.append(f"%{keyword}%")
-
-                    user_host = (filters.get('user_host') or '').strip()
-                    if user_host:
-                        where_clauses.append("user_host LIKE %s")
-                        params.append(f"%{user_host}%")
-
-                    dbname = (filters.get('db') or '').strip()
-                    if dbname:
-                        where_clauses.append("db = %s")
-                        params.append(dbname)
-
-                    start_time = (filters.get('start_time') or '').strip()
-                    if start_time:
-                        where_clauses.append("start_time >= %s")
-                        params.append(start_time)
-
-                    end_time = (filters.get('end_time') or '').strip()
-                    if end_time:
-                        where_clauses.append("start_time <= %s")
-                        params.append(end_time)
-
-                    where_sql = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
-
-                    # 统计总数
-                    count_sql = f"SELECT COUNT(*) AS cnt FROM mysql.slow_log{where_sql}"
-                    cur.execute(count_sql, params)
-                    count_row = cur.fetchone() or {}
-                    total = int(count_row.get('cnt') or 0)
-
-                    # 分页数据
-                    try:
-                        page = max(1, int(page))
-                    except Exception:
-                        page = 1
-                    try:
-                        page_size = max(1, min(100, int(page_size)))
-                    except Exception:
-                        page_size = 10
-                    offset = (page - 1) * page_size
-
-                    data_sql = (
-                        "SELECT start_time, user_host, db, query_time, lock_time, rows_sent, rows_examined, sql_text "
-                        "FROM mysql.slow_log"
-                        f"{where_sql} "
-                        "ORDER BY start_time DESC LIMIT %s OFFSET %s"
-                    )
-                    cur.execute(data_sql, params + [page_size, offset])
-                    rows = cur.fetchall() or []
-
-                    # 安全转换时间为秒（兼容 datetime.timedelta/TIME 类型）
-                    def _sec(val):
-                        try:
-                            return float(val.total_seconds()) if hasattr(val, 'total_seconds') else float(val or 0)
-                        except Exception:
-                            return 0.0
-
-                    # 统一将文本/时间字段转为可 JSON 序列化的字符串
-                    def _s(val):
-                        if val is None:
-                            return ''
-                        try:
-                            import datetime as _dt
-                            if isinstance(val, (_dt.datetime,)):
-                                return val.strftime('%Y-%m-%d %H:%M:%S')
-                        except Exception:
-                            pass
-                        if isinstance(val, (bytes, bytearray)):
-                            try:
-                                return val.decode('utf-8', errors='ignore')
-                            except Exception:
-                                return ''
-                        return str(val)
-
-                    items: List[Dict[str, Any]] = []
-                    for r in rows:
-                        items.append({
-                            'start_time': _s(r.get('start_time')),
-                            'user_host': _s(r.get('user_host')),
-                            'db': _s(r.get('db')),
-                            'query_time': _sec(r.get('query_time')),
-                            'lock_time': _sec(r.get('lock_time')),
-                            'rows_sent': int(r.get('rows_sent') or 0),
-                            'rows_examined': int(r.get('rows_examined') or 0),
-                            'sql_text': _s(r.get('sql_text'))
-                        })
-                    data = {
-                        'overview': overview,
-                        'items': items,
-                        'total': total,
-                        'page': page,
-                        'page_size': page_size,
-                    }
-                    return True, data, 'OK'
-            finally:
-                conn.close()
+                query = self._filtered_query(inst.id, filters)
+                after = self.decode_cursor(cursor) if cursor else None
+            except ValueError as e:
+                return False, {}, str(e)
+
+            try:
+                page = max(1, int(page))
+            except Exception:
+                page = 1
+            try:
+                page_size = max(1, min(100, int(page_size)))
+            except Exception:
+                page_size = 10
+
+            total, total_cached = (None, False)
+            if include_total:
+                total, total_cached = self._cached_count(query, inst.id, filters, wm)
+
+            ordered = query.order_by(SlowLogEntry.start_time.desc(), SlowLogEntry.id.desc())
+            if after:
+                after_time, after_id = after
+                ordered = ordered.filter(or_(
+                    SlowLogEntry.start_time < after_time,
+                    and_(SlowLogEntry.start_time == after_time, SlowLogEntry.id < after_id)
+                ))
+            elif page > 1:
+                ordered = ordered.offset((page - 1) * page_size)
+            # 多取一条判断是否还有下一页
+            rows = ordered.limit(page_size + 1).all()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            next_cursor = self.encode_cursor(rows[-1].start_time, rows[-1].id) if has_more and rows else None
+
+            data = {
+                'overview': overview,
+                'items': [r.to_dict() for r in rows],
+                'total': total,
+                'total_cached': total_cached,
+                'page': page,
+                'page_size': page_size,
+                'has_more': has_more,
+                'next_cursor': next_cursor,
+                'ingest': wm.to_dict(),
+            }
+            return True, data, 'OK'
         except Exception as e:
-            logger.error(f"查询慢日志表失败(实例ID={getattr(inst, 'id', None)}): {e}")
-            return False, {}, f"连接或查询失败: {e}"
+            logger.error(f"查询慢日志失败(实例ID={getattr(inst, 'id', None)}): {e}")
+            return False, {}, f"查询失败: {e}"
 
 
 slowlog_service = SlowLogService()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, func
+
+from .. import db
+from ..models import SqlAnalysisCacheEntry
+from .sql_fingerprint import fingerprint, fingerprint_id, rebind_literals
+
+logger = logging.getLogger(__name__)
+
+
+class SqlAnalysisCache:
+    """SQL 分析（LLM）结果的持久化缓存。
+
+    同一结构、不同参数的语句反复提交分析时，按（实例、库、语句指纹）命中上次的结果，
+    不再调用 LLM。条目记录生成时涉及表的结构签名（TableAnalyzerService.schema_signature），
+    列或索引变化后签名不同即视为失效，下次分析时覆盖。重写 SQL 中的字面量按位置换绑为
+    本次语句的值；无法可靠换绑时按未命中处理，重新分析。
+    """
+
+    def __init__(self):
+        self.ttl_hours = float(os.getenv('SQL_ANALYSIS_CACHE_TTL_HOURS', '168'))
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._schema_changed = 0
+        self._rebind_failed = 0
+        self._stores = 0
+        self._last_purge = 0.0
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def lookup(self, instance_id: int, database: str, sql: str, schema_hash: str) -> Optional[Dict[str, Any]]:
+        """命中时返回 {'analysis', 'rewritten_sql', 'cached_at'}，否则 None"""
+        entry = SqlAnalysisCacheEntry.query.filter_by(
+            instance_id=instance_id, db_name=database, fingerprint_id=fingerprint_id(fingerprint(sql))
+        ).first()
+        if entry is None or entry.created_at < datetime.utcnow() - timedelta(hours=self.ttl_hours):
+            self._count('_misses')
+            return None
+        if entry.schema_hash != schema_hash:
+            self._count('_schema_changed')
+            self._count('_misses')
+            return None
+        rewritten = None
+        if entry.rewritten_sql:
+            rewritten = rebind_literals(entry.rewritten_sql, entry.sample_sql, sql)
+            if rewritten is None:
+                self._count('_rebind_failed')
+                self._count('_misses')
+                return None
+        self._count('_hits')
+        try:
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_hit_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.debug(f"更新SQL分析缓存命中次数失败: {e}")
+        return {'analysis': entry.analysis, 'rewritten_sql': rewritten, 'cached_at': entry.created_at}
+
+    def store(self, instance_id: int, database: str, sql: str, schema_hash: str, result: Dict[str, Any]):
+        fp = fingerprint(sql)
+        fid = fingerprint_id(fp)
+        try:
+            entry = SqlAnalysisCacheEntry.query.filter_by(
+                instance_id=instance_id, db_name=database, fingerprint_id=fid
+            ).first()
+            if entry is None:
+                entry = SqlAnalysisCacheEntry(instance_id=instance_id, db_name=database, fingerprint_id=fid)
+                db.session.add(entry)
+            entry.fingerprint = fp
+            entry.schema_hash = schema_hash
+            entry.sample_sql = sql
+            entry.analysis = result.get('analysis')
+            entry.rewritten_sql = result.get('rewritten_sql')
+            entry.hits = 0
+            entry.created_at = datetime.utcnow()
+            entry.last_hit_at = None
+            db.session.commit()
+            self._count('_stores')
+        except Exception as e:
+            # 并发写入同一键时唯一约束冲突，保留先写入的结果即可
+            db.session.rollback()
+            logger.debug(f"写入SQL分析缓存失败: {e}")
+        self._purge_expired()
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        cutoff = datetime.utcnow() - timedelta(hours=self.ttl_hours)
+        try:
+            table = SqlAnalysisCacheEntry.__table__
+            db.session.execute(delete(table).where(table.c.created_at < cutoff))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"清理过期SQL分析缓存失败: {e}")
+
+    def clear(self, instance_id: Optional[int] = None) -> int:
+        table = SqlAnalysisCacheEntry.__table__
+        stmt = delete(table)
+        if instance_id is not None:
+            stmt = stmt.where(table.c.instance_id == instance_id)
+        result = db.session.execute(stmt)
+        db.session.commit()
+        return result.rowcount or 0
+
+    def drop_instance(self, instance_id: int):
+        """实例删除后清理其缓存条目（由调用方提交事务）"""
+        table = SqlAnalysisCacheEntry.__table__
+        db.session.execute(delete(table).where(table.c.instance_id == instance_id))
+
+    def stats(self) -> Dict[str, Any]:
+        entries, stored_hits = db.session.query(
+            func.count(SqlAnalysisCacheEntry.id), func.coalesce(func.sum(SqlAnalysisCacheEntry.hits), 0)
+        ).one()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': entries,
+                'stored_hits': int(stored_hits),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else None,
+                'schema_changed': self._schema_changed,
+                'rebind_failed': self._rebind_failed,
+                'stores': self._stores,
+                'ttl_hours': self.ttl_hours,
+            }
+
+
+# 全局实例
+sql_analysis_cache = SqlAnalysisCache()
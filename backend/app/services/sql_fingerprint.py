@@ -0,0 +1,190 @@
+import hashlib
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Optional
+
+# 按出现顺序依次替换；字符串需先于数字处理，避免替换引号内的数字
+_COMMENT_BLOCK = re.compile(r'/\*.*?\*/', re.S)
+_COMMENT_LINE = re.compile(r'(?:--\s|#)[^\n]*')
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"", re.S)
+_HEX = re.compile(r"\b0x[0-9a-f]+\b|\bx'[0-9a-f]*'", re.I)
+# 符号只在一元时属于数字（见 _is_unary），a-1 与 a - 1 都规范为 a - ?
+_NUMBER = re.compile(r'(?:([-+])\s*)?(?<![\w`.])\d+(?:\.\d+)?(?:e[-+]?\d+)?\b', re.I)
+_BOOL = re.compile(r'\b(?:true|false)\b', re.I)
+_TOKEN = re.compile(r"`(?:[^`]|``)*`|@@?[\w$.]*|[\w$]+|<=>|->>|->|<=|>=|<>|!=|:=|\|\||&&|<<|>>|\S")
+# 以下在记号规范化之后执行：关键字已小写、空白已统一
+_IN_LIST = re.compile(r'\bin \(\?(?:, \?)*\)')
+_VALUES_LIST = re.compile(r'\b(values?) \(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*')
+_LIMIT = re.compile(r'\blimit \?(?:, \?| offset \?)?')
+
+# 前一个非空白字符为这些字符（或位于开头）时，+/- 是一元正负号
+_UNARY_AFTER = frozenset('=<>!(,+-*/%&|^~')
+
+# 保留字不能作为未加引号的标识符，总是小写
+_RESERVED = frozenset("""
+    select from where and or not in is null like between join inner outer left right cross natural straight_join
+    on using group by order having limit asc desc distinct distinctrow as insert into values update set delete
+    replace union all exists case when then else end for lock with recursive interval force use ignore index key
+    primary duplicate div mod xor regexp rlike collate binary partition over window rows range unbounded preceding
+    following current_date current_time current_timestamp current_user localtime localtimestamp utc_date utc_time
+    utc_timestamp create alter drop table call explain describe show default high_priority low_priority delayed
+    sql_calc_found_rows sql_small_result sql_big_result separator convert char if unique check references foreign
+    constraint to of leading trailing both match row except intersect lateral unsigned decimal int integer bigint
+    smallint tinyint double float day_hour day_minute day_second hour_minute hour_second minute_second
+    year_month read write
+""".split())
+# 非保留关键字也可能是表名或列名：跟在 . 之后或处于表名位置时保持原样
+_NONRESERVED = frozenset("""
+    offset value share mode nowait skip locked unknown escape day hour minute second week month quarter year
+    microsecond date time timestamp datetime begin commit rollback start transaction work any some truncate signed
+    global session local full json temporary view tables columns status variables processlist
+""".split())
+_TABLE_POSITION = frozenset(('from', 'join', 'straight_join', 'into', 'update', 'table'))
+_INSERT_TARGET_BEFORE = frozenset(('insert', 'replace', 'ignore'))
+_NO_SPACE_BEFORE = frozenset((',', ')', '.', ';'))
+_NO_SPACE_AFTER = frozenset(('(', '.'))
+
+
+def _is_unary(text: str, sign_at: int) -> bool:
+    i = sign_at - 1
+    while i >= 0 and text[i].isspace():
+        i -= 1
+    return i < 0 or text[i] in _UNARY_AFTER
+
+
+def _number_to_placeholder(m) -> str:
+    if m.group(1) and not _is_unary(m.string, m.start()):
+        # 二元运算符保留
+        return m.group(1) + ' ?'
+    return '?'
+
+
+def _normalize_tokens(text: str) -> str:
+    """按记号重新拼接：关键字与函数名小写，其余标识符保持原样；运算符两侧各一个空格，
+    逗号前、括号内侧、. 两侧与函数名和左括号之间不留空格"""
+    tokens = _TOKEN.findall(text)
+    out = []
+    prev = None
+    # 前一个记号是否为非关键字的标识符（其后的左括号紧贴，如函数调用与 INSERT 的列清单）
+    prev_name = False
+    for i, token in enumerate(tokens):
+        head = token[0]
+        is_name = False
+        if head.isalpha() or head == '_' or head == '$':
+            lower = token.lower()
+            if prev == '.':
+                is_name = True
+            elif lower in _RESERVED:
+                token = lower
+            elif lower in _NONRESERVED and prev not in _TABLE_POSITION:
+                token = lower
+            else:
+                is_name = True
+                if prev not in _TABLE_POSITION and prev not in _INSERT_TARGET_BEFORE \
+                        and i + 1 < len(tokens) and tokens[i + 1] == '(':
+                    # 函数名不区分大小写
+                    token = lower
+        elif head == '`':
+            is_name = True
+        if out and token not in _NO_SPACE_BEFORE and prev not in _NO_SPACE_AFTER \
+                and not (token == '(' and prev_name):
+            out.append(' ')
+        out.append(token)
+        prev, prev_name = token, is_name
+    return ''.join(out)
+
+
+@lru_cache(maxsize=20000)
+def fingerprint(sql: str) -> str:
+    """把 SQL 规范化为指纹：字面量替换为 ?、IN/VALUES 列表折叠、去注释、统一空白与关键字大小写。
+
+    相同结构、不同参数的语句得到同一指纹，例如
+    ``SELECT * FROM t WHERE id IN (1, 2, 3) AND name='x'`` ->
+    ``select * from t where id in (?+) and name = ?``
+    运算符与标点两侧的空白统一；只有关键字与函数名转小写，表名等标识符保持原样
+    （lower_case_table_names=0 时 Orders 与 orders 是不同的表）。
+    """
+    if not sql:
+        return ''
+    text = sql
+    # 各步骤先做子串判断，跳过不可能命中的正则
+    if '/*' in text:
+        text = _COMMENT_BLOCK.sub(' ', text)
+    # X'..' 需先于字符串处理，否则引号部分会先被当作字符串
+    if '0x' in text or '0X' in text or "x'" in text or "X'" in text:
+        text = _HEX.sub('?', text)
+    if "'" in text or '"' in text:
+        text = _STRING.sub('?', text)
+    if '--' in text or '#' in text:
+        text = _COMMENT_LINE.sub(' ', text)
+    text = _NUMBER.sub(_number_to_placeholder, text)
+    text = _BOOL.sub('?', text)
+    text = _normalize_tokens(text).rstrip(';').strip()
+    if 'in' in text:
+        text = _IN_LIST.sub('in (?+)', text)
+    if 'value' in text:
+        text = _VALUES_LIST.sub(lambda m: f'{m.group(1)} (?+)', text)
+    if 'limit' in text:
+        text = _LIMIT.sub('limit ?', text)
+    return text
+
+
+def fingerprint_id(fp: str) -> str:
+    """指纹的短哈希，作为稳定的摘要ID"""
+    return hashlib.sha1(fp.encode('utf-8', errors='ignore')).hexdigest()[:16]
+
+
+# 原始大小写下的字面量（字符串、十六进制、数字），用于在同指纹语句之间换绑参数
+_LITERAL = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\""
+    r"|\b0[xX][0-9a-fA-F]+\b|\b[xX]'[0-9a-fA-F]*'"
+    r"|(?:[-+]\s*)?(?<![\w`.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"
+)
+
+
+def _literal_value(m) -> str:
+    # 与 fingerprint 一致：二元运算符不属于其后的数字
+    text = m.group(0)
+    if text[0] in '+-' and not _is_unary(m.string, m.start()):
+        return text[1:].lstrip()
+    return text
+
+
+def _literals(sql: str):
+    return [_literal_value(m) for m in _LITERAL.finditer(sql)]
+
+
+def rebind_literals(template: str, source_sql: str, target_sql: str) -> Optional[str]:
+    """把为 source_sql 生成的 template（如重写后的 SQL）中的字面量换成 target_sql 对应位置的值。
+
+    两条语句按出现顺序逐个对应字面量，只换绑取值发生变化的字面量，且要求该值在 source_sql 与
+    template 中都恰好出现一次：同一个值出现多次时无法判断 template 中哪一处是参数
+    （如 WHERE a = 1 ... ORDER BY 1、INTERVAL 1 DAY），换错会改变语义。
+    字面量个数不同（如 IN 列表长度不同）、同一个值对应多个新值或不满足上述条件时返回 None，
+    由调用方按未命中处理。
+    """
+    if source_sql == target_sql:
+        return template
+    old = _literals(source_sql)
+    new = _literals(target_sql)
+    if len(old) != len(new):
+        return None
+    mapping: Dict[str, str] = {}
+    for o, n in zip(old, new):
+        if mapping.setdefault(o, n) != n:
+            return None
+    changes = {o: n for o, n in mapping.items() if o != n}
+    if not changes:
+        return template
+    old_counts = Counter(old)
+    template_counts = Counter(_literals(template))
+    for o in changes:
+        if old_counts[o] != 1 or template_counts[o] != 1:
+            return None
+
+    def replace(m):
+        value = _literal_value(m)
+        return m.group(0)[:len(m.group(0)) - len(value)] + changes.get(value, value)
+
+    return _LITERAL.sub(replace, template)
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+
+from .. import db
+from ..models import Instance
+from .instance_registry import instance_registry
+
+logger = logging.getLogger(__name__)
+
+
+class StatusWriteBuffer:
+    """监控结果写缓冲（write-behind）。
+
+    - 状态翻转：最多延迟 flush_interval 秒，合并为一次批量 UPDATE 落库；
+    - 仅 last_check_time 变化的“心跳”：只保留每个实例最新一次的时间，
+      每 heartbeat_interval 秒批量落库一次，期间由 overlay() 提供内存中的最新值。
+    """
+
+    def __init__(self):
+        self.flush_interval = float(os.getenv('MONITOR_STATUS_FLUSH_MS', '500')) / 1000.0
+        self.heartbeat_interval = float(os.getenv('MONITOR_HEARTBEAT_FLUSH_SECONDS', '60'))
+        self._transitions: Dict[int, Tuple[str, datetime]] = {}
+        self._heartbeats: Dict[int, datetime] = {}
+        self._first_pending: Optional[float] = None
+        self._last_heartbeat_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, instance_id: int, status: str, check_time: datetime, changed: bool):
+        with self._lock:
+            if changed or instance_id in self._transitions:
+                # 未落库的翻转上再有结果时直接覆盖，保证最终写入的是最新状态
+                self._transitions[instance_id] = (status, check_time)
+                self._heartbeats.pop(instance_id, None)
+                if self._first_pending is None:
+                    self._first_pending = time.monotonic()
+            else:
+                self._heartbeats[instance_id] = check_time
+
+    def has_pending_transitions(self) -> bool:
+        with self._lock:
+            return bool(self._transitions)
+
+    def discard(self, instance_id: int):
+        """实例删除后丢弃其待写入记录"""
+        with self._lock:
+            self._transitions.pop(instance_id, None)
+            self._heartbeats.pop(instance_id, None)
+
+    def overlay(self, instance_id: int, status: str, last_check_time: Optional[datetime]) -> Tuple[str, Optional[datetime]]:
+        """用缓冲中尚未落库的值覆盖数据库读出的 status/last_check_time"""
+        with self._lock:
+            pending = self._transitions.get(instance_id)
+            heartbeat = self._heartbeats.get(instance_id)
+        if pending:
+            status, pending_time = pending
+            if last_check_time is None or pending_time > last_check_time:
+                last_check_time = pending_time
+        if heartbeat and (last_check_time is None or heartbeat > last_check_time):
+            last_check_time = heartbeat
+        return status, last_check_time
+
+    def flush(self, force: bool = False) -> int:
+        """按时间条件（或 force）批量落库，返回写入的实例数。需在应用上下文中调用。"""
+        now = time.monotonic()
+        with self._lock:
+            take_transitions = bool(self._transitions) and (
+                force or (self._first_pending is not None and now - self._first_pending >= self.flush_interval)
+            )
+            take_heartbeats = bool(self._heartbeats) and (
+                force or now - self._last_heartbeat_flush >= self.heartbeat_interval
+            )
+            transitions = self._transitions if take_transitions else {}
+            heartbeats = self._heartbeats if take_heartbeats else {}
+            if take_transitions:
+                self._transitions = {}
+                self._first_pending = None
+            if take_heartbeats:
+                self._heartbeats = {}
+                self._last_heartbeat_flush = now
+        if not transitions and not heartbeats:
+            return 0
+
+        # Core 层 executemany：实例在缓冲期间被删除时不匹配即可，不做行数校验
+        table = Instance.__table__
+        try:
+            if transitions:
+                # 状态翻转同时递增注册表版本，其他进程据此刷新实例快照
+                instance_registry.bump_version()
+                db.session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam('_id'))
+                    .values(status=bindparam('_status'), last_check_time=bindparam('_time')),
+                    [
+                        {'_id': instance_id, '_status': status, '_time': check_time}
+                        for instance_id, (status, check_time) in transitions.items()
+                    ]
+                )
+            if heartbeats:
+                db.session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam('_id'))
+                    .values(last_check_time=bindparam('_time')),
+                    [
+                        {'_id': instance_id, '_time': check_time}
+                        for instance_id, check_time in heartbeats.items()
+                    ]
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"批量写入实例状态失败: {e}")
+            # 放回缓冲，下次再试；期间若已有更新的记录则以新记录为准
+            with self._lock:
+                for instance_id, item in transitions.items():
+                    self._transitions.setdefault(instance_id, item)
+                for instance_id, check_time in heartbeats.items():
+                    if instance_id not in self._transitions:
+                        self._heartbeats.setdefault(instance_id, check_time)
+                if self._transitions and self._first_pending is None:
+                    self._first_pending = time.monotonic()
+            return 0
+        for instance_id, (status, check_time) in transitions.items():
+            instance_registry.apply_status(instance_id, status, check_time)
+        for instance_id, check_time in heartbeats.items():
+            instance_registry.apply_status(instance_id, None, check_time)
+        return len(transitions) + len(heartbeats)
+
+
+# 全局实例
+status_buffer = StatusWriteBuffer()
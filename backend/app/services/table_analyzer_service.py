@@ -1,9 +1,14 @@
+import hashlib
+import os
 import re
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from typing import List, Dict, Optional, Tuple, Any
 import sqlparse
 from sqlparse.sql import IdentifierList, Identifier
-from sqlparse.tokens import Keyword, DML
+from sqlparse.tokens import Keyword, DML, Name, Punctuation, Wildcard
 
 try:
     import pymysql
@@ -12,6 +17,11 @@ except ImportError:
     pymysql = None
 
 from ..models import Instance
+from .column_profiler import column_profiler, describe_profile
+from .connection_pool import mysql_pool
+from .row_estimator import describe_estimate, row_estimator
+from .schema_cache import schema_cache
+from .table_sampler import table_sampler
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +33,11 @@ class TableAnalyzerService:
         self.timeout = 15  # 秒
         self.max_sample_rows = 50  # 默认最大采样行数
         self.max_tables = 10  # 最多分析的表数量
+        # 上下文收集（表结构、采样、EXPLAIN）的并发数与整体时限
+        self.context_workers = int(os.getenv('TABLE_CONTEXT_MAX_WORKERS', '8'))
+        self.context_deadline = float(os.getenv('TABLE_CONTEXT_DEADLINE_SECONDS', '20'))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
         self.blacklisted_tables = {
             'mysql.user', 'mysql.db', 'information_schema.*', 
             'performance_schema.*', 'sys.*'
@@ -81,6 +96,54 @@ class TableAnalyzerService:
             logger.warning(f"解析SQL表名失败: {e}")
             return []
 
+    def extract_column_names(self, sql: str, wildcard_as_all: bool = True) -> Optional[List[str]]:
+        """
+        提取SQL中出现的标识符（小写），作为可能引用的列名，由调用方与表的实际列取交集
+        wildcard_as_all 时出现 SELECT * / t.* 返回 None，表示引用了全部列；COUNT(*) 中的 * 不计入
+        """
+        try:
+            names = set()
+            for stmt in sqlparse.parse(sql):
+                previous = None
+                for token in stmt.flatten():
+                    if (wildcard_as_all and token.ttype in Wildcard
+                            and not (previous is not None and previous.ttype in Punctuation and previous.value == '(')):
+                        return None
+                    # 部分列名（status、type 等）会被识别为关键字
+                    if token.ttype in Name or token.ttype in Keyword:
+                        names.add(token.value.strip('`"').lower())
+                    if not token.is_whitespace:
+                        previous = token
+            return sorted(names)
+        except Exception as e:
+            logger.warning(f"解析SQL列名失败: {e}")
+            return None if wildcard_as_all else []
+
+    def schema_signature(self, instance: Instance, database: str, table_names: List[str]) -> Optional[str]:
+        """涉及表的结构签名：列（名称、类型、可空、键）与索引（名称、唯一性、列顺序）的哈希。
+
+        只取结构性字段，行数、基数、更新时间等随数据变化的值不参与，
+        表结构或索引变更时签名随之变化。元信息来自 schema_cache；失败时返回 None。
+        """
+        tables = sorted({t for t in table_names if t and not self.is_blacklisted_table(t)})
+        try:
+            metas = schema_cache.get_tables(instance, database, tables)
+        except Exception as e:
+            logger.warning(f"获取表结构签名失败: {e}")
+            return None
+        parts = []
+        for name in tables:
+            meta = metas.get(name)
+            if meta is None:
+                parts.append((name, None))
+                continue
+            parts.append((
+                meta['table_name'],
+                [(c['name'], c['type'], c['null'], c['key']) for c in meta['columns']],
+                [(i['name'], i['unique'], i['columns']) for i in meta['indexes']],
+            ))
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
     def is_blacklisted_table(self, table_name: str) -> bool:
         """检查是否为黑名单表"""
         table_lower = table_name.lower()
@@ -94,9 +157,13 @@ class TableAnalyzerService:
         return False
 
     def sample_table_data(self, instance: Instance, database: str, table_name: str, 
-                         sample_rows: int = None) -> Tuple[bool, Dict[str, Any], str]:
+                         sample_rows: int = None, meta: Optional[Dict[str, Any]] = None,
+                         columns: Optional[List[str]] = None, strategy: Optional[str] = None,
+                         profile_columns: Optional[List[str]] = None) -> Tuple[bool, Dict[str, Any], str]:
         """
-        采样表数据和结构信息
+        采样表数据和结构信息（结构来自 schema_cache，可由调用方预取后通过 meta 传入）
+        columns: 只抽取这些列（及主键），None 表示全部列；strategy: 抽样策略，见 TableSampler
+        profile_columns: 需要统计画像（NDV、NULL 比例、范围、高频值）的列，见 ColumnProfiler
         返回: (成功标志, 样本数据字典, 错误信息)
         """
         if self.is_blacklisted_table(table_name):
@@ -109,126 +176,67 @@ class TableAnalyzerService:
             return False, {}, "MySQL驱动不可用"
         
         try:
-            conn = pymysql.connect(
-                host=instance.host,
-                port=instance.port,
-                user=instance.username or '',
-                password=instance.password or '',
-                database=database,
-                charset='utf8mb4',
-                connect_timeout=self.timeout,
-                read_timeout=self.timeout,
-                write_timeout=self.timeout,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
+            if meta is None:
+                meta = schema_cache.get_table(instance, database, table_name)
+            if meta is None:
+                return False, {}, f"采样失败: 表 {table_name} 不存在"
+            table_name = meta['table_name']
             result = {
                 'table_name': table_name,
-                'columns': [],
+                'columns': meta['columns'],
                 'sample_data': [],
-                'row_count_estimate': 0,
-                'indexes': [],
+                'row_count_estimate': None,
+                'row_count_confidence': 'unknown',
+                'row_count_source': None,
+                'indexes': meta['indexes'],
                 # 新增的表级信息
-                'engine': None,
-                'table_rows_approx': None,
-                'data_length': None,
-                'index_length': None,
-                'primary_key': []
+                'engine': meta.get('engine'),
+                'table_rows_approx': meta.get('table_rows_approx'),
+                'data_length': meta.get('data_length'),
+                'index_length': meta.get('index_length'),
+                'primary_key': meta['primary_key']
             }
+
+            with mysql_pool.connection(instance, database=database, timeout=self.timeout) as conn:
+                with conn.cursor() as cursor:
+                    # 1. 行数估计：统计信息优先，小表做有上限的精确计数（不再全表 COUNT）
+                    estimate = row_estimator.estimate(cursor, database, table_name, meta)
+                    result['row_count_estimate'] = estimate['rows']
+                    result['row_count_confidence'] = estimate['confidence']
+                    result['row_count_source'] = estimate['source']
+
+                    # 2. 采样数据（限制采样行数以防止大表性能问题；确认为空表时跳过）
+                    if not (estimate['confidence'] == 'exact' and estimate['rows'] == 0):
+                        # 动态确定采样行数：根据表规模（行数估计）自适应
+                        try:
+                            selected_rows = sample_rows or self.max_sample_rows
+                            approx = estimate['rows']
+                            if isinstance(approx, (int, float)) and approx is not None:
+                                if approx > 5_000_000:
+                                    selected_rows = min(selected_rows, 20)
+                                elif approx > 500_000:
+                                    selected_rows = min(selected_rows, 30)
+                                elif approx > 50_000:
+                                    selected_rows = min(selected_rows, 50)
+                            sample_limit = min(int(max(1, selected_rows)), 100)
+                        except Exception:
+                            sample_limit = min(sample_rows or self.max_sample_rows, 100)
+                        sampled = table_sampler.sample(
+                            conn, meta, sample_limit, estimated_rows=estimate['rows'], columns=columns, strategy=strategy
+                        )
+                        result['sample_data'] = sampled['rows']
+                        result['sample_strategy'] = sampled['strategy']
+                        result['sample_columns'] = sampled['columns']
+
+                        # 3. 引用列的统计画像（失败不影响采样结果）
+                        if profile_columns:
+                            try:
+                                result['column_profiles'] = column_profiler.profile(
+                                    conn, instance.id, database, meta, profile_columns, estimate['rows']
+                                )
+                            except Exception as e:
+                                logger.warning(f"表 {table_name} 列统计失败: {e}")
             
-            with conn.cursor() as cursor:
-                # 0. 表状态信息（引擎、大小、行数估计）
-                try:
-                    cursor.execute(
-                        """
-                        SELECT ENGINE, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
-                        FROM information_schema.TABLES
-                        WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s
-                        """,
-                        (database, table_name)
-                    )
-                    tbl = cursor.fetchone()
-                    if tbl:
-                        result['engine'] = tbl.get('ENGINE')
-                        result['table_rows_approx'] = tbl.get('TABLE_ROWS')
-                        result['data_length'] = tbl.get('DATA_LENGTH')
-                        result['index_length'] = tbl.get('INDEX_LENGTH')
-                except Exception:
-                    # 忽略表状态查询失败，不影响后续
-                    pass
-
-                # 1. 获取表结构
-                cursor.execute(f"DESCRIBE `{table_name}`")
-                columns = cursor.fetchall()
-                result['columns'] = [
-                    {
-                        'name': col['Field'], 
-                        'type': col['Type'], 
-                        'null': col['Null'], 
-                        'key': col['Key'],
-                        'default': col['Default'],
-                        'extra': col.get('Extra')
-                    } 
-                    for col in columns
-                ]
-                # 主键列
-                result['primary_key'] = [col['Field'] for col in columns if (col.get('Key') or '').upper() == 'PRI']
-                
-                # 2. 获取行数估计（轻量方式）
-                cursor.execute(f"SELECT COUNT(*) as cnt FROM `{table_name}` LIMIT 100000")
-                count_result = cursor.fetchone()
-                result['row_count_estimate'] = count_result['cnt'] if count_result else 0
-                
-                # 3. 采样数据（限制采样行数以防止大表性能问题）
-                if result['row_count_estimate'] > 0:
-                    # 动态确定采样行数：根据表规模（近似行数）自适应
-                    try:
-                        selected_rows = sample_rows or self.max_sample_rows
-                        approx = result.get('table_rows_approx')
-                        if isinstance(approx, (int, float)) and approx is not None:
-                            if approx > 5_000_000:
-                                selected_rows = min(selected_rows, 20)
-                            elif approx > 500_000:
-                                selected_rows = min(selected_rows, 30)
-                            elif approx > 50_000:
-                                selected_rows = min(selected_rows, 50)
-                        sample_limit = min(int(max(1, selected_rows)), 100)
-                    except Exception:
-                        sample_limit = min(sample_rows or self.max_sample_rows, 100)
-                    cursor.execute(f"SELECT * FROM `{table_name}` LIMIT {sample_limit}")
-                    sample_data = cursor.fetchall()
-                    # 转换为可序列化的格式
-                    result['sample_data'] = [
-                        {k: (str(v) if v is not None else None) for k, v in row.items()}
-                        for row in sample_data
-                    ]
-                
-                # 4. 获取索引信息（含列、唯一性、基数、类型）
-                cursor.execute(f"SHOW INDEX FROM `{table_name}`")
-                indexes = cursor.fetchall()
-                index_dict: Dict[str, Dict[str, Any]] = {}
-                for idx in indexes:
-                    key_name = idx['Key_name']
-                    if key_name not in index_dict:
-                        index_dict[key_name] = {
-                            'name': key_name,
-                            'unique': not bool(idx['Non_unique']),
-                            'columns': [],
-                            'cardinality': None,
-                            'index_type': None
-                        }
-                    index_dict[key_name]['columns'].append(idx['Column_name'])
-                    # 以最大Cardinality为整体索引基数（粗略）
-                    card = idx.get('Cardinality')
-                    if card is not None:
-                        prev = index_dict[key_name].get('cardinality')
-                        index_dict[key_name]['cardinality'] = max(prev or 0, card)
-                    if idx.get('Index_type') and not index_dict[key_name].get('index_type'):
-                        index_dict[key_name]['index_type'] = idx.get('Index_type')
-                
-                result['indexes'] = list(index_dict.values())
-            
-            conn.close()
             return True, result, ""
             
         except Exception as e:
@@ -244,30 +252,16 @@ class TableAnalyzerService:
             return False, {}, "MySQL驱动不可用"
         
         try:
-            conn = pymysql.connect(
-                host=instance.host,
-                port=instance.port,
-                user=instance.username or '',
-                password=instance.password or '',
-                database=database,
-                charset='utf8mb4',
-                connect_timeout=self.timeout,
-                read_timeout=self.timeout,
-                write_timeout=self.timeout,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            with conn.cursor() as cursor:
-                # 使用 EXPLAIN FORMAT=JSON 获得更详细的信息
-                explain_sql = f"EXPLAIN FORMAT=JSON {sql}"
-                cursor.execute(explain_sql)
-                explain_result = cursor.fetchone()
+            with mysql_pool.connection(instance, database=database, timeout=self.timeout) as conn:
+                with conn.cursor() as cursor:
+                    # 使用 EXPLAIN FORMAT=JSON 获得更详细的信息
+                    explain_sql = f"EXPLAIN FORMAT=JSON {sql}"
+                    cursor.execute(explain_sql)
+                    explain_result = cursor.fetchone()
                 
-                # 同时获取传统 EXPLAIN 作为后备
-                cursor.execute(f"EXPLAIN {sql}")
-                traditional_explain = cursor.fetchall()
-            
-            conn.close()
+                    # 同时获取传统 EXPLAIN 作为后备
+                    cursor.execute(f"EXPLAIN {sql}")
+                    traditional_explain = cursor.fetchall()
             
             return True, {
                 'json_plan': explain_result.get('EXPLAIN') if explain_result else None,
@@ -280,189 +274,282 @@ class TableAnalyzerService:
 
     def generate_context_summary(self, sql: str, instance: Instance, database: str, 
                                 sample_rows: int = None, enable_sampling: bool = True, 
-                                enable_explain: bool = True) -> str:
+                                enable_explain: bool = True, progress=None) -> str:
         """
         生成包含表采样和执行计划的上下文摘要
+        表结构预取、逐表采样与 EXPLAIN 在共享线程池中并发执行，整体受 context_deadline 秒限制；
+        未按时完成的部分以提示代替（后台任务自行结束并归还连接），其余结果仍按原顺序组装。
+        progress: 可选的阶段回调 progress(stage)，进入执行计划阶段时以 'explaining' 调用
         """
+        deadline = time.monotonic() + self.context_deadline
+        executor = self._get_executor()
         summary_parts = [
             f"实例: {instance.instance_name} ({instance.host}:{instance.port})",
             f"数据库: {database}",
             f"SQL类型: {self._detect_sql_type(sql)}"
         ]
-        
+
+        # EXPLAIN 不依赖表结构，最先提交，与表信息收集并行
+        explain_future = executor.submit(self.get_explain_plan, instance, database, sql) if enable_explain else None
+
         # 提取表名
         table_names = self.extract_table_names(sql)
+        columns = self.extract_column_names(sql) if enable_sampling else None
+        profile_columns = self.extract_column_names(sql, wildcard_as_all=False)
         if table_names:
             summary_parts.append(f"\n涉及表: {', '.join(table_names)}")
-            
-            for table_name in table_names[:5]:  # 最多分析5张表
+
+            analyzed = table_names[:5]  # 最多分析5张表
+            # 一次集合查询预取所有涉及表的结构；预取失败或表不存在时由逐表调用给出具体原因
+            prefetch_timed_out = False
+            try:
+                metas = executor.submit(
+                    schema_cache.get_tables, instance, database,
+                    [t for t in analyzed if not self.is_blacklisted_table(t)]
+                ).result(timeout=self._remaining(deadline))
+            except FuturesTimeout:
+                logger.warning(f"预取表结构超时（{self.context_deadline}s）")
+                metas, prefetch_timed_out = {}, True
+            except Exception as e:
+                logger.warning(f"预取表结构失败: {e}")
+                metas = {}
+
+            futures: Dict[str, Future] = {}
+            for table_name in analyzed:
+                if prefetch_timed_out and not self.is_blacklisted_table(table_name):
+                    continue
                 if enable_sampling:
                     # 完整采样（包含样本数据）
-                    success, sample_data, error = self.sample_table_data(
-                        instance, database, table_name, sample_rows
+                    futures[table_name] = executor.submit(
+                        self.sample_table_data, instance, database, table_name, sample_rows, metas.get(table_name), columns,
+                        None, profile_columns
                     )
-                    
+                elif table_name not in metas or profile_columns:
+                    # 不抽样时列统计只来自直方图与索引
+                    futures[table_name] = executor.submit(
+                        self._get_table_metadata_only, instance, database, table_name, False,
+                        metas.get(table_name), profile_columns
+                    )
+
+            for table_name in analyzed:
+                future = futures.get(table_name)
+                if future is not None:
+                    try:
+                        success, data, error = future.result(timeout=self._remaining(deadline))
+                    except FuturesTimeout:
+                        success, data, error = False, {}, f"超过 {self.context_deadline:g}s 未完成，已跳过"
+                elif table_name in metas:
+                    success, data, error = True, metas[table_name], ""
+                else:
+                    success, data, error = False, {}, f"超过 {self.context_deadline:g}s 未完成，已跳过"
+
+                if enable_sampling:
                     if success:
-                        summary_parts.append(f"\n【表 {table_name}】")
-                        # 行数与基础规模
-                        summary_parts.append(f"- 行数估计: {sample_data['row_count_estimate']}")
-                        if sample_data.get('engine') is not None:
-                            # 格式化存储大小
-                            data_size = self._format_bytes(sample_data.get('data_length'))
-                            index_size = self._format_bytes(sample_data.get('index_length'))
-                            summary_parts.append(
-                                f"- 存储引擎: {sample_data.get('engine')}, 近似行数: {sample_data.get('table_rows_approx'):,}, "
-                                f"数据大小: {data_size}, 索引大小: {index_size}"
-                            )
-                        # 列信息
-                        summary_parts.append(f"- 列数: {len(sample_data['columns'])}")
-                        # 主键
-                        if sample_data.get('primary_key'):
-                            summary_parts.append(f"- 主键: {', '.join(sample_data['primary_key'])}")
-                        
-                        # 列信息概览（前5列）
-                        if sample_data['columns']:
-                            col_briefs = []
-                            for col in sample_data['columns'][:5]:
-                                key_flag = (col.get('key') or '').upper()
-                                key_part = f",{key_flag}" if key_flag else ""
-                                col_briefs.append(f"{col['name']}({col['type']}{key_part})")
-                            summary_parts.append(f"- 列信息(前5): {', '.join(col_briefs)}")
-                        
-                        # 索引摘要（最多3个详细展示）
-                        if sample_data['indexes']:
-                            index_summaries = []
-                            for idx in sample_data['indexes'][:3]:
-                                uniq = 'UNIQUE' if idx.get('unique') else 'NON-UNIQUE'
-                                cols = ','.join(idx.get('columns') or [])
-                                card = idx.get('cardinality')
-                                itype = idx.get('index_type')
-                                idx_brief = f"{idx.get('name')}({uniq}): [{cols}]"
-                                extras = []
-                                if itype:
-                                    extras.append(f"类型={itype}")
-                                if card is not None:
-                                    extras.append(f"基数={card:,}")
-                                if extras:
-                                    idx_brief += " (" + ", ".join(extras) + ")"
-                                index_summaries.append(idx_brief)
-                            summary_parts.append(f"- 索引: {'; '.join(index_summaries)}")
-                        
-                        # 数据样本摘要（仅显示行数）
-                        if sample_data['sample_data']:
-                            sample_count = len(sample_data['sample_data'])
-                            summary_parts.append(f"- 样本数据: {sample_count}行（用于类型/分布/值范围的直观判断）")
+                        summary_parts.extend(self._summarize_sample(table_name, data))
                     else:
                         summary_parts.append(f"\n【表 {table_name}】采样失败: {error}")
                 else:
                     # 仅收集表元信息，不进行数据采样
-                    success, table_metadata, error = self._get_table_metadata_only(
-                        instance, database, table_name
-                    )
-                    
                     if success:
-                        summary_parts.append(f"\n【表 {table_name}】")
-                        
-                        # 基础表信息
-                        if table_metadata.get('engine'):
-                            data_size = self._format_bytes(table_metadata.get('data_length'))
-                            index_size = self._format_bytes(table_metadata.get('index_length'))
-                            avg_row_length = table_metadata.get('avg_row_length')
-                            table_collation = table_metadata.get('table_collation', 'N/A')
-                            create_time = table_metadata.get('create_time', 'N/A')
-                            update_time = table_metadata.get('update_time', 'N/A')
-                            
-                            summary_parts.append(f"- 存储引擎: {table_metadata.get('engine')}")
-                            summary_parts.append(f"- 近似行数: {table_metadata.get('table_rows_approx'):,}")
-                            summary_parts.append(f"- 数据大小: {data_size}, 索引大小: {index_size}")
-                            if avg_row_length:
-                                summary_parts.append(f"- 平均行长度: {avg_row_length} 字节")
-                            summary_parts.append(f"- 字符集: {table_collation}")
-                            summary_parts.append(f"- 创建时间: {create_time}, 更新时间: {update_time}")
-                        
-                        # 列信息
-                        if table_metadata.get('columns'):
-                            summary_parts.append(f"- 列数: {len(table_metadata['columns'])}")
-                            # 主键
-                            if table_metadata.get('primary_key'):
-                                summary_parts.append(f"- 主键: {', '.join(table_metadata['primary_key'])}")
-                            
-                            # 列详情（所有列）
-                            col_details = []
-                            for col in table_metadata['columns']:
-                                key_flag = (col.get('key') or '').upper()
-                                null_flag = "NULL" if col.get('null') == 'YES' else "NOT NULL"
-                                default_val = f", 默认={col.get('default')}" if col.get('default') else ""
-                                extra = f", {col.get('extra')}" if col.get('extra') else ""
-                                col_detail = f"{col['name']}({col['type']}, {null_flag}{default_val}{extra})"
-                                if key_flag:
-                                    col_detail += f" [{key_flag}]"
-                                col_details.append(col_detail)
-                            summary_parts.append(f"- 列详情: {'; '.join(col_details)}")
-                        
-                        # 索引详情
-                        if table_metadata.get('indexes'):
-                            index_details = []
-                            for idx in table_metadata['indexes']:
-                                uniq = 'UNIQUE' if idx.get('unique') else 'NON-UNIQUE'
-                                cols = ','.join(idx.get('columns') or [])
-                                card = idx.get('cardinality')
-                                itype = idx.get('index_type', 'BTREE')
-                                comment = idx.get('comment', '')
-                                
-                                idx_detail = f"{idx.get('name')}({uniq}, {itype}): [{cols}]"
-                                if card is not None:
-                                    idx_detail += f" 基数={card:,}"
-                                if comment:
-                                    idx_detail += f" 备注={comment}"
-                                index_details.append(idx_detail)
-                            summary_parts.append(f"- 索引详情: {'; '.join(index_details)}")
-                        
-                        # 表约束信息
-                        if table_metadata.get('constraints'):
-                            constraints = []
-                            for constraint in table_metadata['constraints']:
-                                constraint_type = constraint.get('constraint_type', 'UNKNOWN')
-                                constraint_name = constraint.get('constraint_name', 'unnamed')
-                                column_name = constraint.get('column_name', '')
-                                constraints.append(f"{constraint_name}({constraint_type}): {column_name}")
-                            if constraints:
-                                summary_parts.append(f"- 约束: {'; '.join(constraints)}")
-                        
+                        summary_parts.extend(self._summarize_metadata(table_name, data))
                     else:
                         summary_parts.append(f"\n【表 {table_name}】元信息获取失败: {error}")
-        
-        if enable_explain:
+
+        if explain_future is not None:
+            if progress:
+                progress('explaining')
             # 获取执行计划
-            success, explain_data, error = self.get_explain_plan(instance, database, sql)
+            try:
+                success, explain_data, error = explain_future.result(timeout=self._remaining(deadline))
+            except FuturesTimeout:
+                success, explain_data, error = False, {}, f"超过 {self.context_deadline:g}s 未完成，已跳过"
             if success and explain_data.get('traditional_plan'):
-                summary_parts.append(f"\n【执行计划摘要】")
-                for i, row in enumerate(explain_data['traditional_plan']):
-                    table = row.get('table', 'N/A')
-                    type_val = row.get('type', 'N/A')
-                    key = row.get('key') or 'None'
-                    key_len = row.get('key_len') or 'N/A'
-                    rows = row.get('rows', 0)
-                    filtered = row.get('filtered')
-                    extra = row.get('Extra', '')
-                    
-                    plan_line = f"- 步骤{i+1} 表={table}, 访问类型={type_val}, 使用索引={key}"
-                    if key_len != 'N/A':
-                        plan_line += f"(长度={key_len})"
-                    plan_line += f", 扫描行数≈{rows:,}"
-                    if filtered:
-                        plan_line += f", 过滤率={filtered}%"
-                    if extra:
-                        plan_line += f", 额外信息={extra}"
-                    summary_parts.append(plan_line)
+                summary_parts.extend(self._summarize_plan(explain_data))
             elif not success:
                 summary_parts.append(f"\n【执行计划】获取失败: {error}")
         
         return "\n".join(summary_parts)
 
-    def _get_table_metadata_only(self, instance: Instance, database: str, table_name: str) -> Tuple[bool, Dict[str, Any], str]:
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.context_workers, thread_name_prefix='table-context')
+        return self._executor
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    def _summarize_sample(self, table_name: str, sample_data: Dict[str, Any]) -> List[str]:
+        lines = []
+        lines.append(f"\n【表 {table_name}】")
+        # 行数与基础规模
+        lines.append("- 行数估计: " + describe_estimate(
+            sample_data.get('row_count_estimate'), sample_data.get('row_count_confidence'), sample_data.get('row_count_source')
+        ))
+        if sample_data.get('engine') is not None:
+            # 格式化存储大小
+            data_size = self._format_bytes(sample_data.get('data_length'))
+            index_size = self._format_bytes(sample_data.get('index_length'))
+            lines.append(
+                f"- 存储引擎: {sample_data.get('engine')}, 近似行数(TABLE_ROWS): {sample_data.get('table_rows_approx') or 0:,}, "
+                f"数据大小: {data_size}, 索引大小: {index_size}"
+            )
+        # 列信息
+        lines.append(f"- 列数: {len(sample_data['columns'])}")
+        # 主键
+        if sample_data.get('primary_key'):
+            lines.append(f"- 主键: {', '.join(sample_data['primary_key'])}")
+
+        # 列信息概览（前5列）
+        if sample_data['columns']:
+            col_briefs = []
+            for col in sample_data['columns'][:5]:
+                key_flag = (col.get('key') or '').upper()
+                key_part = f",{key_flag}" if key_flag else ""
+                col_briefs.append(f"{col['name']}({col['type']}{key_part})")
+            lines.append(f"- 列信息(前5): {', '.join(col_briefs)}")
+
+        # 索引摘要（最多3个详细展示）
+        if sample_data['indexes']:
+            index_summaries = []
+            for idx in sample_data['indexes'][:3]:
+                uniq = 'UNIQUE' if idx.get('unique') else 'NON-UNIQUE'
+                cols = ','.join(idx.get('columns') or [])
+                card = idx.get('cardinality')
+                itype = idx.get('index_type')
+                idx_brief = f"{idx.get('name')}({uniq}): [{cols}]"
+                extras = []
+                if itype:
+                    extras.append(f"类型={itype}")
+                if card is not None:
+                    extras.append(f"基数={card:,}")
+                if extras:
+                    idx_brief += " (" + ", ".join(extras) + ")"
+                index_summaries.append(idx_brief)
+            lines.append(f"- 索引: {'; '.join(index_summaries)}")
+
+        # 数据样本摘要（仅显示行数）
+        if sample_data['sample_data']:
+            sample_count = len(sample_data['sample_data'])
+            lines.append(
+                f"- 样本数据: {sample_count}行（抽样方式: {sample_data.get('sample_strategy')}，"
+                f"列: {', '.join(sample_data.get('sample_columns') or [])}；用于类型/分布/值范围的直观判断）"
+            )
+        # 引用列的统计画像（NDV/选择性、NULL 比例、范围、高频值）
+        if sample_data.get('column_profiles'):
+            lines.append("- 列统计:")
+            for profile in sample_data['column_profiles'].values():
+                lines.append(f"  - {describe_profile(profile)}")
+        return lines
+
+    def _summarize_metadata(self, table_name: str, table_metadata: Dict[str, Any]) -> List[str]:
+        lines = []
+        lines.append(f"\n【表 {table_name}】")
+
+        # 基础表信息
+        if table_metadata.get('engine'):
+            data_size = self._format_bytes(table_metadata.get('data_length'))
+            index_size = self._format_bytes(table_metadata.get('index_length'))
+            avg_row_length = table_metadata.get('avg_row_length')
+            table_collation = table_metadata.get('table_collation', 'N/A')
+            create_time = table_metadata.get('create_time', 'N/A')
+            update_time = table_metadata.get('update_time', 'N/A')
+
+            lines.append(f"- 存储引擎: {table_metadata.get('engine')}")
+            lines.append(f"- 近似行数: {table_metadata.get('table_rows_approx'):,}")
+            lines.append(f"- 数据大小: {data_size}, 索引大小: {index_size}")
+            if avg_row_length:
+                lines.append(f"- 平均行长度: {avg_row_length} 字节")
+            lines.append(f"- 字符集: {table_collation}")
+            lines.append(f"- 创建时间: {create_time}, 更新时间: {update_time}")
+
+        # 列信息
+        if table_metadata.get('columns'):
+            lines.append(f"- 列数: {len(table_metadata['columns'])}")
+            # 主键
+            if table_metadata.get('primary_key'):
+                lines.append(f"- 主键: {', '.join(table_metadata['primary_key'])}")
+
+            # 列详情（所有列）
+            col_details = []
+            for col in table_metadata['columns']:
+                key_flag = (col.get('key') or '').upper()
+                null_flag = "NULL" if col.get('null') == 'YES' else "NOT NULL"
+                default_val = f", 默认={col.get('default')}" if col.get('default') else ""
+                extra = f", {col.get('extra')}" if col.get('extra') else ""
+                col_detail = f"{col['name']}({col['type']}, {null_flag}{default_val}{extra})"
+                if key_flag:
+                    col_detail += f" [{key_flag}]"
+                col_details.append(col_detail)
+            lines.append(f"- 列详情: {'; '.join(col_details)}")
+
+        # 索引详情
+        if table_metadata.get('indexes'):
+            index_details = []
+            for idx in table_metadata['indexes']:
+                uniq = 'UNIQUE' if idx.get('unique') else 'NON-UNIQUE'
+                cols = ','.join(idx.get('columns') or [])
+                card = idx.get('cardinality')
+                itype = idx.get('index_type', 'BTREE')
+                comment = idx.get('comment', '')
+
+                idx_detail = f"{idx.get('name')}({uniq}, {itype}): [{cols}]"
+                if card is not None:
+                    idx_detail += f" 基数={card:,}"
+                if comment:
+                    idx_detail += f" 备注={comment}"
+                index_details.append(idx_detail)
+            lines.append(f"- 索引详情: {'; '.join(index_details)}")
+
+        # 引用列的统计画像（仅来自直方图与索引）
+        if table_metadata.get('column_profiles'):
+            lines.append("- 列统计:")
+            for profile in table_metadata['column_profiles'].values():
+                lines.append(f"  - {describe_profile(profile)}")
+
+        # 表约束信息
+        if table_metadata.get('constraints'):
+            constraints = []
+            for constraint in table_metadata['constraints']:
+                constraint_type = constraint.get('constraint_type', 'UNKNOWN')
+                constraint_name = constraint.get('constraint_name', 'unnamed')
+                column_name = constraint.get('column_name', '')
+                constraints.append(f"{constraint_name}({constraint_type}): {column_name}")
+            if constraints:
+                lines.append(f"- 约束: {'; '.join(constraints)}")
+        return lines
+
+    def _summarize_plan(self, explain_data: Dict[str, Any]) -> List[str]:
+        lines = []
+        lines.append(f"\n【执行计划摘要】")
+        for i, row in enumerate(explain_data['traditional_plan']):
+            table = row.get('table', 'N/A')
+            type_val = row.get('type', 'N/A')
+            key = row.get('key') or 'None'
+            key_len = row.get('key_len') or 'N/A'
+            rows = row.get('rows', 0)
+            filtered = row.get('filtered')
+            extra = row.get('Extra', '')
+
+            plan_line = f"- 步骤{i+1} 表={table}, 访问类型={type_val}, 使用索引={key}"
+            if key_len != 'N/A':
+                plan_line += f"(长度={key_len})"
+            plan_line += f", 扫描行数≈{rows:,}"
+            if filtered:
+                plan_line += f", 过滤率={filtered}%"
+            if extra:
+                plan_line += f", 额外信息={extra}"
+            lines.append(plan_line)
+        return lines
+
+    def _get_table_metadata_only(self, instance: Instance, database: str, table_name: str,
+                                 refresh: bool = False, meta: Optional[Dict[str, Any]] = None,
+                                 profile_columns: Optional[List[str]] = None) -> Tuple[bool, Dict[str, Any], str]:
         """
-        仅获取表的元信息，不进行数据采样
+        仅获取表的元信息，不进行数据采样（来自 schema_cache，可由调用方预取后通过 meta 传入）
+        profile_columns: 需要统计画像的列，只使用直方图、索引基数与索引两端，不读取表数据
         返回: (成功标志, 元信息字典, 错误信息)
         """
         if self.is_blacklisted_table(table_name):
@@ -472,142 +559,29 @@ class TableAnalyzerService:
             return False, {}, "MySQL驱动不可用"
         
         try:
-            conn = pymysql.connect(
-                host=instance.host,
-                port=instance.port,
-                user=instance.username or '',
-                password=instance.password or '',
-                database=database,
-                charset='utf8mb4',
-                connect_timeout=self.timeout,
-                read_timeout=self.timeout,
-                write_timeout=self.timeout,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            result = {
-                'table_name': table_name,
-                'columns': [],
-                'indexes': [],
-                'constraints': [],
-                'engine': None,
-                'table_rows_approx': None,
-                'data_length': None,
-                'index_length': None,
-                'avg_row_length': None,
-                'table_collation': None,
-                'create_time': None,
-                'update_time': None,
-                'primary_key': []
-            }
-            
-            with conn.cursor() as cursor:
-                # 1. 获取表的详细信息
-                try:
-                    cursor.execute(
-                        """
-                        SELECT ENGINE, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH, 
-                               AVG_ROW_LENGTH, TABLE_COLLATION, CREATE_TIME, UPDATE_TIME
-                        FROM information_schema.TABLES
-                        WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s
-                        """,
-                        (database, table_name)
-                    )
-                    table_info = cursor.fetchone()
-                    if table_info:
-                        result['engine'] = table_info.get('ENGINE')
-                        result['table_rows_approx'] = table_info.get('TABLE_ROWS')
-                        result['data_length'] = table_info.get('DATA_LENGTH')
-                        result['index_length'] = table_info.get('INDEX_LENGTH')
-                        result['avg_row_length'] = table_info.get('AVG_ROW_LENGTH')
-                        result['table_collation'] = table_info.get('TABLE_COLLATION')
-                        result['create_time'] = table_info.get('CREATE_TIME')
-                        result['update_time'] = table_info.get('UPDATE_TIME')
-                except Exception as e:
-                    logger.warning(f"获取表基础信息失败: {e}")
-
-                # 2. 获取列信息
-                try:
-                    cursor.execute(f"DESCRIBE `{table_name}`")
-                    columns = cursor.fetchall()
-                    result['columns'] = [
-                        {
-                            'name': col['Field'], 
-                            'type': col['Type'], 
-                            'null': col['Null'], 
-                            'key': col['Key'],
-                            'default': col['Default'],
-                            'extra': col.get('Extra')
-                        } 
-                        for col in columns
-                    ]
-                    # 主键列
-                    result['primary_key'] = [col['Field'] for col in columns if (col.get('Key') or '').upper() == 'PRI']
-                except Exception as e:
-                    logger.warning(f"获取表列信息失败: {e}")
-                
-                # 3. 获取索引信息
-                try:
-                    cursor.execute(f"SHOW INDEX FROM `{table_name}`")
-                    indexes = cursor.fetchall()
-                    index_dict: Dict[str, Dict[str, Any]] = {}
-                    for idx in indexes:
-                        key_name = idx['Key_name']
-                        if key_name not in index_dict:
-                            index_dict[key_name] = {
-                                'name': key_name,
-                                'unique': not bool(idx['Non_unique']),
-                                'columns': [],
-                                'cardinality': None,
-                                'index_type': None,
-                                'comment': None
-                            }
-                        index_dict[key_name]['columns'].append(idx['Column_name'])
-                        # 以最大Cardinality为整体索引基数（粗略）
-                        card = idx.get('Cardinality')
-                        if card is not None:
-                            prev = index_dict[key_name].get('cardinality')
-                            index_dict[key_name]['cardinality'] = max(prev or 0, card)
-                        if idx.get('Index_type') and not index_dict[key_name].get('index_type'):
-                            index_dict[key_name]['index_type'] = idx.get('Index_type')
-                        if idx.get('Comment') and not index_dict[key_name].get('comment'):
-                            index_dict[key_name]['comment'] = idx.get('Comment')
-                    
-                    result['indexes'] = list(index_dict.values())
-                except Exception as e:
-                    logger.warning(f"获取表索引信息失败: {e}")
-
-                # 4. 获取约束信息
-                try:
-                    cursor.execute(
-                        """
-                        SELECT CONSTRAINT_NAME, CONSTRAINT_TYPE, COLUMN_NAME
-                        FROM information_schema.KEY_COLUMN_USAGE kcu
-                        JOIN information_schema.TABLE_CONSTRAINTS tc 
-                        ON kcu.CONSTRAINT_NAME = tc.CONSTRAINT_NAME 
-                        AND kcu.TABLE_SCHEMA = tc.TABLE_SCHEMA
-                        WHERE kcu.TABLE_SCHEMA = %s AND kcu.TABLE_NAME = %s
-                        """,
-                        (database, table_name)
-                    )
-                    constraints = cursor.fetchall()
-                    result['constraints'] = [
-                        {
-                            'constraint_name': constraint['CONSTRAINT_NAME'],
-                            'constraint_type': constraint['CONSTRAINT_TYPE'],
-                            'column_name': constraint['COLUMN_NAME']
-                        }
-                        for constraint in constraints
-                    ]
-                except Exception as e:
-                    logger.warning(f"获取表约束信息失败: {e}")
-            
-            conn.close()
-            return True, result, ""
-            
+            if meta is None:
+                meta = schema_cache.get_table(instance, database, table_name, refresh=refresh)
         except Exception as e:
             logger.error(f"获取表 {table_name} 元信息失败: {e}")
             return False, {}, f"元信息获取失败: {e}"
+        if meta is None:
+            return False, {}, f"元信息获取失败: 表 {table_name} 不存在"
+
+        if profile_columns:
+            try:
+                with mysql_pool.connection(instance, database=database, timeout=self.timeout) as conn:
+                    profiles = column_profiler.profile(
+                        conn, instance.id, database, meta, profile_columns, meta.get('table_rows_approx'), sample=False
+                    )
+                # 没有直方图和索引的列没有可用统计
+                profiles = {name: p for name, p in profiles.items()
+                            if p['ndv'] is not None or p['null_frac'] is not None or p['min'] is not None}
+                if profiles:
+                    # meta 为缓存中的共享对象，不就地修改
+                    meta = dict(meta, column_profiles=profiles)
+            except Exception as e:
+                logger.warning(f"表 {table_name} 列统计失败: {e}")
+        return True, meta, ""
 
     def _format_bytes(self, byte_size):
         """格式化字节大小为可读格式"""
@@ -0,0 +1,216 @@
+import logging
+import os
+import random
+import re
+from typing import Any, Dict, List, Optional
+
+try:
+    import pymysql.cursors
+except ImportError:
+    pymysql = None
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('auto', 'pk_seek', 'pk_bucket', 'reservoir', 'head')
+
+# digest_text=True 时，可能被截断的列额外投影 MD5(列)，结果键为 列名 + DIGEST_SUFFIX
+DIGEST_SUFFIX = '#md5'
+
+_INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint'}
+_TEXT_TYPES = {'char', 'varchar', 'tinytext', 'text', 'mediumtext', 'longtext', 'json', 'enum', 'set'}
+_BINARY_TYPES = {'binary', 'varbinary'}
+_OPAQUE_TYPES = {
+    'tinyblob', 'blob', 'mediumblob', 'longblob', 'geometry', 'point', 'linestring', 'polygon',
+    'multipoint', 'multilinestring', 'multipolygon', 'geometrycollection', 'geomcollection',
+}
+
+
+def _quote(name: str) -> str:
+    return '`' + name.replace('`', '``') + '`'
+
+
+def _base_type(column_type: str) -> str:
+    return (column_type or '').lower().split('(')[0].split(' ')[0]
+
+
+def _declared_length(column_type: str) -> Optional[int]:
+    match = re.match(r'\w+\((\d+)\)', (column_type or '').lower())
+    return int(match.group(1)) if match else None
+
+
+class TableSampler:
+    """表数据抽样：按策略取少量有代表性的行，只取 SQL 引用的列并截断大字段。
+
+    策略：
+      - pk_seek：单列整数主键时，在 [MIN, MAX] 内随机取点，各自 WHERE pk >= ? ORDER BY pk LIMIT 1，
+        以 UNION ALL 一次发出；每次都是主键索引定位。主键空洞后的行被抽中的概率偏高。
+      - pk_bucket：把主键区间等分为若干桶，随机选桶后各读连续 block_rows 行，
+        类似 TABLESAMPLE SYSTEM 的块抽样，索引定位次数更少但块内行相关性更高。
+      - reservoir：以非缓冲游标顺序读取至多 scan_limit 行并做蓄水池抽样；
+        表不超过 scan_limit 行时即整表均匀抽样，否则只覆盖前 scan_limit 行。
+      - head：原先的 LIMIT n，只取物理顺序最前的行。
+    auto：估计行数不超过 scan_limit 时用 reservoir，否则有单列整数主键时用 pk_seek，其余用 reservoir。
+    指定的策略不适用（如无整数主键）时退回 reservoir，结果中的 strategy 为实际使用的策略。
+    文本截断到 max_value_chars 个字符（在服务端用 LEFT 截断，不传输整段值），BLOB/空间类型只返回长度。
+    需要按完整取值区分行时（如列统计）用 digest_text=True，截断列另带整段值的 MD5。
+    """
+
+    def __init__(self):
+        strategy = os.getenv('TABLE_SAMPLE_STRATEGY', 'auto').lower()
+        self.default_strategy = strategy if strategy in STRATEGIES else 'auto'
+        self.scan_limit = int(os.getenv('TABLE_SAMPLE_SCAN_LIMIT', '10000'))
+        self.block_rows = max(1, int(os.getenv('TABLE_SAMPLE_BLOCK_ROWS', '10')))
+        self.max_value_chars = int(os.getenv('TABLE_SAMPLE_MAX_VALUE_CHARS', '64'))
+        self.scan_timeout_ms = int(os.getenv('TABLE_SAMPLE_SCAN_TIMEOUT_MS', '3000'))
+
+    def sample(self, conn, meta: Dict[str, Any], limit: int, estimated_rows: Optional[int] = None,
+               columns: Optional[List[str]] = None, strategy: Optional[str] = None, render: bool = True,
+               digest_text: bool = False) -> Dict[str, Any]:
+        """在调用方的连接上抽样。meta 为 schema_cache 的表元信息；
+        columns 为 SQL 引用的列名（不区分大小写，None 表示全部列）；render=False 时保留驱动返回的原始类型；
+        digest_text=True 时可能被截断的文本/二进制列另以 列名 + DIGEST_SUFFIX 返回整段值的 MD5。
+        返回 {'rows': [{列: 字符串或None}], 'strategy': 实际策略, 'columns': 投影的列}"""
+        strategy = (strategy or self.default_strategy).lower()
+        if strategy not in STRATEGIES:
+            raise ValueError(f"不支持的抽样策略: {strategy}")
+        table = _quote(meta['table_name'])
+        selected = self._select_columns(meta, columns)
+        projection = ', '.join(self._column_expr(c, digest_text) for c in selected)
+        pk = self._integer_pk(meta)
+
+        if strategy == 'auto':
+            if estimated_rows is not None and estimated_rows <= self.scan_limit:
+                strategy = 'reservoir'
+            else:
+                strategy = 'pk_seek' if pk else 'reservoir'
+        elif strategy in ('pk_seek', 'pk_bucket') and not pk:
+            strategy = 'reservoir'
+
+        if strategy in ('pk_seek', 'pk_bucket'):
+            rows = self._sample_pk(conn, table, projection, pk, limit, strategy == 'pk_bucket')
+        elif strategy == 'reservoir':
+            rows = self._sample_reservoir(conn, table, projection, limit)
+        else:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT {projection} FROM {table} LIMIT {int(limit)}")
+                rows = cursor.fetchall()
+
+        if render:
+            rows = [{k: self.render_value(v) for k, v in row.items()} for row in rows]
+        return {
+            'rows': rows,
+            'strategy': strategy,
+            'columns': [c['name'] for c in selected],
+        }
+
+    @staticmethod
+    def _select_columns(meta: Dict[str, Any], columns: Optional[List[str]]) -> List[Dict[str, Any]]:
+        all_columns = meta['columns']
+        if columns is None:
+            return all_columns
+        wanted = {c.lower() for c in columns}
+        if not any(c['name'].lower() in wanted for c in all_columns):
+            # 未识别出该表的任何列（如 SELECT COUNT(*)）时保留全部列
+            return all_columns
+        pk = set(meta.get('primary_key') or [])
+        return [c for c in all_columns if c['name'].lower() in wanted or c['name'] in pk]
+
+    def _column_expr(self, column: Dict[str, Any], digest: bool = False) -> str:
+        name = _quote(column['name'])
+        base = _base_type(column.get('type'))
+        if base in _OPAQUE_TYPES:
+            return f"IF({name} IS NULL, NULL, CONCAT('<', LENGTH({name}), ' bytes>')) AS {name}"
+        if base in _BINARY_TYPES:
+            prefix = max(1, self.max_value_chars // 2)
+            expr = f"HEX(LEFT({name}, {prefix})) AS {name}"
+        elif base in _TEXT_TYPES:
+            # 多取一个字符，用于判断是否需要加省略号
+            prefix = self.max_value_chars
+            expr = f"LEFT({name}, {self.max_value_chars + 1}) AS {name}"
+        else:
+            return name
+        length = _declared_length(column.get('type'))
+        if digest and (length is None or length > prefix):
+            expr += f", MD5({name}) AS {_quote(column['name'] + DIGEST_SUFFIX)}"
+        return expr
+
+    def render_value(self, value) -> Optional[str]:
+        if value is None:
+            return None
+        text = str(value)
+        if len(text) > self.max_value_chars:
+            text = text[:self.max_value_chars] + '…'
+        return text
+
+    @staticmethod
+    def _integer_pk(meta: Dict[str, Any]) -> Optional[str]:
+        pk = meta.get('primary_key') or []
+        if len(pk) != 1:
+            return None
+        for column in meta['columns']:
+            if column['name'] == pk[0] and _base_type(column.get('type')) in _INTEGER_TYPES:
+                return pk[0]
+        return None
+
+    def _sample_pk(self, conn, table: str, projection: str, pk: str, limit: int, by_bucket: bool) -> List[Dict[str, Any]]:
+        qpk = _quote(pk)
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT MIN({qpk}) AS lo, MAX({qpk}) AS hi FROM {table}")
+            bounds = cursor.fetchone() or {}
+            lo, hi = bounds.get('lo'), bounds.get('hi')
+            if lo is None or hi is None:
+                return []
+            lo, hi = int(lo), int(hi)
+            if by_bucket:
+                # 样本较小时缩小块，保证至少约 5 个块
+                per_seek = max(1, min(self.block_rows, limit // 5))
+                blocks = max(1, -(-limit // per_seek))
+                buckets = max(blocks, 100)
+                width = max(1, (hi - lo + 1) // buckets)
+                # 桶内随机起点，避免与主键周期性取值对齐
+                starts = sorted(lo + b * width + random.randrange(width) for b in random.sample(range(buckets), blocks))
+            else:
+                # 多取一半：落入同一空洞的随机点会定位到同一行
+                starts = sorted({random.randint(lo, hi) for _ in range(limit + limit // 2)})
+                per_seek = 1
+            parts = [f"(SELECT {projection} FROM {table} WHERE {qpk} >= %s ORDER BY {qpk} LIMIT {per_seek})"
+                     for _ in starts]
+            cursor.execute(' UNION ALL '.join(parts), starts)
+            fetched = cursor.fetchall()
+
+        rows, seen = [], set()
+        for row in fetched:
+            key = row.get(pk)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(row)
+        if len(rows) > limit:
+            rows = random.sample(rows, limit)
+        return rows
+
+    def _sample_reservoir(self, conn, table: str, projection: str, limit: int) -> List[Dict[str, Any]]:
+        sql = (f"SELECT /*+ MAX_EXECUTION_TIME({self.scan_timeout_ms}) */ {projection} "
+               f"FROM {table} LIMIT {self.scan_limit}")
+        # 非缓冲游标逐行读取，不在客户端缓存整个扫描结果
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor) if pymysql else conn.cursor()
+        reservoir: List[Dict[str, Any]] = []
+        with cursor:
+            cursor.execute(sql)
+            seen = 0
+            while True:
+                row = cursor.fetchone()
+                if row is None:
+                    break
+                seen += 1
+                if len(reservoir) < limit:
+                    reservoir.append(row)
+                else:
+                    j = random.randrange(seen)
+                    if j < limit:
+                        reservoir[j] = row
+        return reservoir
+
+
+# 全局实例
+table_sampler = TableSampler()
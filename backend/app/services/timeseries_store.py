@@ -0,0 +1,269 @@
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class _RingSeries:
+    """原始样本环形缓冲：两个定长 double 数组（时间戳、值），写满后覆盖最旧样本"""
+
+    __slots__ = ('capacity', 'ts', 'values', 'head', 'count')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0  # 下一个写入位置
+        self.count = 0
+
+    def last_ts(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return self.ts[(self.head - 1) % self.capacity]
+
+    def oldest_ts(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return self.ts[(self.head - self.count) % self.capacity]
+
+    def append(self, ts: float, value: float):
+        self.ts[self.head] = ts
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def window(self, since: float) -> Tuple[List[float], List[float]]:
+        """按时间顺序返回 ts >= since 的样本"""
+        xs: List[float] = []
+        ys: List[float] = []
+        start = self.head - self.count
+        for i in range(start, self.head):
+            idx = i % self.capacity
+            if self.ts[idx] >= since:
+                xs.append(self.ts[idx])
+                ys.append(self.values[idx])
+        return xs, ys
+
+
+class _RollupSeries:
+    """固定分辨率的聚合环形缓冲：每个桶保存 count/sum/min/max"""
+
+    __slots__ = ('resolution', 'capacity', 'start', 'count', 'sum', 'min', 'max', 'head', 'size')
+
+    def __init__(self, resolution: int, capacity: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        zeros = bytes(8 * capacity)
+        self.start = array('d', zeros)
+        self.count = array('d', zeros)
+        self.sum = array('d', zeros)
+        self.min = array('d', zeros)
+        self.max = array('d', zeros)
+        self.head = 0
+        self.size = 0
+
+    def covers(self, since: float, now: float) -> bool:
+        return now - since <= self.resolution * self.capacity
+
+    def add(self, ts: float, value: float):
+        bucket = ts // self.resolution * self.resolution
+        cur = (self.head - 1) % self.capacity
+        if self.size and self.start[cur] == bucket:
+            self.count[cur] += 1
+            self.sum[cur] += value
+            if value < self.min[cur]:
+                self.min[cur] = value
+            if value > self.max[cur]:
+                self.max[cur] = value
+            return
+        if self.size and bucket < self.start[cur]:
+            return  # 乱序的旧样本直接丢弃
+        i = self.head
+        self.start[i] = bucket
+        self.count[i] = 1
+        self.sum[i] = value
+        self.min[i] = value
+        self.max[i] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def window(self, since: float) -> List[Tuple[float, float, float, float, float]]:
+        """返回 (bucket_start, count, sum, min, max)，按时间顺序"""
+        rows = []
+        for i in range(self.head - self.size, self.head):
+            idx = i % self.capacity
+            if self.start[idx] + self.resolution > since:
+                rows.append((self.start[idx], self.count[idx], self.sum[idx], self.min[idx], self.max[idx]))
+        return rows
+
+
+class _Series:
+    __slots__ = ('raw', 'rollups', 'lock')
+
+    def __init__(self, raw_capacity: int, rollups: Sequence[Tuple[int, int]]):
+        self.raw = _RingSeries(raw_capacity)
+        self.rollups = [_RollupSeries(res, cap) for res, cap in rollups]
+        self.lock = threading.Lock()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    if lo == hi:
+        return sorted_values[int(k)]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class TimeSeriesStore:
+    """进程内时间序列存储：按 (scope, metric) 保存定长原始样本环 + 1m/5m/1h 聚合环。
+
+    scope 形如 'instance:3'（监控探测结果）或 'service:mysqld'（Prometheus 采样）；
+    内存占用固定，重启后历史丢失。
+    """
+
+    def __init__(self):
+        self.raw_capacity = int(os.getenv('TIMESERIES_RAW_CAPACITY', '2880'))
+        # (分辨率秒, 桶数)：1 分钟 × 1 天、5 分钟 × 7 天、1 小时 × 30 天
+        self.rollup_specs = [
+            (60, int(os.getenv('TIMESERIES_ROLLUP_1M_BUCKETS', '1440'))),
+            (300, int(os.getenv('TIMESERIES_ROLLUP_5M_BUCKETS', '2016'))),
+            (3600, int(os.getenv('TIMESERIES_ROLLUP_1H_BUCKETS', '720'))),
+        ]
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    # ---------- 写入 ----------
+    def _get_series(self, scope: str, metric: str, create: bool = False) -> Optional[_Series]:
+        key = (scope, metric)
+        series = self._series.get(key)
+        if series is None and create:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = _Series(self.raw_capacity, self.rollup_specs)
+                    self._series[key] = series
+        return series
+
+    def record(self, scope: str, metric: str, value: Optional[float], ts: Optional[float] = None):
+        """追加一个样本；时间戳不晚于上一个样本的重复样本会被忽略"""
+        if value is None:
+            return
+        value = float(value)
+        if math.isnan(value):
+            return
+        ts = time.time() if ts is None else float(ts)
+        series = self._get_series(scope, metric, create=True)
+        with series.lock:
+            last = series.raw.last_ts()
+            if last is not None and ts <= last:
+                return
+            series.raw.append(ts, value)
+            for rollup in series.rollups:
+                rollup.add(ts, value)
+
+    def drop_scope(self, scope: str):
+        """实例删除后释放其全部序列"""
+        with self._lock:
+            for key in [k for k in self._series if k[0] == scope]:
+                del self._series[key]
+
+    # ---------- 查询 ----------
+    def _pick_rollup(self, series: _Series, since: float, now: float) -> Optional[_RollupSeries]:
+        for rollup in series.rollups:
+            if rollup.covers(since, now):
+                return rollup
+        return series.rollups[-1] if series.rollups else None
+
+    def summary(self, scope: str, metric: str, window: float) -> Optional[Dict[str, Optional[float]]]:
+        """窗口内的 count/avg/min/max；原始样本不足以覆盖窗口时改用聚合桶"""
+        series = self._get_series(scope, metric)
+        if series is None:
+            return None
+        now = time.time()
+        since = now - window
+        with series.lock:
+            oldest = series.raw.oldest_ts()
+            if oldest is not None and (oldest <= since or series.raw.count < series.raw.capacity):
+                _, ys = series.raw.window(since)
+                if not ys:
+                    return {'count': 0, 'avg': None, 'min': None, 'max': None}
+                return {'count': len(ys), 'avg': sum(ys) / len(ys), 'min': min(ys), 'max': max(ys)}
+            rollup = self._pick_rollup(series, since, now)
+            rows = rollup.window(since) if rollup else []
+        count = sum(r[1] for r in rows)
+        if not count:
+            return {'count': 0, 'avg': None, 'min': None, 'max': None}
+        return {
+            'count': int(count),
+            'avg': sum(r[2] for r in rows) / count,
+            'min': min(r[3] for r in rows),
+            'max': max(r[4] for r in rows),
+        }
+
+    def availability(self, scope: str, window: float) -> Optional[float]:
+        """'up' 序列（1=可用，0=不可用）在窗口内的可用率百分比"""
+        stats = self.summary(scope, 'up', window)
+        if not stats or stats['avg'] is None:
+            return None
+        return round(stats['avg'] * 100, 3)
+
+    def percentiles(self, scope: str, metric: str, window: float,
+                    pcts: Sequence[float] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+        """窗口内原始样本的分位数（只在原始样本保留范围内精确）"""
+        series = self._get_series(scope, metric)
+        if series is None:
+            return {f'p{int(p)}': None for p in pcts}
+        with series.lock:
+            _, ys = series.raw.window(time.time() - window)
+        ys.sort()
+        return {f'p{int(p)}': _percentile(ys, p) for p in pcts}
+
+    def history(self, scope: str, metric: str, window: float,
+                resolution: Optional[int] = None) -> Dict[str, object]:
+        """列式历史数据；resolution 为 None/0 且原始样本覆盖窗口时返回原始点，否则返回聚合桶"""
+        series = self._get_series(scope, metric)
+        empty = {'resolution': resolution or 0, 'timestamps': [], 'values': []}
+        if series is None:
+            return empty
+        now = time.time()
+        since = now - window
+        with series.lock:
+            oldest = series.raw.oldest_ts()
+            raw_covers = oldest is not None and (oldest <= since or series.raw.count < series.raw.capacity)
+            if not resolution and raw_covers:
+                xs, ys = series.raw.window(since)
+                return {'resolution': 0, 'timestamps': [int(x) for x in xs], 'values': [round(y, 4) for y in ys]}
+            rollup = None
+            if resolution:
+                rollup = next((r for r in series.rollups if r.resolution == resolution), None)
+            if rollup is None:
+                rollup = self._pick_rollup(series, since, now)
+            if rollup is None:
+                return empty
+            rows = rollup.window(since)
+        return {
+            'resolution': rollup.resolution,
+            'timestamps': [int(r[0]) for r in rows],
+            'values': [round(r[2] / r[1], 4) for r in rows],
+            'min': [r[3] for r in rows],
+            'max': [r[4] for r in rows],
+        }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'raw_capacity': self.raw_capacity,
+                'rollups': [res for res, _ in self.rollup_specs],
+            }
+
+
+# 全局实例
+timeseries_store = TimeSeriesStore()
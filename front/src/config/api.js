@@ -17,6 +17,8 @@ export const API_ENDPOINTS = {
   // 新增：慢日志列表（GET）
   SLOWLOG_LIST: (id) => `/api/instances/${id}/slowlog`,
   METRICS: `/api/metrics`,
+  // 后台分析任务状态与结果（GET）
+  JOB_DETAIL: (jobId) => `/api/jobs/${jobId}`,
 };
 
 export default API_BASE_URL;
\ No newline at end of file
@@ -28,7 +28,8 @@ export const useInstanceStatus = () => {
 
   // 获取运行中实例数量
   const getRunningCount = useCallback(() => {
-    return instances.filter(instance => instance.status === 'running').length;
+    // degraded（响应变慢）仍在运行
+    return instances.filter(instance => instance.status === 'running' || instance.status === 'degraded').length;
   }, [instances]);
 
   // 获取异常实例数量
@@ -138,7 +139,7 @@ export const useInstanceStatus = () => {
   // 检查实例是否在线
   const isInstanceOnline = useCallback((instanceId) => {
     const instance = getInstance(instanceId);
-    return instance?.status === 'running';
+    return instance?.status === 'running' || instance?.status === 'degraded';
   }, [getInstance]);
 
   // 检查实例是否正在监控
@@ -63,7 +63,8 @@ export const useInstances = () => {
 
   // 获取运行中实例数量
   const getRunningCount = useCallback(() => {
-    return instances.filter(instance => instance.status === 'running').length;
+    // degraded（响应变慢）仍在运行
+    return instances.filter(instance => instance.status === 'running' || instance.status === 'degraded').length;
   }, [instances]);
 
   // 获取异常实例数量
@@ -3,6 +3,7 @@ import { Card, Select, Button, Space, Descriptions, Tag, Table, message, Divider
 import { DatabaseOutlined } from '@ant-design/icons';
 import API_BASE_URL, { API_ENDPOINTS } from '../config/api';
 import { useInstances } from '../hooks/useInstances';
+import { runAnalysisJob, JOB_STAGE_LABELS } from '../services/jobService';
 
 const statusColor = (level) => {
   switch (level) {
@@ -71,6 +72,7 @@ const renderStatusTag = (val) => {
 const ArchitectureOptimization = () => {
   const [selectedInstance, setSelectedInstance] = useState('');
   const [isAnalyzing, setIsAnalyzing] = useState(false);
+  const [analyzeStage, setAnalyzeStage] = useState(null);
   const [overview, setOverview] = useState(null);
   const [replication, setReplication] = useState(null);
   const [riskItems, setRiskItems] = useState([]);
@@ -100,26 +102,16 @@ const ArchitectureOptimization = () => {
     }
     setIsAnalyzing(true);
     try {
-      const response = await fetch(API_ENDPOINTS.ARCH_ANALYZE(selectedInstance), {
+      const { ok, status, data } = await runAnalysisJob(API_ENDPOINTS.ARCH_ANALYZE(selectedInstance), {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-      });
-      if (!response.ok) {
-        let errMsg = `HTTP ${response.status}`;
-        try {
-          const errBody = await response.json();
-          if (errBody && errBody.error) errMsg = errBody.error;
-        } catch (_) {
-          try {
-            const txt = await response.text();
-            if (txt) errMsg = txt;
-          } catch (__) {}
-        }
+      }, setAnalyzeStage);
+      if (!ok) {
+        const errMsg = (data && data.error) || `HTTP ${status}`;
         console.error('架构分析接口错误:', errMsg);
         message.error(`架构检查失败：${errMsg}`);
         return;
       }
-      const data = await response.json();
       const risks = Array.isArray(data.risks) ? data.risks.map((r, idx) => ({ key: r.key || `${r.item || 'risk'}_${idx}`, ...r })) : [];
       setOverview(data.overview || null);
       setReplication(data.replication || null);
@@ -149,6 +141,7 @@ const ArchitectureOptimization = () => {
       message.error('架构检查失败，请检查后端服务');
     } finally {
       setIsAnalyzing(false);
+      setAnalyzeStage(null);
     }
   };
 
@@ -212,7 +205,7 @@ const ArchitectureOptimization = () => {
             options={instanceOptions}
           />
           <Button type="primary" loading={isAnalyzing} onClick={handleAnalyze}>
-            {isAnalyzing ? '分析中...' : '开始架构检查'}
+            {isAnalyzing ? (JOB_STAGE_LABELS[analyzeStage] || '分析中...') : '开始架构检查'}
           </Button>
         </Space>
       </Card>
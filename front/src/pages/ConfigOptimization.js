@@ -10,12 +10,14 @@ import {
 } from '@ant-design/icons';
 import API_BASE_URL, { API_ENDPOINTS } from '../config/api';
 import { useInstances } from '../hooks/useInstances';
+import { runAnalysisJob, JOB_STAGE_LABELS } from '../services/jobService';
 
 const { Option } = Select;
 
 const ConfigOptimization = () => {
   const [selectedInstance, setSelectedInstance] = useState('');
   const [isAnalyzing, setIsAnalyzing] = useState(false);
+  const [analyzeStage, setAnalyzeStage] = useState(null);
   const [configData, setConfigData] = useState(null);
   const [slowData, setSlowData] = useState(null);
   const [isSlowAnalyzing, setIsSlowAnalyzing] = useState(false);
@@ -68,17 +70,14 @@ const ConfigOptimization = () => {
 
     setIsAnalyzing(true);
     try {
-      const resp = await fetch(API_ENDPOINTS.CONFIG_ANALYZE(selectedInstance), {
+      const { ok, data } = await runAnalysisJob(API_ENDPOINTS.CONFIG_ANALYZE(selectedInstance), {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({})
-      });
-      if (!resp.ok) {
-        let err = '分析接口返回错误';
-        try { const j = await resp.json(); err = j.error || err; } catch {}
-        throw new Error(err);
+      }, setAnalyzeStage);
+      if (!ok) {
+        throw new Error(data.error || '分析接口返回错误');
       }
-      const data = await resp.json();
       if (!data || !data.basicInfo) {
         throw new Error('接口返回数据不完整');
       }
@@ -109,6 +108,7 @@ const ConfigOptimization = () => {
       message.error(`配置分析失败：${e.message}`);
     } finally {
       setIsAnalyzing(false);
+      setAnalyzeStage(null);
     }
   };
 
@@ -365,7 +365,7 @@ const ConfigOptimization = () => {
               loading={isAnalyzing}
               disabled={!selectedInstance}
             >
-              {isAnalyzing ? '分析中...' : '开始分析'}
+              {isAnalyzing ? (JOB_STAGE_LABELS[analyzeStage] || '分析中...') : '开始分析'}
             </Button>
             {configData && (
               <Button
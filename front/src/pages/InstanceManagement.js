@@ -118,6 +118,7 @@ const InstanceManagement = () => {
   const getStatusTag = (status, isRealtime = false) => {
     const statusMap = {
       running: { color: 'success', text: '运行中' },
+      degraded: { color: 'warning', text: '响应变慢' },
       error: { color: 'error', text: '异常' }
     };
     // 确保status有值，如果为undefined/null则使用'error'
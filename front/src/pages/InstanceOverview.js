@@ -150,7 +150,7 @@ const InstanceOverview = () => {
   // 更新统计数据
   const updateStatsData = (instances) => {
     const totalCount = instances.length;
-    const runningCount = instances.filter(item => item.status === 'running').length;
+    const runningCount = instances.filter(item => item.status === 'running' || item.status === 'degraded').length;
     const errorCount = instances.filter(item => item.status === 'error').length;
 
     setStatsData(prevStats => prevStats.map((stat, index) => {
@@ -211,6 +211,7 @@ const InstanceOverview = () => {
   const getStatusTag = (status) => {
     const statusMap = {
       running: { color: 'success', text: '运行中' },
+      degraded: { color: 'warning', text: '响应变慢' },
       error: { color: 'error', text: '异常' }
     };
     // 确保status有值，如果为undefined/null则使用'error'
@@ -7,6 +7,7 @@ import {
 } from '@ant-design/icons';
 import { API_ENDPOINTS } from '../config/api';
 import { useInstances } from '../hooks/useInstances';
+import { runAnalysisJob, JOB_STAGE_LABELS } from '../services/jobService';
 
 const { TextArea } = Input;
 const { Option } = Select;
@@ -72,6 +73,7 @@ const SQLOptimization = () => {
   const [sqlQuery, setSqlQuery] = useState('');
   const [optimizationResults, setOptimizationResults] = useState(null);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
+  const [analyzeStage, setAnalyzeStage] = useState(null);
 
   // 使用实例管理Hook
   const { instanceOptions, loading: loadingInstances } = useInstances();
@@ -145,18 +147,16 @@ const SQLOptimization = () => {
         database: selectedDatabase
       };
 
-      const resp = await fetch(API_ENDPOINTS.SQL_ANALYZE, {
+      const { ok, data } = await runAnalysisJob(API_ENDPOINTS.SQL_ANALYZE, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
-      });
+      }, setAnalyzeStage);
       
-      if (!resp.ok) {
-        const errorData = await resp.json();
-        throw new Error(errorData.error || '分析接口返回错误');
+      if (!ok) {
+        throw new Error(data.error || '分析接口返回错误');
       }
       
-      const data = await resp.json();
       const rewritten = data?.rewrittenSql || null;
       const analysis = data?.analysis || null;
       
@@ -171,6 +171,7 @@ const SQLOptimization = () => {
       message.error(`分析失败：${e.message}`);
     } finally {
       setIsAnalyzing(false);
+      setAnalyzeStage(null);
     }
   };
 
@@ -261,7 +262,7 @@ const SQLOptimization = () => {
           {/* 操作按钮 */}
           <div style={{ display: 'flex', gap: 12 }}>
             <Button type="primary" onClick={handleAnalyze} loading={isAnalyzing}>
-              开始分析
+              {isAnalyzing ? (JOB_STAGE_LABELS[analyzeStage] || '分析中...') : '开始分析'}
             </Button>
             <Button onClick={handleReset} disabled={isAnalyzing}>重置</Button>
           </div>
@@ -0,0 +1,58 @@
+import { API_ENDPOINTS } from '../config/api';
+
+const POLL_INTERVAL_MS = 1500;
+
+// 与后端 job_manager.STAGES 对应
+export const JOB_STAGE_LABELS = {
+  queued: '排队中',
+  collecting: '收集信息',
+  explaining: '获取执行计划',
+  llm: '模型分析中',
+  done: '已完成',
+  failed: '失败',
+};
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const withAsync = (url) => `${url}${url.includes('?') ? '&' : '?'}async=1`;
+
+const readJson = async (resp) => {
+  try {
+    return await resp.json();
+  } catch {
+    return {};
+  }
+};
+
+/**
+ * 以后台任务方式调用分析接口（?async=1），轮询 /api/jobs/<id> 直到完成，
+ * 请求不会在 LLM 调用期间一直挂起。onStage(stage, message) 在阶段变化时调用。
+ * 返回 { ok, status, data }，data 与同步接口的响应体相同。
+ */
+export async function runAnalysisJob(url, options = {}, onStage) {
+  const resp = await fetch(withAsync(url), options);
+  const body = await readJson(resp);
+  if (resp.status !== 202 || !body.jobId) {
+    // 未进入任务队列（参数错误、队列已满等），按同步响应处理
+    return { ok: resp.ok, status: resp.status, data: body };
+  }
+
+  let stage = body.stage;
+  if (onStage) onStage(stage);
+  for (;;) {
+    await sleep(POLL_INTERVAL_MS);
+    const jresp = await fetch(API_ENDPOINTS.JOB_DETAIL(body.jobId));
+    const job = await readJson(jresp);
+    if (!jresp.ok) {
+      throw new Error(job.error || `查询任务状态失败（HTTP ${jresp.status}）`);
+    }
+    if (job.stage !== stage) {
+      stage = job.stage;
+      if (onStage) onStage(stage, job.message);
+    }
+    if (stage === 'done' || stage === 'failed') {
+      const status = job.statusCode || 500;
+      return { ok: status < 400, status, data: job.result || {} };
+    }
+  }
+}